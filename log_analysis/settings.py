@@ -133,3 +133,37 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Log ingestion
+LOG_INGEST_CHUNK_SIZE = int(os.environ.get('LOG_INGEST_CHUNK_SIZE', 1000))
+# Processes used to parse large files; 1 parses on the ingesting thread
+LOG_INGEST_WORKERS = int(os.environ.get('LOG_INGEST_WORKERS', 1))
+# Seconds without progress after which a processing upload's worker is taken
+# for dead and the job is queued again
+LOG_INGEST_JOB_TIMEOUT = int(os.environ.get('LOG_INGEST_JOB_TIMEOUT', 600))
+# Hits of one pattern on one source within this many seconds share an alert
+LOG_ALERT_BUCKET_SECONDS = int(os.environ.get('LOG_ALERT_BUCKET_SECONDS', 3600))
+# Time every ingestion stage and threat rule; served by /metrics/
+LOG_METRICS_ENABLED = os.environ.get('LOG_METRICS_ENABLED', 'False') == 'True'
+# Time the rules one by one on one line in this many
+LOG_METRICS_RULE_SAMPLE = int(os.environ.get('LOG_METRICS_RULE_SAMPLE', 100))
+# Days of lines purge_logs keeps for sources without their own retention; unset keeps them all
+LOG_RETENTION_DAYS = int(os.environ['LOG_RETENTION_DAYS']) if os.environ.get('LOG_RETENTION_DAYS') else None
+# Where purge_logs archives the lines it deletes
+LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', BASE_DIR / 'archives')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'logs': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOGS_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
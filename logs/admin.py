@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import LogSource, LogEntry, ThreatPattern, Alert
+from .models import LogSource, LogEntry, ThreatPattern, Alert, IngestJob
+from .utils.search import filter_entries
+from .utils.triage import set_resolved
 
 @admin.register(LogSource)
 class LogSourceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'source_type', 'is_active', 'created_at')
+    list_display = ('name', 'source_type', 'retention_days', 'is_active', 'created_at')
     list_filter = ('source_type', 'is_active', 'created_at')
     search_fields = ('name', 'description')
     list_editable = ('is_active',)
@@ -13,11 +15,15 @@ class LogSourceAdmin(admin.ModelAdmin):
 class LogEntryAdmin(admin.ModelAdmin):
     list_display = ('timestamp', 'source', 'severity', 'created_at')
     list_filter = ('severity', 'source', 'timestamp', 'created_at')
-    search_fields = ('raw_message', 'parsed_data')
+    search_fields = ('raw_message',)
     readonly_fields = ('created_at',)
     ordering = ('-timestamp',)
     date_hierarchy = 'timestamp'
 
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of LIKE '%term%' over every line
+        return filter_entries(queryset, search_term), False
+
 @admin.register(ThreatPattern)
 class ThreatPatternAdmin(admin.ModelAdmin):
     list_display = ('name', 'severity', 'is_active', 'created_at')
@@ -28,19 +34,27 @@ class ThreatPatternAdmin(admin.ModelAdmin):
 
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
-    list_display = ('pattern', 'log_entry', 'is_resolved', 'created_at')
-    list_filter = ('is_resolved', 'pattern', 'created_at')
+    list_display = ('pattern', 'source', 'hit_count', 'last_seen', 'is_resolved', 'created_at')
+    list_filter = ('is_resolved', 'pattern', 'source', 'created_at')
     search_fields = ('description', 'pattern__name')
     readonly_fields = ('created_at', 'resolved_at')
     ordering = ('-created_at',)
     actions = ['mark_as_resolved', 'mark_as_unresolved']
 
     def mark_as_resolved(self, request, queryset):
-        updated = queryset.update(is_resolved=True)
+        updated = set_resolved(queryset, True, request.user)
         self.message_user(request, f"{updated} alerts marked as resolved.")
     mark_as_resolved.short_description = "Mark selected alerts as resolved"
 
     def mark_as_unresolved(self, request, queryset):
-        updated = queryset.update(is_resolved=False)
+        updated = set_resolved(queryset, False)
         self.message_user(request, f"{updated} alerts marked as unresolved.")
     mark_as_unresolved.short_description = "Mark selected alerts as unresolved"
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'source', 'status', 'lines_done', 'alerts_found', 'created_at')
+    list_filter = ('status', 'source', 'created_at')
+    search_fields = ('original_name', 'error')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
@@ -0,0 +1,374 @@
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from logs.models import LogSource
+from logs.utils.ingest import LogIngestor
+from logs.utils.log_parser import LogParser
+from logs.utils.patterns import THREAT_PATTERNS, LOG_FORMATS
+from logs.utils.threats import ThreatMatcher
+from logs.utils.timestamps import TimestampParser
+
+SAMPLE_MESSAGES = [
+    'User admin logged in successfully from 192.168.1.100',
+    'Failed login attempt for user johndoe from 192.168.1.101',
+    'Multiple failed login attempts for user jsmith from 192.168.1.102',
+    'User dr_jones accessed patient record #P-12345 (John Doe)',
+    'Bulk data export initiated by user admin - 500 records',
+    'Scheduled backup completed in 42 seconds',
+    'GET /api/v1/appointments?page=2 returned 200 in 35ms',
+    'Session expired for user nurse_sarah',
+    'Cache warmed with 1200 keys',
+    "Query failed: SELECT * FROM users WHERE name = '' OR 1=1",
+]
+
+SAMPLE_LINES = {
+    'standard': [
+        f'2023-09-06 08:{index:02d}:25 - INFO - {message}'
+        for index, message in enumerate(SAMPLE_MESSAGES)
+    ],
+    'syslog': [
+        f'Sep 06 08:{index:02d}:25 webhost {message}'
+        for index, message in enumerate(SAMPLE_MESSAGES)
+    ],
+    'json_log': [
+        json.dumps({'timestamp': f'2023-09-06T08:{index:02d}:25', 'level': 'info', 'message': message})
+        for index, message in enumerate(SAMPLE_MESSAGES)
+    ],
+}
+
+
+# Messages for the synthetic corpora; none of BENIGN_MESSAGES match a threat
+# pattern and every THREAT_MESSAGES entry matches at least one
+BENIGN_MESSAGES = [
+    'User admin logged in successfully from 192.168.1.100',
+    'Scheduled backup completed in 42 seconds',
+    'GET /api/v1/appointments?page=2 returned 200 in 35ms',
+    'Session expired for user nurse_sarah',
+    'Cache warmed with 1200 keys',
+    'Appointment 88123 rescheduled by front desk',
+    'Health check passed for service billing',
+]
+THREAT_MESSAGES = [
+    'Failed login attempt for user johndoe from 192.168.1.101',
+    'User dr_jones accessed patient record #P-12345 (John Doe)',
+    'Bulk data export initiated by user admin - 500 records',
+    "Query failed: SELECT * FROM users WHERE name = '' OR 1=1",
+    'sudo command executed by user backup: iptables -F',
+]
+BENIGN_PATHS = ['/', '/api/v1/appointments?page=2', '/static/app.css', '/login', '/api/v1/health']
+THREAT_PATHS = [
+    '/../../etc/passwd', '/admin/users', '/search?q=1+union+select+password+from+users',
+    '/api/v1/records/export?format=csv', '/wp-content/config.php',
+]
+LEVELS = ['INFO', 'INFO', 'INFO', 'WARNING', 'ERROR', 'DEBUG']
+HOSTS = ['webhost', 'dbhost', 'ehr-app1', 'ehr-app2']
+AGENTS = ['Mozilla/5.0 (X11; Linux x86_64)', 'curl/8.4.0', 'python-requests/2.31']
+# A Wednesday morning, so the time-based rules stay quiet
+CORPUS_START = datetime(2023, 9, 6, 8, 0, 0)
+
+
+def generate_lines(log_format, count, threat_density=0.05, seed=0):
+    """Return ``count`` synthetic lines of ``log_format``.
+
+    About ``threat_density`` of the lines carry a message (or, for the
+    Apache formats, a request path) that matches a threat pattern. The
+    corpus spans business hours of one weekday and is reproducible for a
+    given ``seed``.
+    """
+    rng = random.Random(seed)
+    step = 36000 / max(count, 1)
+    lines = []
+    for index in range(count):
+        timestamp = CORPUS_START + timedelta(seconds=int(index * step))
+        threat = rng.random() < threat_density
+        address = f'10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+        if log_format in ('apache_common', 'apache_combined'):
+            path = rng.choice(THREAT_PATHS if threat else BENIGN_PATHS)
+            line = (
+                f'{address} - {rng.choice(["-", "admin", "jsmith"])} '
+                f'[{timestamp:%d/%b/%Y:%H:%M:%S} +0000] "{rng.choice(["GET", "GET", "POST"])} {path} HTTP/1.1" '
+                f'{rng.choice([200, 200, 200, 302, 404, 500])} {rng.randrange(100, 50000)}'
+            )
+            if log_format == 'apache_combined':
+                line += f' "https://ehr.example.org/" "{rng.choice(AGENTS)}"'
+        else:
+            message = rng.choice(THREAT_MESSAGES if threat else BENIGN_MESSAGES)
+            level = rng.choice(LEVELS)
+            if log_format == 'standard':
+                line = f'{timestamp:%Y-%m-%d %H:%M:%S} - {level} - {message}'
+            elif log_format == 'syslog':
+                line = f'{timestamp:%b %d %H:%M:%S} {rng.choice(HOSTS)} {message}'
+            elif log_format == 'json_log':
+                line = json.dumps({'timestamp': timestamp.isoformat(), 'level': level.lower(), 'message': message})
+            else:
+                raise ValueError(f"Unknown log format: {log_format}")
+        lines.append(line)
+    return lines
+
+
+def legacy_parse_line(parser, line):
+    """The ``re.match`` loop over raw ``LOG_FORMATS`` strings the format dispatcher replaced."""
+    line = line.strip()
+    if not line:
+        return None
+    for pattern, handler in (
+        (LOG_FORMATS['standard'], parser.parse_standard_format),
+        (LOG_FORMATS['syslog'], parser.parse_syslog_format),
+        (LOG_FORMATS['json_log'], parser.parse_json_format),
+    ):
+        match = re.match(pattern, line)
+        if match:
+            return handler(match, line)
+    return parser.parse_unknown_format(line)
+
+
+def legacy_parse_timestamp(text):
+    """The ``strptime`` plus ``make_aware`` call each parse method used to make."""
+    return timezone.make_aware(datetime.strptime(text, '%Y-%m-%d %H:%M:%S'))
+
+
+def legacy_detect_threats(message):
+    """The per-pattern ``re.search`` loop ThreatMatcher replaced."""
+    threats = []
+    for pattern_name, pattern_data in THREAT_PATTERNS.items():
+        if re.search(pattern_data['pattern'], message, re.IGNORECASE):
+            threats.append({
+                'pattern': pattern_name,
+                'severity': pattern_data['severity'],
+                'description': pattern_data['description']
+            })
+    return threats
+
+
+def time_per_line(func, lines, repeat):
+    """Return the best wall-clock time of ``repeat`` runs of ``func`` over ``lines``."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def latency_p99(func, lines):
+    """Return the 99th percentile of the per-call time of ``func``, in microseconds."""
+    samples = []
+    clock = time.perf_counter_ns
+    for line in lines:
+        started = clock()
+        func(line)
+        samples.append(clock() - started)
+    samples.sort()
+    return samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000 if samples else 0.0
+
+
+def peak_memory(func, *args):
+    """Return the peak bytes traced by ``tracemalloc`` while ``func(*args)`` runs."""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def result(name, lines, seconds, **extra):
+    return {
+        'name': name,
+        'lines': lines,
+        'seconds': seconds,
+        'lines_per_second': lines / seconds if seconds else 0.0,
+        **extra,
+    }
+
+
+def measure(name, func, lines, repeat):
+    """Time ``func`` over ``lines``, then measure its p99 latency and peak memory."""
+    return result(
+        name, len(lines), time_per_line(func, lines, repeat),
+        p99_us=latency_p99(func, lines),
+        peak_memory_bytes=peak_memory(lambda: [func(line) for line in lines]),
+    )
+
+
+@contextmanager
+def benchmark_database():
+    """Run the block against a throwaway on-disk SQLite test database."""
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_name = connection.settings_dict['NAME']
+    old_test_name = test_settings.get('NAME')
+    with tempfile.TemporaryDirectory() as directory:
+        test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+
+
+def bench_parse(options):
+    results = []
+    for log_format in options['formats']:
+        corpus = generate_lines(log_format, options['lines'], options['density'], options['seed'])
+        parser = LogParser()
+        results.append(measure(f'parse_line {log_format}', parser.parse_line, corpus, options['repeat']))
+    return results
+
+
+def bench_detect(options):
+    results = []
+    for log_format in options['formats']:
+        parser = LogParser()
+        corpus = generate_lines(log_format, options['lines'], options['density'], options['seed'])
+        parsed = [data for data in map(parser.parse_line, corpus) if data]
+        results.append(measure(f'detect_threats {log_format}', parser.detect_threats, parsed, options['repeat']))
+    return results
+
+
+def bench_ingest(options):
+    """Ingest each corpus from a file the way an upload job does, into a fresh database."""
+    results = []
+    def new_source():
+        # Every run writes new lines; a source that has them would skip them as duplicates
+        return LogSource.objects.create(name=f'benchmark {LogSource.objects.count()}', source_type='application')
+
+    with benchmark_database(), tempfile.TemporaryDirectory() as directory:
+        for log_format in options['formats']:
+            path = os.path.join(directory, f'{log_format}.log')
+            with open(path, 'w', encoding='utf-8') as log_file:
+                log_file.write('\n'.join(
+                    generate_lines(log_format, options['lines'], options['density'], options['seed'])
+                ))
+
+            best = None
+            for _ in range(options['repeat']):
+                ingestor = LogIngestor(new_source())
+                started = time.perf_counter()
+                ingestor.ingest_path(path)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            # Chunks are written whole, so a line waits for its chunk's latency
+            chunk_latencies = sorted(stats['seconds'] * 1e6 for stats in ingestor.chunk_stats)
+            results.append(result(
+                f'ingest {log_format}', ingestor.line_count, best,
+                alert_hits=ingestor.alert_count,
+                p99_chunk_us=chunk_latencies[min(len(chunk_latencies) - 1, int(len(chunk_latencies) * 0.99))]
+                if chunk_latencies else 0.0,
+                peak_memory_bytes=peak_memory(LogIngestor(new_source()).ingest_path, path),
+            ))
+    return results
+
+
+def bench_threats(options):
+    lines, repeat = options['lines'], options['repeat']
+    matcher = ThreatMatcher.from_patterns(THREAT_PATTERNS)
+    messages = list(itertools.islice(itertools.cycle(SAMPLE_MESSAGES), lines))
+    return [
+        result('threats: re.search loop', lines, time_per_line(legacy_detect_threats, messages, repeat)),
+        result('threats: ThreatMatcher', lines, time_per_line(matcher.match, messages, repeat)),
+    ]
+
+
+def bench_formats(options):
+    lines, repeat = options['lines'], options['repeat']
+    results = []
+    for name, samples in SAMPLE_LINES.items():
+        corpus = list(itertools.islice(itertools.cycle(samples), lines))
+        parser = LogParser()
+        results.append(result(f'parse {name}: re.match loop', lines,
+                              time_per_line(lambda line: legacy_parse_line(parser, line), corpus, repeat)))
+        results.append(result(f'parse {name}: dispatcher', lines,
+                              time_per_line(parser.parse_line, corpus, repeat)))
+    return results
+
+
+def bench_timestamps(options):
+    lines, repeat = options['lines'], options['repeat']
+    # Busy logs write several lines per second; spread the corpus over
+    # lines // 10 distinct seconds
+    timestamps = [
+        f'2023-09-06 {index // 36000 % 24:02d}:{index // 600 % 60:02d}:{index // 10 % 60:02d}'
+        for index in range(lines)
+    ]
+    return [
+        result('timestamps: strptime + make_aware', lines, time_per_line(legacy_parse_timestamp, timestamps, repeat)),
+        result('timestamps: TimestampParser', lines, time_per_line(TimestampParser().standard, timestamps, repeat)),
+    ]
+
+
+BENCHMARKS = {
+    'threats': bench_threats,
+    'formats': bench_formats,
+    'timestamps': bench_timestamps,
+    'parse': bench_parse,
+    'detect': bench_detect,
+    'ingest': bench_ingest,
+}
+CORPUS_FORMATS = ['standard', 'syslog', 'json_log', 'apache_common', 'apache_combined']
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks for log parsing, threat detection and end-to-end ingestion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', choices=[[]] + list(BENCHMARKS),
+                            help='Benchmarks to run (default: all)')
+        parser.add_argument('--lines', type=int, default=20000, help='Lines per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark; the best is reported')
+        parser.add_argument('--formats', nargs='+', choices=CORPUS_FORMATS, default=CORPUS_FORMATS,
+                            help='Formats of the synthetic corpora (default: all)')
+        parser.add_argument('--density', type=float, default=0.05,
+                            help='Fraction of synthetic lines that carry a threat')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic corpora')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+        parser.add_argument('--output', help='Also write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        results = []
+        for name in options['benchmarks'] or BENCHMARKS:
+            for row in BENCHMARKS[name](options):
+                results.append(row)
+                if not options['json']:
+                    self.stdout.write(self.format_row(row))
+
+        if options['json'] or options['output']:
+            report = json.dumps({
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'options': {key: options[key] for key in ('lines', 'repeat', 'formats', 'density', 'seed')},
+                'results': results,
+            }, indent=2)
+            if options['output']:
+                with open(options['output'], 'w', encoding='utf-8') as output:
+                    output.write(report + '\n')
+            if options['json']:
+                self.stdout.write(report)
+
+    def format_row(self, row):
+        line = f"{row['name']:<40} {row['lines_per_second']:>12,.0f} lines/s ({row['seconds']:.3f}s)"
+        if 'p99_us' in row:
+            line += f"  p99 {row['p99_us']:.1f}us"
+        if 'p99_chunk_us' in row:
+            line += f"  p99 chunk {row['p99_chunk_us'] / 1000:.1f}ms"
+        if 'peak_memory_bytes' in row:
+            line += f"  peak {row['peak_memory_bytes'] / 1024 / 1024:.1f}MiB"
+        return line
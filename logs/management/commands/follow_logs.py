@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from logs.models import LogSource
+from logs.utils.follow import LogFollower
+
+
+class Command(BaseCommand):
+    help = 'Tail the log_path of every active log source and ingest new lines as they are written'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to sleep when no file had new lines')
+        parser.add_argument('--batch-lines', type=int, default=1000,
+                            help='Write a batch once it holds this many lines')
+        parser.add_argument('--batch-seconds', type=float, default=1.0,
+                            help='Write a batch once its oldest line has waited this long')
+        parser.add_argument('--refresh', type=float, default=30.0,
+                            help='Seconds between checks for added, changed or deactivated sources')
+        parser.add_argument('--from-start', action='store_true',
+                            help='Read files without a checkpoint from the start instead of the end')
+        parser.add_argument('--once', action='store_true',
+                            help='Poll every file once, write what was read and exit')
+
+    def handle(self, *args, **options):
+        followers = {}
+        refreshed = None
+        try:
+            while True:
+                # Long-running loop: drop connections Django would close after a request
+                close_old_connections()
+                if refreshed is None or time.monotonic() - refreshed >= options['refresh']:
+                    self.refresh(followers, options)
+                    refreshed = time.monotonic()
+
+                lines = sum(follower.poll() for follower in followers.values())
+                if options['once']:
+                    return
+                if not lines:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for follower in followers.values():
+                follower.close()
+
+    def refresh(self, followers, options):
+        """Start following new sources and stop following removed or changed ones."""
+        wanted = dict(
+            LogSource.objects.filter(is_active=True).exclude(log_path='').values_list('id', 'log_path')
+        )
+        for source_id, follower in list(followers.items()):
+            path = wanted.get(source_id)
+            if path is None or os.path.abspath(path) != follower.path:
+                follower.close()
+                del followers[source_id]
+                self.stdout.write(f"Stopped following {follower.path}")
+        for source in LogSource.objects.filter(id__in=set(wanted) - set(followers)):
+            follower = LogFollower(source, source.log_path, options['batch_lines'],
+                                   options['batch_seconds'], options['from_start'])
+            followers[source.id] = follower
+            self.stdout.write(f"Following {follower.path} for {source.name}")
@@ -0,0 +1,81 @@
+import fnmatch
+import glob
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.models import LogSource
+from logs.utils.checkpoints import DEFAULT_BLOCK_SIZE, ingest_file
+from logs.utils.readers import DECOMPRESSION_ERRORS
+
+
+def expand_paths(patterns, name_pattern='*'):
+    """Return the files named by ``patterns`` (files, directories or globs) in a stable order.
+
+    Directories are walked recursively; files found that way are kept when
+    their name matches ``name_pattern``.
+    """
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for directory, subdirectories, files in os.walk(match):
+                    subdirectories.sort()
+                    paths.extend(
+                        os.path.join(directory, name)
+                        for name in sorted(files) if fnmatch.fnmatch(name, name_pattern)
+                    )
+            elif os.path.isfile(match):
+                paths.append(match)
+    # A file named by two patterns is ingested once
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+class Command(BaseCommand):
+    help = 'Ingest log files, directories or glob patterns, resuming each file from its checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files, directories or glob patterns (quote them)')
+        parser.add_argument('--source', required=True, help='Name of the LogSource to ingest into')
+        parser.add_argument('--name', default='*',
+                            help='Only take files matching this pattern from directories (default: all)')
+        parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                            help='Bytes of log written per transaction and checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore existing checkpoints and ingest every file from the start')
+
+    def handle(self, *args, **options):
+        try:
+            source = LogSource.objects.get(name=options['source'])
+        except LogSource.DoesNotExist:
+            raise CommandError(f"No log source named {options['source']!r}.")
+        except LogSource.MultipleObjectsReturned:
+            raise CommandError(f"Several log sources are named {options['source']!r}.")
+
+        paths = expand_paths(options['paths'], options['name'])
+        if not paths:
+            raise CommandError("No files matched.")
+
+        failed = 0
+        for path in paths:
+            try:
+                lines, alerts, start = ingest_file(source, path, options['block_size'], options['restart'])
+            except UnicodeDecodeError:
+                failed += 1
+                self.stderr.write(f"{path}: not UTF-8 text; stopped at the last checkpoint")
+                continue
+            except DECOMPRESSION_ERRORS as e:
+                failed += 1
+                self.stderr.write(f"{path}: truncated or corrupt archive ({e}); stopped at the last checkpoint")
+                continue
+
+            if start is None:
+                self.stdout.write(f"{path}: already ingested, skipped")
+            elif start:
+                self.stdout.write(f"{path}: {lines} lines, {alerts} alerts (resumed at byte {start})")
+            else:
+                self.stdout.write(f"{path}: {lines} lines, {alerts} alerts")
+
+        if failed:
+            raise CommandError(f"{failed} of {len(paths)} files failed.")
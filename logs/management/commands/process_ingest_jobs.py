@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from logs.utils.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued log uploads in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        while True:
+            # Long-running loop: drop connections Django would close after a request
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            job = run_job(job)
+            self.stdout.write(
+                f"Job {job.id} {job.status}: {job.lines_done} lines ({job.duplicates_skipped} duplicates), "
+                f"{job.alerts_found} alerts "
+                f"({job.lines_per_second:.0f} lines/s)"
+            )
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from logs.models import LogEntry, LogSource
+from logs.utils.retention import DEFAULT_BATCH_SIZE, purge_source, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = "Archive and delete log lines older than their source's retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Only purge the LogSource with this name')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Primary keys deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to wait between transactions')
+        parser.add_argument('--archive-dir', default=None,
+                            help='Directory for the gzip NDJSON archives (default: LOG_ARCHIVE_DIR)')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='Delete expired lines without archiving them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the lines that would be purged')
+
+    def handle(self, *args, **options):
+        sources = LogSource.objects.order_by('name')
+        if options['source']:
+            sources = sources.filter(name=options['source'])
+            if not sources:
+                raise CommandError(f"No log source named {options['source']!r}.")
+        archive_dir = None if options['no_archive'] else str(options['archive_dir'] or settings.LOG_ARCHIVE_DIR)
+
+        now = timezone.now()
+        for source in sources:
+            cutoff = retention_cutoff(source, now)
+            if cutoff is None:
+                continue
+            if options['dry_run']:
+                expired = LogEntry.objects.filter(source=source, timestamp__lt=cutoff).count()
+                self.stdout.write(f"{source.name}: {expired} lines older than {cutoff:%Y-%m-%d %H:%M} would be purged")
+                continue
+
+            counts = purge_source(source, cutoff, options['batch_size'], archive_dir, options['pause'])
+            message = (
+                f"{source.name}: purged {counts['entries']} lines and {counts['alerts']} alerts "
+                f"older than {cutoff:%Y-%m-%d %H:%M}"
+            )
+            if counts['archives']:
+                message += f", archived to {len(counts['archives'])} files in {archive_dir}"
+            self.stdout.write(message)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from logs.models import LogRollup
+from logs.utils.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the hourly log/alert rollup from the LogEntry and Alert tables'
+
+    def handle(self, *args, **options):
+        rebuild_rollups()
+        self.stdout.write(f"Rebuilt {LogRollup.objects.count()} rollup rows.")
@@ -0,0 +1,79 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.models import LogSource
+from logs.utils.syslog import SyslogReceiver
+
+
+class Command(BaseCommand):
+    help = (
+        'Receive syslog messages over UDP and TCP and ingest them for the log source of each sender address. '
+        'Messages are written through the full ingestion pipeline at several thousand per second; '
+        'bursts above that are queued, slow TCP senders down, or are dropped from UDP'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0', help='Address to listen on')
+        parser.add_argument('--udp-port', type=int, default=514, help='UDP port to listen on')
+        parser.add_argument('--tcp-port', type=int, default=514, help='TCP port to listen on')
+        parser.add_argument('--no-udp', action='store_true', help='Do not listen on UDP')
+        parser.add_argument('--no-tcp', action='store_true', help='Do not listen on TCP')
+        parser.add_argument('--queue-size', type=int, default=10000,
+                            help='Messages held between the listeners and the writer')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Write a batch once it holds this many messages')
+        parser.add_argument('--batch-seconds', type=float, default=0.5,
+                            help='Write a batch once its first message has waited this long')
+        parser.add_argument('--refresh', type=float, default=30.0,
+                            help='Seconds between reloads of the source addresses')
+        parser.add_argument('--drain-seconds', type=float, default=30.0,
+                            help='On stopping, seconds to read on from TCP senders before closing them')
+        parser.add_argument('--default-source',
+                            help='Name of the log source for senders no source has the address of')
+
+    def handle(self, *args, **options):
+        default_source = None
+        if options['default_source']:
+            try:
+                default_source = LogSource.objects.get(name=options['default_source'])
+            except LogSource.DoesNotExist:
+                raise CommandError(f"No log source named {options['default_source']}")
+        if options['no_udp'] and options['no_tcp']:
+            raise CommandError("Nothing to listen on with both --no-udp and --no-tcp")
+
+        receiver = SyslogReceiver(
+            host=options['host'],
+            udp_port=None if options['no_udp'] else options['udp_port'],
+            tcp_port=None if options['no_tcp'] else options['tcp_port'],
+            queue_size=options['queue_size'],
+            batch_size=options['batch_size'],
+            batch_seconds=options['batch_seconds'],
+            default_source=default_source,
+            refresh_seconds=options['refresh'],
+            drain_seconds=options['drain_seconds'],
+        )
+        try:
+            asyncio.run(self.serve(receiver))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            f"Received {receiver.received} messages, wrote {receiver.written}, "
+            f"dropped {receiver.dropped}, {receiver.unmatched} from unknown senders"
+        )
+
+    async def serve(self, receiver):
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping.set)
+
+        await receiver.start()
+        if receiver.udp_address:
+            self.stdout.write(f"Listening for syslog on udp {receiver.udp_address[0]}:{receiver.udp_address[1]}")
+        if receiver.tcp_address:
+            self.stdout.write(f"Listening for syslog on tcp {receiver.tcp_address[0]}:{receiver.tcp_address[1]}")
+        await stopping.wait()
+        # Write everything already queued before exiting
+        await receiver.stop()
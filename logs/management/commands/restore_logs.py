@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.models import LogSource
+from logs.utils.readers import DECOMPRESSION_ERRORS
+from logs.utils.retention import ARCHIVE_SUFFIX, restore_archive
+
+from .ingest_logs import expand_paths
+
+
+class Command(BaseCommand):
+    help = 'Ingest archives written by purge_logs back into a log source'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Archive files, directories or glob patterns (quote them)')
+        parser.add_argument('--source', required=True, help='Name of the LogSource to restore into')
+
+    def handle(self, *args, **options):
+        try:
+            source = LogSource.objects.get(name=options['source'])
+        except LogSource.DoesNotExist:
+            raise CommandError(f"No log source named {options['source']!r}.")
+        except LogSource.MultipleObjectsReturned:
+            raise CommandError(f"Several log sources are named {options['source']!r}.")
+
+        paths = expand_paths(options['paths'], f'*{ARCHIVE_SUFFIX}')
+        if not paths:
+            raise CommandError("No archives matched.")
+
+        for path in paths:
+            try:
+                lines, alerts = restore_archive(source, path)
+            except (ValueError, *DECOMPRESSION_ERRORS) as e:
+                # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+                raise CommandError(f"{path}: not a readable archive ({e}); earlier files were restored.")
+            self.stdout.write(f"{path}: restored {lines} lines, {alerts} alerts")
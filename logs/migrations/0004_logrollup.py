@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:08
+
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    LogEntry = apps.get_model('logs', 'LogEntry')
+    Alert = apps.get_model('logs', 'Alert')
+    LogRollup = apps.get_model('logs', 'LogRollup')
+
+    counts = defaultdict(lambda: [0, 0])
+    entries = (
+        LogEntry.objects.order_by()
+        .values('source_id', 'severity', hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .annotate(count=Count('id'))
+    )
+    for row in entries:
+        counts[(row['source_id'], row['severity'], row['hour'])][0] = row['count']
+    alerts = (
+        Alert.objects.filter(is_resolved=False).order_by()
+        .values('log_entry__source_id', 'log_entry__severity',
+                hour=TruncHour('log_entry__timestamp', tzinfo=dt_timezone.utc))
+        .annotate(count=Count('id'))
+    )
+    for row in alerts:
+        counts[(row['log_entry__source_id'], row['log_entry__severity'], row['hour'])][1] = row['count']
+
+    LogRollup.objects.bulk_create([
+        LogRollup(source_id=source_id, severity=severity, hour=hour,
+                  log_count=log_count, open_alert_count=open_alert_count)
+        for (source_id, severity, hour), (log_count, open_alert_count) in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_log_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('severity', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], max_length=10)),
+                ('hour', models.DateTimeField()),
+                ('log_count', models.BigIntegerField(default=0)),
+                ('open_alert_count', models.BigIntegerField(default=0)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logs.logsource')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='logrollup',
+            constraint=models.UniqueConstraint(fields=('source', 'severity', 'hour'), name='logs_rollup_unique'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+# The built-in THREAT_PATTERNS as they stood at this migration, as
+# (name, pattern, severity, description)
+THREAT_RULES = [
+    ('unauthorized_access', r'(failed login|invalid credential|access denied|authentication failure)', 'high',
+     'Possible unauthorized access attempt'),
+    ('phi_access', r'(patient record|medical history|phi|ephi|health information|medical record)', 'critical',
+     'Access to protected health information detected'),
+    ('data_export', r'(export|download|bulk data|mass retrieval|data dump)', 'medium',
+     'Large data export operation detected'),
+    ('config_change', r'(configuration change|settings modified|user added|permission changed|admin rights)', 'high',
+     'System configuration changes detected'),
+    ('multiple_failures', r'(multiple failed|repeated attempt|too many attempts)', 'high',
+     'Multiple failed access attempts from same source'),
+    ('privilege_escalation', r'(privilege escalation|root access|admin access|sudo command)', 'critical',
+     'Privilege escalation attempt detected'),
+    ('sql_injection', r'(select.*from|union.*select|drop table|insert into|sql syntax)', 'critical',
+     'Possible SQL injection attempt'),
+    ('file_access', r'(etc/passwd|/etc/shadow|/root/|/admin/|config\.)', 'high',
+     'Sensitive file access attempt'),
+    ('system_shutdown', r'(shutdown|reboot|halt|poweroff|system stop)', 'medium',
+     'System shutdown/reboot command executed'),
+    ('firewall_change', r'(iptables|firewall|port open|port forward|ufw)', 'high',
+     'Firewall configuration change detected'),
+    ('after_hours_access', r'.*', 'medium',
+     'Access during non-business hours'),
+    ('weekend_access', r'.*', 'medium',
+     'Access during weekend hours'),
+]
+
+
+def seed_threat_rules(apps, schema_editor):
+    """Create a ThreatPattern row for every built-in rule that has none yet."""
+    ThreatPattern = apps.get_model('logs', 'ThreatPattern')
+    ThreatRuleVersion = apps.get_model('logs', 'ThreatRuleVersion')
+    existing = set(ThreatPattern.objects.values_list('name', flat=True))
+    ThreatPattern.objects.bulk_create([
+        ThreatPattern(name=name, pattern=pattern, severity=severity, description=description)
+        for name, pattern, severity, description in THREAT_RULES
+        if name not in existing
+    ])
+    ThreatRuleVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0004_logrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreatRuleVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_threat_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# The CORRELATION_RULES as they stood at this migration, as
+# (name, severity, description)
+CORRELATION_RULES = [
+    ('brute_force', 'critical', 'Repeated failed access attempts from the same address'),
+    ('account_attack', 'high', 'Repeated failed access attempts against the same account'),
+    ('export_burst', 'high', 'Burst of data exports by the same user'),
+]
+
+
+def seed_correlation_rules(apps, schema_editor):
+    """Create the placeholder ThreatPattern rows that enable the correlation rules."""
+    ThreatPattern = apps.get_model('logs', 'ThreatPattern')
+    existing = set(ThreatPattern.objects.values_list('name', flat=True))
+    ThreatPattern.objects.bulk_create([
+        ThreatPattern(name=name, pattern='.*', severity=severity, description=description)
+        for name, severity, description in CORRELATION_RULES
+        if name not in existing
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0005_threat_rules'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_correlation_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_single_hits(apps, schema_editor):
+    """Describe every existing alert as a single hit of its log entry."""
+    Alert = apps.get_model('logs', 'Alert')
+    LogEntry = apps.get_model('logs', 'LogEntry')
+    entries = LogEntry.objects.filter(id=models.OuterRef('log_entry_id'))
+    Alert.objects.update(
+        source_id=models.Subquery(entries.values('source_id')[:1]),
+        first_seen=models.Subquery(entries.values('timestamp')[:1]),
+        last_seen=models.Subquery(entries.values('timestamp')[:1]),
+    )
+    batch = []
+    for alert in Alert.objects.only('id', 'log_entry_id').iterator(chunk_size=2000):
+        alert.entry_ranges = [[alert.log_entry_id, alert.log_entry_id]]
+        batch.append(alert)
+        if len(batch) >= 2000:
+            Alert.objects.bulk_update(batch, ['entry_ranges'])
+            batch = []
+    Alert.objects.bulk_update(batch, ['entry_ranges'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0006_correlation_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='bucket',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='entry_ranges',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='first_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='source',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='logs.logsource'),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_resolved', False)), fields=('source', 'pattern', 'bucket'), name='logs_alert_open_bucket_unique'),
+        ),
+        migrations.RunPython(backfill_single_hits, migrations.RunPython.noop),
+    ]
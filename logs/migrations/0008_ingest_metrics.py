@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0007_alert_aggregation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('label', models.CharField(blank=True, max_length=100)),
+                ('value', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddConstraint(
+            model_name='ingestmetric',
+            constraint=models.UniqueConstraint(fields=('name', 'label'), name='logs_metric_unique'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0008_ingest_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024)),
+                ('inode', models.BigIntegerField(blank=True, null=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('line_count', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logs.logsource')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ingestcheckpoint',
+            constraint=models.UniqueConstraint(fields=('source', 'path'), name='logs_checkpoint_unique'),
+        ),
+    ]
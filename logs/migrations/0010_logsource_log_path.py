@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0009_ingest_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logsource',
+            name='log_path',
+            field=models.CharField(blank=True, max_length=1024),
+        ),
+    ]
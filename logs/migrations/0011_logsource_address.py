@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0010_logsource_log_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logsource',
+            name='address',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:32
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from hashlib import blake2b
+
+from django.db import migrations, models
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def content_hash(timestamp, raw_message, occurrence):
+    """``logs.utils.dedup.content_hash`` as it stood at this migration."""
+    micros = (timestamp - EPOCH) // MICROSECOND
+    data = f'{micros}\x1f{occurrence}\x1f{raw_message}'.encode('utf-8', 'surrogatepass')
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+def backfill_content_hashes(apps, schema_editor):
+    """Hash the existing entries the way ingestion would, in timestamp order per source.
+
+    The nth repeat of a line within one timestamp is occurrence n. Copies
+    stored by earlier re-uploads can't be told apart from repeated events;
+    they are numbered as repeats and kept.
+    """
+    LogEntry = apps.get_model('logs', 'LogEntry')
+    batch = []
+    current, repeats = None, {}
+    entries = LogEntry.objects.order_by('source_id', 'timestamp', 'id').only(
+        'id', 'source_id', 'timestamp', 'raw_message'
+    )
+    for entry in entries.iterator(chunk_size=2000):
+        if (entry.source_id, entry.timestamp) != current:
+            current, repeats = (entry.source_id, entry.timestamp), {}
+        occurrence = repeats.get(entry.raw_message, 0)
+        repeats[entry.raw_message] = occurrence + 1
+        entry.content_hash = content_hash(entry.timestamp, entry.raw_message, occurrence)
+        batch.append(entry)
+        if len(batch) >= 2000:
+            LogEntry.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    LogEntry.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0011_logsource_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='duplicates_skipped',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='logentry',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='logentry',
+            constraint=models.UniqueConstraint(fields=('source', 'content_hash'), name='logs_entry_content_hash_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0013_log_entry_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logsource',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
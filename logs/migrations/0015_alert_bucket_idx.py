@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0014_logsource_retention_days'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['source', 'pattern', 'bucket'], name='logs_alert_bucket_idx'),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import re
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class LogSource(models.Model):
     name = models.CharField(max_length=200)
@@ -10,6 +14,12 @@ class LogSource(models.Model):
         ('network', 'Network Device'),
         ('database', 'Database'),
     ])
+    # Live file tailed by the follow_logs command
+    log_path = models.CharField(max_length=1024, blank=True)
+    # Sender address whose messages receive_syslog files under this source
+    address = models.GenericIPAddressField(null=True, blank=True)
+    # Days of lines purge_logs keeps; unset falls back to LOG_RETENTION_DAYS
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -29,10 +39,21 @@ class LogEntry(models.Model):
     timestamp = models.DateTimeField()
     severity = models.CharField(max_length=10, choices=SEVERITY_LEVELS)
     parsed_data = models.JSONField(default=dict)  # Store structured log data
+    # 64-bit hash of (timestamp, raw_message, repeat number); see utils.dedup
+    content_hash = models.BigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp'], name='logs_entry_timestamp_idx'),
+            models.Index(fields=['severity'], name='logs_entry_severity_idx'),
+            models.Index(fields=['source', '-timestamp'], name='logs_entry_source_ts_idx'),
+        ]
+        constraints = [
+            # A line ingested again (an overlapping re-upload) is skipped, not stored twice
+            models.UniqueConstraint(fields=['source', 'content_hash'], name='logs_entry_content_hash_unique'),
+        ]
     
     def __str__(self):
         return f"{self.timestamp} - {self.source} - {self.severity}"
@@ -48,14 +69,165 @@ class ThreatPattern(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        try:
+            re.compile(self.pattern)
+        except re.error as e:
+            raise ValidationError({'pattern': f"Invalid regular expression: {e}"})
+
+class ThreatRuleVersion(models.Model):
+    """Single-row counter bumped whenever a ``ThreatPattern`` is saved or deleted.
+
+    Every process compares it with the version its compiled rules were
+    built from, so admin edits reach all workers without a restart.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Threat rules v{self.version}"
+
 class Alert(models.Model):
+    """One or more hits of a threat pattern on a source.
+
+    Ingestion collapses the hits of a pattern on a source within one time
+    ``bucket`` into a single open alert: ``log_entry`` is the first hit,
+    ``hit_count``, ``first_seen`` and ``last_seen`` summarise the rest, and
+    ``entry_ranges`` lists the ``LogEntry`` ids that hit as ``[first, last]``
+    runs. Alerts without a bucket are single hits.
+    """
     log_entry = models.ForeignKey(LogEntry, on_delete=models.CASCADE)
     pattern = models.ForeignKey(ThreatPattern, on_delete=models.CASCADE)
+    source = models.ForeignKey(LogSource, null=True, blank=True, on_delete=models.CASCADE)
     description = models.TextField()
+    bucket = models.DateTimeField(null=True, blank=True)
+    hit_count = models.PositiveIntegerField(default=1)
+    first_seen = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    entry_ranges = models.JSONField(default=list, blank=True)
     is_resolved = models.BooleanField(default=False)
     resolved_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     resolved_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_resolved', '-created_at'], name='logs_alert_resolved_idx'),
+            # Only open alerts are listed; keep that index small
+            models.Index(fields=['-created_at'], condition=models.Q(is_resolved=False),
+                         name='logs_alert_open_idx'),
+            # Resolved alerts of a bucket too, checked when alerts are reopened
+            models.Index(fields=['source', 'pattern', 'bucket'], name='logs_alert_bucket_idx'),
+        ]
+        constraints = [
+            # At most one open alert to add hits to per source, pattern and bucket
+            models.UniqueConstraint(fields=['source', 'pattern', 'bucket'],
+                                    condition=models.Q(is_resolved=False),
+                                    name='logs_alert_open_bucket_unique'),
+        ]
     
     def __str__(self):
         return f"Alert: {self.pattern.name} - {self.created_at}"
+
+class LogRollup(models.Model):
+    """Number of log entries and open alerts per source, severity and hour.
+
+    Maintained incrementally by ingestion and alert resolution so the
+    dashboard never counts ``LogEntry`` rows itself.
+    """
+    source = models.ForeignKey(LogSource, on_delete=models.CASCADE)
+    severity = models.CharField(max_length=10, choices=LogEntry.SEVERITY_LEVELS)
+    hour = models.DateTimeField()
+    log_count = models.BigIntegerField(default=0)
+    open_alert_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'severity', 'hour'], name='logs_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} - {self.source} - {self.severity}: {self.log_count}"
+
+class IngestJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    source = models.ForeignKey(LogSource, on_delete=models.CASCADE)
+    log_file = models.FileField(upload_to='ingest/%Y/%m/%d/')
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    lines_done = models.BigIntegerField(default=0)
+    alerts_found = models.BigIntegerField(default=0)
+    # Lines skipped because the source already had them
+    duplicates_skipped = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Per-stage timings and rule counts, when LOG_METRICS_ENABLED is set
+    metrics = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Last progress of the worker running the job; a stale one means it died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.id}: {self.original_name} - {self.status}"
+
+    @property
+    def lines_per_second(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return self.lines_done / elapsed if elapsed > 0 else 0.0
+
+
+class IngestMetric(models.Model):
+    """A cumulative ingestion counter, such as the seconds spent in one stage.
+
+    Every ingesting process adds to these rows, so the metrics view can
+    report them whichever process serves it.
+    """
+    name = models.CharField(max_length=50)
+    label = models.CharField(max_length=100, blank=True)
+    value = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'label'], name='logs_metric_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}[{self.label}] = {self.value}"
+
+
+class IngestCheckpoint(models.Model):
+    """How far a file on disk has been ingested for a source.
+
+    ``offset`` is the position, in the decompressed stream, just past the
+    last line that was written; it is updated in the same transaction as
+    those lines, so resuming from it neither skips nor repeats any. The
+    inode and size tell a file that was replaced or truncated from one
+    that only grew.
+    """
+    source = models.ForeignKey(LogSource, on_delete=models.CASCADE)
+    path = models.CharField(max_length=1024)
+    inode = models.BigIntegerField(null=True, blank=True)
+    size = models.BigIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    line_count = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'path'], name='logs_checkpoint_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} @ {self.offset}"
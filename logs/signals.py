@@ -0,0 +1,20 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .models import ThreatPattern
+from .utils.rules import bump_rules_version
+from .utils.search import install_search_index
+
+
+@receiver(post_save, sender=ThreatPattern)
+@receiver(post_delete, sender=ThreatPattern)
+def threat_pattern_changed(sender, **kwargs):
+    bump_rules_version()
+
+
+@receiver(post_migrate)
+def repair_search_index(sender, using, **kwargs):
+    # Migrations that rebuild logs_logentry on SQLite drop the index triggers
+    if sender.name == 'logs':
+        install_search_index(connections[using], repair=True)
@@ -1,3 +1,1476 @@
-from django.test import TestCase
+import asyncio
+import bz2
+import csv
+import gzip
+import itertools
+import json
+import lzma
+import os
+import shutil
+import socket
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from urllib.parse import quote
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import LogSource, LogEntry, ThreatPattern, Alert, IngestJob, LogRollup, IngestCheckpoint
+from .utils import dedup, syslog
+from .utils.alerts import AlertAggregator, entry_ids
+from .utils.correlation import CorrelationEngine
+from .utils.follow import LogFollower
+from .utils.ingest import LogIngestor
+from .utils.jobs import claim_next_job, run_job
+from .utils.log_parser import LogParser
+from .utils.metrics import metric_totals
+from .utils.parallel import split_ranges
+from .utils.patterns import CORRELATION_RULES, THREAT_PATTERNS
+from .utils.readers import detect_compression, iter_lines, open_log, read_chunks
+from .utils.retention import purge_source
+from .utils.rollups import rebuild_rollups, severity_totals
+from .utils.rules import bump_rules_version, get_threat_matcher
+from .utils.search import install_search_index, search_entries
+from .utils.syslog import SyslogParser, SyslogReceiver
+from .utils.threats import ThreatMatcher, refers_to_groups, strip_outer_group
+from .utils.timestamps import TimestampParser
+from .management.commands.benchmark_logs import (
+    SAMPLE_LINES, SAMPLE_MESSAGES, generate_lines, legacy_detect_threats, legacy_parse_line,
+    legacy_parse_timestamp,
+)
+
+AUTH_LOG_LINES = [
+    '2023-09-06 08:30:25 - INFO - User admin logged in successfully from 192.168.1.100',
+    '2023-09-06 08:32:10 - ERROR - Failed login attempt for user johndoe from 192.168.1.101',
+    '2023-09-06 08:33:45 - WARNING - Multiple failed login attempts for user jsmith from 192.168.1.102',
+]
+
+
+class LogIngestorTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+
+    def test_ingest_creates_entries_and_alerts(self):
+        line_count, alert_count = LogIngestor(self.source).ingest(AUTH_LOG_LINES + ['', '   '])
+
+        self.assertEqual(line_count, 3)
+        self.assertEqual(LogEntry.objects.count(), 3)
+        entry = LogEntry.objects.get(raw_message=AUTH_LOG_LINES[1])
+        self.assertEqual(entry.severity, 'high')
+        self.assertEqual(entry.parsed_data['timestamp'], entry.timestamp.isoformat())
+        alert = Alert.objects.get(pattern__name='unauthorized_access')
+        self.assertEqual(alert.log_entry, entry)
+        self.assertEqual(alert.hit_count, 2)
+        self.assertEqual(Alert.objects.aggregate(hits=Sum('hit_count'))['hits'], alert_count)
+
+    def test_identical_hits_collapse_into_one_alert_per_bucket(self):
+        weekend = [
+            f'2023-09-09 {hour:02d}:{minute:02d}:00 - INFO - Nightly batch step {minute}'
+            for hour in (10, 11) for minute in range(60)
+        ]
+        ingestor = LogIngestor(self.source, chunk_size=50)
+        ingestor.ingest(weekend)
+
+        alerts = list(Alert.objects.filter(pattern__name='weekend_access').order_by('first_seen'))
+        self.assertEqual([alert.hit_count for alert in alerts], [60, 60])
+        self.assertEqual(ingestor.alert_count, 120)
+        entries = LogEntry.objects.order_by('id')
+        self.assertEqual(alerts[0].first_seen, entries[0].timestamp)
+        self.assertEqual(alerts[1].last_seen, entries.last().timestamp)
+        self.assertEqual(
+            entry_ids(alerts[0]) + entry_ids(alerts[1]), list(entries.values_list('id', flat=True))
+        )
+
+    def test_overlapping_reingest_skips_stored_lines(self):
+        lines = generate_lines('standard', 200, threat_density=0.2)
+        LogIngestor(self.source, chunk_size=50).ingest(lines[:150])
+        alert_hits = Alert.objects.aggregate(hits=Sum('hit_count'))['hits']
+        ingestor = LogIngestor(self.source, chunk_size=50)
+        ingestor.ingest(lines[100:])
+
+        self.assertEqual((ingestor.line_count, ingestor.duplicate_count), (100, 50))
+        self.assertEqual(list(LogEntry.objects.order_by('id').values_list('raw_message', flat=True)), lines)
+        self.assertEqual(Alert.objects.aggregate(hits=Sum('hit_count'))['hits'], alert_hits + ingestor.alert_count)
+        self.assertEqual(sum(totals['logs'] for totals in severity_totals().values()), 200)
+
+    def test_repeated_lines_are_kept_but_not_reingested(self):
+        burst = AUTH_LOG_LINES[1:2] * 3
+        LogIngestor(self.source).ingest(burst)
+        ingestor = LogIngestor(self.source)
+        ingestor.ingest(burst + AUTH_LOG_LINES[1:2])
+
+        self.assertEqual(ingestor.duplicate_count, 3)
+        self.assertEqual(LogEntry.objects.filter(raw_message=AUTH_LOG_LINES[1]).count(), 4)
+
+    def test_repeats_far_apart_in_a_file_are_kept(self):
+        # Merged streams: the same event recurs after many other seconds
+        failed = '2023-09-06 08:30:00 - ERROR - Failed password for root from 10.0.0.9'
+        lines = [failed] + [
+            f'2023-09-06 08:{minute:02d}:00 - INFO - job {minute} done' for minute in range(31, 50)
+        ] + [failed]
+        LogIngestor(self.source).ingest(lines)
+
+        self.assertEqual(LogEntry.objects.count(), 21)
+        self.assertEqual(LogEntry.objects.filter(raw_message=failed).count(), 2)
+        ingestor = LogIngestor(self.source)
+        ingestor.ingest(lines)
+        self.assertEqual(ingestor.duplicate_count, 21)
+
+    def test_lines_without_a_time_are_not_reingested(self):
+        untimed = ['kernel: eth0 link down', 'kernel: eth0 link down', '{"level": "error", "message": "no time"}']
+        lines = untimed + AUTH_LOG_LINES[:1] + ['    at Handler.run(Handler.java:42)'] * 2
+        for _ in range(2):
+            LogIngestor(self.source).ingest(lines)
+
+        self.assertEqual(LogEntry.objects.count(), len(lines))
+        self.assertEqual(LogEntry.objects.filter(parsed_data__time_received=True).count(), 5)
+
+    def test_stale_bloom_filter_falls_back_to_the_unique_constraint(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+        # As if another process had written the lines after this one loaded its filter
+        dedup._filters[self.source.id] = dedup.BloomFilter(0)
+        ingestor = LogIngestor(self.source)
+        ingestor.ingest(AUTH_LOG_LINES)
+
+        self.assertEqual(ingestor.duplicate_count, 3)
+        self.assertEqual(LogEntry.objects.count(), 3)
+        self.assertNotIn(self.source.id, dedup._filters)
+
+    def test_alert_opened_by_another_writer_gets_the_hits(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES[1:2])
+        first = Alert.objects.get(pattern__name='unauthorized_access')
+        Alert.objects.update(is_resolved=True)
+        source = self.source
+
+        class RacingAggregator(AlertAggregator):
+            def open_alerts(self):
+                found = super().open_alerts()
+                # Another writer opens the same alert right after the SELECT
+                Alert.objects.create(
+                    source=source, log_entry=first.log_entry, pattern=first.pattern, bucket=first.bucket,
+                    description=first.description, hit_count=1,
+                    first_seen=first.first_seen, last_seen=first.last_seen, entry_ranges=first.entry_ranges,
+                )
+                return found
+
+        aggregator = RacingAggregator(self.source)
+        entry = LogIngestor(self.source).build_entry('later', {
+            'timestamp': first.first_seen + timedelta(seconds=1), 'severity': 'high',
+        })
+        entry.save()
+        aggregator.add(entry, first.pattern_id, first.description)
+        aggregator.add(entry, ThreatPattern.objects.get(name='phi_access').id, 'phi')
+
+        created = aggregator.save()
+        self.assertEqual([alert.pattern.name for alert in created], ['phi_access'])
+        alert = Alert.objects.get(pattern=first.pattern, is_resolved=False)
+        self.assertEqual(alert.hit_count, 2)
+        self.assertEqual(alert.last_seen, entry.timestamp)
+        self.assertEqual(entry_ids(alert), [first.log_entry_id, entry.id])
+
+    def test_resolved_alert_is_not_reopened_by_new_hits(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES[1:2])
+        Alert.objects.update(is_resolved=True)
+        LogIngestor(self.source).ingest([AUTH_LOG_LINES[1].replace('08:32:10', '08:32:11')])
+
+        alerts = Alert.objects.filter(pattern__name='unauthorized_access')
+        self.assertEqual(sorted(alerts.values_list('is_resolved', 'hit_count')), [(False, 1), (True, 1)])
+
+    def test_queries_per_chunk_do_not_grow_with_lines(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES * 20)
+        query_counts = []
+        for repeat in (1, 20):
+            with CaptureQueriesContext(connection) as queries:
+                LogIngestor(self.source, chunk_size=1000).ingest(AUTH_LOG_LINES * repeat)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_chunk_stats_are_recorded(self):
+        ingestor = LogIngestor(self.source, chunk_size=2)
+        ingestor.ingest(AUTH_LOG_LINES)
+
+        self.assertEqual([stats['lines'] for stats in ingestor.chunk_stats], [2, 1])
+
+    def test_repeated_failures_raise_a_correlated_alert(self):
+        lines = [
+            f'2023-09-06 08:40:{second:02d} - ERROR - Failed login attempt for user u{second} from {address}'
+            for address in ('192.168.1.101', '192.168.1.102') for second in range(0, 50, 10)
+        ]
+        LogIngestor(self.source, chunk_size=2).ingest(lines)
+
+        # Both addresses fired in the same bucket; the alert names neither
+        alert = Alert.objects.get(pattern__name='brute_force')
+        self.assertEqual(alert.hit_count, 2)
+        self.assertEqual(alert.log_entry.raw_message, lines[4])
+        self.assertNotIn('192.168.1.101', alert.description)
+        self.assertEqual(
+            list(LogEntry.objects.filter(id__in=entry_ids(alert)).order_by('id').values_list('raw_message', flat=True)),
+            [lines[4], lines[9]]
+        )
+
+    def test_reuses_existing_threat_patterns(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+        pattern_count = ThreatPattern.objects.count()
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+
+        self.assertEqual(ThreatPattern.objects.count(), pattern_count)
+
+
+
+@override_settings(LOG_METRICS_ENABLED=True, LOG_METRICS_RULE_SAMPLE=1)
+class IngestMetricsTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+
+    def test_stages_and_rules_are_recorded(self):
+        ingestor = LogIngestor(self.source, chunk_size=2)
+        ingestor.ingest(AUTH_LOG_LINES)
+
+        totals = metric_totals()
+        self.assertEqual(totals['lines'][''], 3)
+        self.assertEqual(totals['rule_samples'][''], 3)
+        self.assertEqual(totals['rule_matches']['unauthorized_access'], 2)
+        self.assertEqual(set(totals['rule_seconds']), {rule['pattern'] for rule in get_threat_matcher().rules})
+        for stage in ('read', 'parse', 'detect', 'correlate', 'write_entries', 'write_alerts', 'rollups'):
+            self.assertGreater(totals['stage_seconds'][stage], 0, stage)
+        self.assertEqual(ingestor.metrics.summary(), totals)
+
+    def test_metrics_view_formats(self):
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+
+        text = self.client.get('/metrics/')
+        self.assertTrue(text['Content-Type'].startswith('text/plain'))
+        self.assertContains(text, '# TYPE hlog_ingest_stage_seconds_total counter')
+        self.assertContains(text, 'hlog_threat_rule_matches_total{rule="unauthorized_access"} 2')
+        data = self.client.get('/metrics/?format=json').json()
+        self.assertTrue(data['enabled'])
+        self.assertEqual(data['metrics']['lines'][''], 3)
+
+    @override_settings(LOG_METRICS_ENABLED=False)
+    def test_nothing_is_recorded_when_disabled(self):
+        ingestor = LogIngestor(self.source)
+        ingestor.ingest(AUTH_LOG_LINES)
+
+        self.assertIsNone(ingestor.metrics)
+        self.assertIsNone(ingestor.parser.metrics)
+        self.assertEqual(metric_totals(), {})
+
+
+class ThreatRuleTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+
+    def test_builtin_rules_are_seeded(self):
+        self.assertEqual(
+            set(ThreatPattern.objects.values_list('name', flat=True)),
+            set(THREAT_PATTERNS) | set(CORRELATION_RULES)
+        )
+
+    def test_matcher_is_cached_until_a_rule_changes(self):
+        matcher = get_threat_matcher()
+        with self.assertNumQueries(1):
+            self.assertIs(get_threat_matcher(), matcher)
+
+        ThreatPattern.objects.create(name='crypto_miner', pattern=r'xmrig', severity='high',
+                                     description='Crypto miner started')
+        self.assertIsNot(get_threat_matcher(), matcher)
+        self.assertEqual([t['pattern'] for t in get_threat_matcher().match('xmrig started')], ['crypto_miner'])
+
+    def test_inactive_and_deleted_rules_stop_matching(self):
+        ThreatPattern.objects.filter(name='unauthorized_access').update(is_active=False)
+        bump_rules_version()
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+        self.assertFalse(Alert.objects.filter(pattern__name='unauthorized_access').exists())
+
+        ThreatPattern.objects.get(name='weekend_access').delete()
+        LogIngestor(self.source).ingest(['2023-09-09 10:00:00 - INFO - Saturday shift started'])
+        self.assertFalse(Alert.objects.filter(pattern__name='weekend_access').exists())
+
+    def test_invalid_pattern_is_skipped(self):
+        ThreatPattern.objects.create(name='broken', pattern=r'(unclosed', severity='low', description='')
+
+        with self.assertLogs('logs.utils.rules', 'WARNING'):
+            matcher = get_threat_matcher()
+        self.assertEqual(len(matcher.match('Failed login for root')), 1)
+        with self.assertRaises(ValidationError):
+            ThreatPattern(name='broken', pattern=r'(unclosed', severity='low', description='').full_clean()
+
+
+class CorrelationTests(SimpleTestCase):
+    RULES = {
+        'brute_force': {
+            'trigger': 'unauthorized_access', 'key': r'from (\S+)', 'threshold': 3, 'window': 60,
+            'severity': 'critical', 'description': 'Brute force',
+        },
+    }
+    START = datetime(2023, 9, 6, 8, 0, tzinfo=dt_timezone.utc)
+
+    def observe(self, engine, seconds, address):
+        log_data = {'timestamp': self.START + timedelta(seconds=seconds),
+                    'message': f'Failed login from {address}'}
+        return engine.observe(log_data, [{'pattern': 'unauthorized_access'}])
+
+    def test_fires_when_threshold_is_reached_within_window(self):
+        engine = CorrelationEngine(self.RULES)
+        fired = [bool(self.observe(engine, seconds, '10.0.0.1')) for seconds in (0, 10, 20, 30, 40, 50)]
+
+        self.assertEqual(fired, [False, False, True, False, False, True])
+
+    def test_keys_and_windows_are_independent(self):
+        engine = CorrelationEngine(self.RULES)
+        fired = [
+            bool(self.observe(engine, seconds, address))
+            for seconds, address in ((0, 'a'), (1, 'b'), (2, 'a'), (100, 'a'), (101, 'b'), (102, 'a'))
+        ]
+
+        self.assertEqual(fired, [False] * 6)
+
+    def test_description_names_no_key(self):
+        # Firings for different keys share an alert per time bucket
+        engine = CorrelationEngine(self.RULES)
+        fired = [
+            threat for seconds, address in enumerate(('10.0.0.1', '10.0.0.2') * 3)
+            for threat in self.observe(engine, seconds, address)
+        ]
+
+        self.assertEqual([threat['description'] for threat in fired], ['Brute force (3 in 60s)'] * 2)
+
+    def test_stale_windows_are_evicted(self):
+        engine = CorrelationEngine(self.RULES)
+        for index in range(100):
+            self.observe(engine, index, f'10.0.0.{index}')
+        self.observe(engine, 1000, '10.0.0.1')
+
+        self.assertEqual(engine.active_keys, 1)
+
+    def test_disabled_rules_do_not_fire(self):
+        engine = CorrelationEngine(self.RULES, enabled=set())
+
+        self.assertFalse(any(self.observe(engine, seconds, 'a') for seconds in range(5)))
+
+
+class LogRollupTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES + [
+            '2023-09-06 09:10:00 - CRIT - Root access granted to patient record export',
+        ])
+
+    def assert_rollup_matches_tables(self):
+        totals = severity_totals()
+        for severity in ('low', 'medium', 'high', 'critical'):
+            self.assertEqual(totals[severity]['logs'], LogEntry.objects.filter(severity=severity).count())
+            self.assertEqual(
+                totals[severity]['open_alerts'],
+                Alert.objects.filter(log_entry__severity=severity, is_resolved=False).count()
+            )
+
+    def test_ingest_maintains_rollup(self):
+        self.assert_rollup_matches_tables()
+        self.assertEqual(LogRollup.objects.filter(source=self.source).count(), 4)
+
+    def test_resolving_alert_updates_rollup_once(self):
+        self.client.force_login(User.objects.create_user('analyst'))
+        alert = Alert.objects.filter(log_entry__severity='critical').first()
+        for _ in range(2):
+            self.client.post(f'/alerts/{alert.id}/resolve/')
+
+        self.assert_rollup_matches_tables()
+
+    def test_rebuild_matches_incremental_counts(self):
+        before = sorted(LogRollup.objects.values_list('source', 'severity', 'hour', 'log_count', 'open_alert_count'))
+        rebuild_rollups()
+
+        after = sorted(LogRollup.objects.values_list('source', 'severity', 'hour', 'log_count', 'open_alert_count'))
+        self.assertEqual(after, before)
+
+    def test_dashboard_counts_come_from_one_rollup_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+
+        self.assertEqual(sum('logs_logrollup' in query['sql'] for query in queries), 1)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(response.context['total_logs'], 4)
+        self.assertEqual(response.context['severity_data']['critical'], 1)
+
+
+@override_settings(LOG_ALERT_BUCKET_SECONDS=60)
+class ViewAlertsTests(TestCase):
+    def setUp(self):
+        source = LogSource.objects.create(name='auth-server', source_type='server')
+        # One failure a minute from distinct users and addresses: one alert each
+        LogIngestor(source).ingest(
+            f'2023-09-06 {8 + index // 60:02d}:{index % 60:02d}:00 - {level} - '
+            f'Failed login attempt for user u{index} from 10.0.0.{index}'
+            for index, level in zip(range(120), itertools.cycle(['ERROR', 'WARNING', 'INFO']))
+        )
+        self.expected = list(
+            Alert.objects.filter(is_resolved=False).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def test_pages_walk_all_open_alerts_in_fixed_queries(self):
+        seen = []
+        url = '/alerts/'
+        while url:
+            # One rollup aggregate plus one page query, however deep the page
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            seen.extend(alert.id for alert in response.context['alerts'])
+            self.assertContains(response, f"{len(self.expected)} Active Alerts")
+            next_cursor = response.context['next_cursor']
+            url = f'/alerts/?after={quote(next_cursor)}' if next_cursor else None
+
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        first = self.client.get('/alerts/')
+        second = self.client.get(f"/alerts/?after={quote(first.context['next_cursor'])}")
+        back = self.client.get(f"/alerts/?before={quote(second.context['previous_cursor'])}")
+
+        self.assertEqual([a.id for a in back.context['alerts']], [a.id for a in first.context['alerts']])
+        self.assertIsNone(back.context['previous_cursor'])
+
+    def test_severity_filter_and_invalid_cursor(self):
+        response = self.client.get('/alerts/?severity=medium&after=garbage')
+
+        self.assertTrue(response.context['alerts'])
+        self.assertTrue(all(alert.log_entry.severity == 'medium' for alert in response.context['alerts']))
+        self.assertEqual(
+            response.context['open_alert_count'],
+            Alert.objects.filter(log_entry__severity='medium', is_resolved=False).count()
+        )
+
+
+@override_settings(LOG_ALERT_BUCKET_SECONDS=60)
+class AlertTriageTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        # One failure a minute: one alert a minute
+        LogIngestor(self.source).ingest(
+            f'2023-09-06 08:{minute:02d}:00 - ERROR - Failed login attempt for user u{minute} from 10.0.0.{minute}'
+            for minute in range(30)
+        )
+
+    def triage(self, **params):
+        return self.client.post('/alerts/triage/', json.dumps(params), content_type='application/json')
+
+    def assert_open_alerts_match_rollup(self):
+        self.assertEqual(
+            sum(counts['open_alerts'] for counts in severity_totals().values()),
+            Alert.objects.filter(is_resolved=False).count()
+        )
+
+    def test_window_resolve_and_unresolve_by_ids(self):
+        window = Alert.objects.filter(last_seen__gte=datetime(2023, 9, 6, 8, 10, tzinfo=dt_timezone.utc),
+                                      first_seen__lt=datetime(2023, 9, 6, 8, 20, tzinfo=dt_timezone.utc))
+        ids = list(window.values_list('id', flat=True))
+        self.assertTrue(ids)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.triage(action='resolve', since='2023-09-06T08:10', until='2023-09-06T08:20').json()
+        self.assertEqual((data['matched'], data['updated']), (len(ids), len(ids)))
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "logs_alert"') for query in queries), 1)
+        resolved = Alert.objects.filter(is_resolved=True)
+        self.assertEqual(sorted(resolved.values_list('id', flat=True)), sorted(ids))
+        # Anonymous requests resolve without a resolver
+        self.assertFalse(resolved.filter(resolved_at__isnull=True).exists())
+        self.assertFalse(resolved.filter(resolved_by__isnull=False).exists())
+        self.assert_open_alerts_match_rollup()
+
+        data = self.triage(action='resolve', since='2023-09-06T08:10', until='2023-09-06T08:20').json()
+        self.assertEqual((data['matched'], data['updated']), (len(ids), 0))
+
+        data = self.triage(action='unresolve', ids=ids[:2]).json()
+        self.assertEqual(data['updated'], 2)
+        self.assertFalse(Alert.objects.filter(id__in=ids[:2], resolved_at__isnull=False).exists())
+        self.assert_open_alerts_match_rollup()
+
+    def test_unresolve_skips_alerts_whose_bucket_has_an_open_alert(self):
+        alert = Alert.objects.get(first_seen=datetime(2023, 9, 6, 8, 5, tzinfo=dt_timezone.utc))
+        self.triage(action='resolve', ids=[alert.id])
+        # New hits in the same minute open a second alert there
+        LogIngestor(self.source).ingest(['2023-09-06 08:05:30 - ERROR - Failed login attempt for user u5 from 10.0.0.5'])
+
+        data = self.triage(action='unresolve', source=self.source.id, pattern=alert.pattern_id)
+        self.assertEqual(data.json()['updated'], 0)
+        self.assertTrue(Alert.objects.get(id=alert.id).is_resolved)
+        self.assert_open_alerts_match_rollup()
+
+    def test_requests_without_a_selection_are_rejected_and_admin_records_resolver(self):
+        self.assertEqual(self.triage(action='resolve').status_code, 400)
+        self.assertEqual(self.triage(action='delete', ids=[1]).status_code, 400)
+        # A filter that is present but invalid must not widen the update
+        alert = Alert.objects.first()
+        for invalid in ({'pattern': 'unauthorized_access'}, {'severity': 'urgent'}, {'since': 'yesterday'},
+                        {'until': None}, {'source': 'auth-server'}, {'ids': [True]}, {'ids': 'all'}):
+            response = self.triage(action='resolve', **{'ids': [alert.id], 'source': self.source.id, **invalid})
+            self.assertEqual(response.status_code, 400, invalid)
+        self.assertEqual(self.client.get('/alerts/triage/').status_code, 405)
+        self.assertFalse(Alert.objects.filter(is_resolved=True).exists())
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        ids = list(Alert.objects.values_list('id', flat=True)[:3])
+        self.client.post('/admin/logs/alert/', {'action': 'mark_as_resolved', '_selected_action': ids})
+        self.assertEqual(Alert.objects.filter(resolved_by=admin_user, resolved_at__isnull=False).count(), 3)
+        self.assert_open_alerts_match_rollup()
+
+
+class ParallelIngestTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        lines = [line for samples in SAMPLE_LINES.values() for line in samples] * 20
+        handle, self.path = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(handle, 'w', encoding='utf-8') as log_file:
+            log_file.write('\r\n'.join(lines))
+        self.addCleanup(os.remove, self.path)
+
+    def test_split_ranges_cover_file_on_line_boundaries(self):
+        with open(self.path, 'rb') as log_file:
+            data = log_file.read()
+        ranges = list(split_ranges(self.path, range_size=500))
+
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(b''.join(data[start:end] for start, end in ranges), data)
+        for start, end in ranges[:-1]:
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def test_parallel_parse_matches_serial_order(self):
+        LogIngestor(self.source).ingest_path(self.path, workers=1)
+        serial = list(LogEntry.objects.order_by('id').values_list('raw_message', 'severity'))
+        LogEntry.objects.all().delete()
+
+        line_count, alert_count = LogIngestor(self.source).ingest_path(self.path, workers=2, range_size=500)
+
+        self.assertEqual(list(LogEntry.objects.order_by('id').values_list('raw_message', 'severity')), serial)
+        self.assertEqual(Alert.objects.aggregate(hits=Sum('hit_count'))['hits'], alert_count)
+
+
+class UploadLogsViewTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+
+    def test_upload_is_queued_and_processed_by_worker(self):
+        log_file = SimpleUploadedFile('auth.log', '\n'.join(AUTH_LOG_LINES).encode('utf-8'))
+
+        response = self.client.post('/upload/', {'source': self.source.id, 'log_file': log_file})
+
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+        job = IngestJob.objects.get()
+        self.assertEqual(job.status, 'pending')
+        self.assertFalse(LogEntry.objects.exists())
+
+        call_command('process_ingest_jobs', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.lines_done, 3)
+        self.assertEqual(LogEntry.objects.filter(source=self.source).count(), 3)
+
+        status = self.client.get(f'/jobs/{job.id}/').json()
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['lines_done'], 3)
+        self.assertEqual(status['alerts_found'], job.alerts_found)
+
+    def test_undecodable_upload_fails_job(self):
+        log_file = SimpleUploadedFile('auth.log', b'\xff\xfe broken\n')
+        self.client.post('/upload/', {'source': self.source.id, 'log_file': log_file})
+
+        call_command('process_ingest_jobs', '--once', stdout=StringIO())
+
+        job = IngestJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('UTF-8', job.error)
+
+    def test_compressed_uploads_are_decompressed(self):
+        data = '\n'.join(AUTH_LOG_LINES).encode('utf-8')
+        # A two-member gzip file, as left by logrotate appending to an archive
+        archives = {
+            'auth.log.gz': gzip.compress(data[:100]) + gzip.compress(data[100:]),
+            'auth.log.bz2': bz2.compress(data),
+            'auth.log.xz': lzma.compress(data),
+        }
+        for name, archive in archives.items():
+            self.client.post('/upload/', {'source': self.source.id, 'log_file': SimpleUploadedFile(name, archive)})
+            call_command('process_ingest_jobs', '--once', stdout=StringIO())
+
+            job = IngestJob.objects.get(original_name=name)
+            self.assertEqual((job.status, job.lines_done), ('completed', 3), name)
+        # The same lines three times over are only stored once
+        self.assertEqual(
+            list(IngestJob.objects.order_by('id').values_list('duplicates_skipped', flat=True)), [0, 3, 3]
+        )
+        self.assertEqual(
+            list(LogEntry.objects.order_by('id').values_list('raw_message', flat=True)), AUTH_LOG_LINES
+        )
+
+    def test_truncated_archive_fails_job(self):
+        archive = gzip.compress('\n'.join(AUTH_LOG_LINES * 50).encode('utf-8'))
+        self.client.post('/upload/', {'source': self.source.id,
+                                      'log_file': SimpleUploadedFile('auth.log.gz', archive[:-40])})
+
+        call_command('process_ingest_jobs', '--once', stdout=StringIO())
+
+        job = IngestJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('truncated or corrupt', job.error)
+
+    def test_job_of_a_dead_worker_is_queued_again(self):
+        log_file = SimpleUploadedFile('auth.log', '\n'.join(AUTH_LOG_LINES).encode('utf-8'))
+        self.client.post('/upload/', {'source': self.source.id, 'log_file': log_file})
+        job = claim_next_job()
+        # The worker was killed after its claim
+        IngestJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+
+        with override_settings(LOG_INGEST_JOB_TIMEOUT=600):
+            self.assertIsNone(claim_next_job())
+        with override_settings(LOG_INGEST_JOB_TIMEOUT=60):
+            call_command('process_ingest_jobs', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lines_done), ('completed', 3))
+
+    def test_worker_leaves_a_job_queued_again(self):
+        log_file = SimpleUploadedFile('auth.log', '\n'.join(AUTH_LOG_LINES).encode('utf-8'))
+        self.client.post('/upload/', {'source': self.source.id, 'log_file': log_file})
+        job = claim_next_job()
+        # Taken for dead while still running, then claimed by another worker
+        IngestJob.objects.filter(id=job.id).update(started_at=timezone.now() + timedelta(seconds=1))
+
+        run_job(job)
+
+        self.assertEqual(IngestJob.objects.get(id=job.id).status, 'processing')
+        self.assertFalse(LogEntry.objects.exists())
+
+    def test_unknown_job_returns_404(self):
+        self.assertEqual(self.client.get('/jobs/999/').status_code, 404)
+
+
+class IngestLogsCommandTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        self.lines = generate_lines('standard', 300, threat_density=0.1)
+
+    def write(self, name, data, mode='wb'):
+        path = os.path.join(self.directory, name)
+        with open(path, mode) as log_file:
+            log_file.write(data)
+        return path
+
+    def ingest(self, *args):
+        output = StringIO()
+        call_command('ingest_logs', *args, '--source', 'auth-server', '--block-size', '2048', stdout=output,
+                     stderr=output)
+        return output.getvalue()
+
+    def raw_messages(self):
+        return list(LogEntry.objects.order_by('id').values_list('raw_message', flat=True))
+
+    def test_directory_and_globs_are_ingested_once(self):
+        data = '\n'.join(self.lines).encode('utf-8')
+        self.write('app.log', data[:5000])
+        os.mkdir(os.path.join(self.directory, 'rotated'))
+        self.write('rotated/app.log.1.gz', gzip.compress(data))
+
+        output = self.ingest(self.directory, os.path.join(self.directory, '*.log'))
+        self.assertIn('app.log.1.gz: 300 lines', output)
+        # app.log overlaps the archive; only its cut-off last line is new
+        self.assertEqual(LogEntry.objects.count(), 301)
+
+        output = self.ingest(self.directory)
+        self.assertIn('app.log.1.gz: already ingested, skipped', output)
+        self.assertEqual(LogEntry.objects.count(), 301)
+        self.assertTrue(IngestCheckpoint.objects.get(path__endswith='.gz').completed)
+
+    def test_resumes_after_a_failure_without_duplicates(self):
+        data = bytearray('\n'.join(self.lines).encode('utf-8'))
+        bad = len(data) * 2 // 3
+        data[bad:bad + 2] = b'\xff\xfe'
+        path = self.write('app.log', bytes(data))
+
+        with self.assertRaises(CommandError):
+            self.ingest(path)
+        checkpoint = IngestCheckpoint.objects.get()
+        self.assertGreater(checkpoint.offset, 0)
+        self.assertEqual(checkpoint.offset, sum(len(line) + 1 for line in self.raw_messages()))
+
+        # Repair the file in place; the same inode resumes from the checkpoint
+        with open(path, 'r+b') as log_file:
+            log_file.seek(bad)
+            log_file.write(self.lines[0][:2].encode('utf-8'))
+        data[bad:bad + 2] = self.lines[0][:2].encode('utf-8')
+        output = self.ingest(path)
+
+        self.assertIn(f'resumed at byte {checkpoint.offset}', output)
+        self.assertEqual(self.raw_messages(), bytes(data).decode('utf-8').splitlines())
+        self.assertEqual(IngestCheckpoint.objects.get().line_count, 300)
+
+    def test_resumed_repeats_of_stored_lines_are_new(self):
+        line = '2023-09-06 08:32:10 - ERROR - Failed login attempt for user johndoe from 192.168.1.101\n'
+        path = self.write('app.log', line * 2, mode='w')
+        self.ingest(path)
+        with open(path, 'a') as log_file:
+            log_file.write(line)
+        self.ingest(path)
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+        # Re-reading the whole file still finds all three stored
+        self.ingest(path, '--restart')
+        self.assertEqual(LogEntry.objects.count(), 3)
+
+    def test_appended_file_resumes_and_truncated_file_restarts(self):
+        path = self.write('app.log', '\n'.join(self.lines[:100]) + '\n', mode='w')
+        self.ingest(path)
+        self.write('app.log', '\n'.join(self.lines[100:150]) + '\n', mode='a')
+        self.ingest(path)
+        self.assertEqual(self.raw_messages(), self.lines[:150])
+
+        # The truncated file is read again, but its line is already stored
+        self.write('app.log', self.lines[0] + '\n' + self.lines[150] + '\n', mode='w')
+        self.ingest(path)
+        self.assertEqual(self.raw_messages(), self.lines[:151])
+
+    def test_unknown_source_is_an_error(self):
+        with self.assertRaisesMessage(CommandError, 'No log source'):
+            call_command('ingest_logs', self.directory, '--source', 'nope')
+
+
+class LogFollowerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'app.log')
+        self.source = LogSource.objects.create(name='app', source_type='application', log_path=self.path)
+        self.lines = generate_lines('standard', 50, threat_density=0.2)
+
+    def append(self, lines, path=None, end='\n'):
+        with open(path or self.path, 'a', encoding='utf-8') as log_file:
+            log_file.write('\n'.join(lines) + end)
+
+    def raw_messages(self):
+        return list(LogEntry.objects.order_by('id').values_list('raw_message', flat=True))
+
+    def test_batches_by_size_and_time(self):
+        self.append(self.lines[:5])
+        follower = LogFollower(self.source, self.path, batch_lines=10, batch_seconds=60)
+        self.append(self.lines[5:12], end='')
+
+        # Existing content is skipped; the unterminated line waits for its end
+        self.assertEqual(follower.poll(), 6)
+        self.assertEqual(self.raw_messages(), [])
+        self.append(['', *self.lines[12:15]])
+        follower.poll()
+        self.assertEqual(self.raw_messages(), self.lines[5:15])
+
+        follower.batch_seconds = 0
+        self.append(self.lines[15:16])
+        follower.poll()
+        self.assertEqual(self.raw_messages(), self.lines[5:16])
+
+    def test_backlog_is_written_batch_by_batch(self):
+        lines = generate_lines('standard', 2500, threat_density=0.1)
+        self.append(lines)
+        follower = LogFollower(self.source, self.path, batch_lines=1000, batch_seconds=60, from_start=True)
+        chunks = []
+        save_checkpoint = follower.ingestor.on_flush
+
+        def record_chunk(ingestor):
+            chunks.append((ingestor.line_count, len(follower.pending)))
+            save_checkpoint(ingestor)
+
+        follower.ingestor.on_flush = record_chunk
+        self.assertEqual(follower.poll(), 2500)
+
+        # Two full batches were written while reading; the rest waits for its time
+        self.assertEqual(chunks, [(1000, 0), (2000, 0)])
+        self.assertEqual(follower.pending_lines, 500)
+        follower.close()
+        self.assertEqual(self.raw_messages(), lines)
+
+    def test_follows_rotation_and_truncation(self):
+        self.append(self.lines[:3])
+        follower = LogFollower(self.source, self.path, batch_lines=1000, batch_seconds=60, from_start=True)
+        follower.poll()
+        self.append(self.lines[3:5])
+        os.rename(self.path, self.path + '.1')
+        self.append(self.lines[5:6], path=self.path + '.1', end='')
+        self.append(self.lines[6:8])
+        follower.poll()
+        follower.flush()
+        self.assertEqual(self.raw_messages(), self.lines[:8])
+
+        with open(self.path, 'w', encoding='utf-8') as log_file:
+            log_file.write(self.lines[8] + '\n')
+        follower.poll()
+        follower.close()
+        self.assertEqual(self.raw_messages(), self.lines[:9])
+
+    def test_restart_resumes_from_checkpoint(self):
+        self.append(self.lines[:4])
+        call_command('follow_logs', '--once', '--from-start', stdout=StringIO())
+        self.append(self.lines[4:6])
+        call_command('follow_logs', '--once', stdout=StringIO())
+
+        self.assertEqual(self.raw_messages(), self.lines[:6])
+        checkpoint = IngestCheckpoint.objects.get(source=self.source)
+        self.assertEqual(checkpoint.offset, os.path.getsize(self.path))
+        self.assertEqual(checkpoint.line_count, 6)
+
+    def test_restart_reads_file_rotated_or_truncated_while_down(self):
+        self.append(self.lines[:2])
+        call_command('follow_logs', '--once', '--from-start', stdout=StringIO())
+        os.rename(self.path, self.path + '.1')
+        self.append(self.lines[2:5])
+        call_command('follow_logs', '--once', stdout=StringIO())
+        self.assertEqual(self.raw_messages(), self.lines[:5])
+
+        with open(self.path, 'w', encoding='utf-8') as log_file:
+            log_file.write(self.lines[5] + '\n')
+        call_command('follow_logs', '--once', stdout=StringIO())
+        self.assertEqual(self.raw_messages(), self.lines[:6])
+
+
+class SyslogParserTests(SimpleTestCase):
+    def setUp(self):
+        self.parser = SyslogParser(LogParser(timestamps=TimestampParser(tzinfo=dt_timezone.utc, year=2023)))
+
+    def test_rfc3164(self):
+        parsed = self.parser.parse('<38>Oct  5 22:14:15 mymachine sshd[4123]: Failed password for root')
+        self.assertEqual(parsed['timestamp'], datetime(2023, 10, 5, 22, 14, 15, tzinfo=dt_timezone.utc))
+        self.assertEqual((parsed['level'], parsed['severity'], parsed['facility']), ('info', 'low', 4))
+        self.assertEqual((parsed['hostname'], parsed['app_name'], parsed['procid']), ('mymachine', 'sshd', '4123'))
+        self.assertEqual(parsed['message'], 'Failed password for root')
+
+    def test_rfc5424(self):
+        parsed = self.parser.parse(
+            '<165>1 2023-10-11T22:14:15.003Z host.example.com evntslog - ID47 '
+            '[exampleSDID@32473 iut="3" eventID="10\\]11"] \ufeffAn application event'
+        )
+        self.assertEqual(parsed['timestamp'], datetime(2023, 10, 11, 22, 14, 15, 3000, tzinfo=dt_timezone.utc))
+        self.assertEqual((parsed['level'], parsed['severity'], parsed['facility']), ('notice', 'low', 20))
+        self.assertEqual((parsed['hostname'], parsed['app_name'], parsed['procid'], parsed['msgid']),
+                         ('host.example.com', 'evntslog', '', 'ID47'))
+        self.assertEqual(parsed['structured_data'], '[exampleSDID@32473 iut="3" eventID="10\\]11"]')
+        self.assertEqual(parsed['message'], 'An application event')
+
+        parsed = self.parser.parse('<10>1 - - - - - -')
+        self.assertEqual((parsed['severity'], parsed['message']), ('critical', ''))
+
+    def test_messages_without_priority_are_parsed_as_lines(self):
+        records = list(self.parser.parse_records(['', '2023-09-06 08:30:25 - ERROR - Disk full\n']))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][1]['level'], 'error')
+
+
+class FailingSyslogParser(SyslogParser):
+    def parse_records(self, messages):
+        raise OSError("database is locked")
+
+
+class FlakyReceiver(SyslogReceiver):
+    """A receiver whose first ``failures`` writes fail."""
+    failures = 0
+
+    def ingestor(self, source):
+        ingestor, syslog_parser = super().ingestor(source)
+        if self.failures:
+            self.failures -= 1
+            return ingestor, FailingSyslogParser(syslog_parser.parser)
+        return ingestor, syslog_parser
+
+
+class SyslogReceiverTests(TransactionTestCase):
+    # The threat rules come from migrations, and each test's flush removes them
+    serialized_rollback = True
+
+    def setUp(self):
+        self.source = LogSource.objects.create(name='router', source_type='network', address='127.0.0.1')
+
+    def receive(self, udp_messages, tcp_stream, receiver_class=SyslogReceiver, **options):
+        async def scenario():
+            receiver = receiver_class('127.0.0.1', udp_port=0, tcp_port=0, batch_seconds=0.05, **options)
+            await receiver.start()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for message in udp_messages:
+                    sock.sendto(message, receiver.udp_address)
+            reader, writer = await asyncio.open_connection(*receiver.tcp_address)
+            writer.write(tcp_stream)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            # Datagrams arrive asynchronously; wait until they are all queued
+            while receiver.received < len(udp_messages) + 3:
+                await asyncio.sleep(0.01)
+            await receiver.stop()
+            return receiver
+
+        return asyncio.run(scenario())
+
+    def test_udp_and_framed_tcp_messages_are_ingested(self):
+        messages = [f'<{8 * 4 + i % 8}>Oct 11 22:14:{i:02d} gw sshd: message {i}' for i in range(50)]
+        octet_counted = '<34>1 2023-10-11T22:14:15Z gw su - - - Failed login from 10.0.0.9\n'.encode()
+        tcp_stream = (
+            str(len(octet_counted)).encode() + b' ' + octet_counted
+            + b'<13>Oct 11 22:14:16 gw app: line framed\n'
+            + b'<13>Oct 11 22:14:17 gw app: unterminated'
+        )
+        receiver = self.receive([message.encode() for message in messages], tcp_stream, batch_size=20)
+
+        self.assertEqual((receiver.written, receiver.dropped, receiver.unmatched), (53, 0, 0))
+        raw_messages = set(LogEntry.objects.filter(source=self.source).values_list('raw_message', flat=True))
+        self.assertEqual(raw_messages, {
+            *messages, octet_counted.decode().strip(),
+            '<13>Oct 11 22:14:16 gw app: line framed', '<13>Oct 11 22:14:17 gw app: unterminated',
+        })
+        self.assertEqual(LogEntry.objects.filter(severity='critical').count(), 21)
+        self.assertEqual(Alert.objects.filter(pattern__name='unauthorized_access').count(), 1)
+
+    def test_unknown_senders_use_the_default_source(self):
+        self.source.address = '10.9.9.9'
+        self.source.save()
+        receiver = self.receive([b'<13>Oct 11 22:14:16 gw app: hello'], b'a\nb\nc\n')
+        self.assertEqual((receiver.written, receiver.unmatched), (0, 4))
+
+        receiver = self.receive([b'<13>Oct 11 22:14:16 gw app: hello'], b'a\nb\nc\n', default_source=self.source)
+        self.assertEqual(receiver.written, 4)
+        self.assertEqual(LogEntry.objects.filter(source=self.source).count(), 4)
+
+    def test_failed_writes_are_retried_then_counted_as_dropped(self):
+        self.addCleanup(setattr, syslog, 'WRITE_RETRY_SECONDS', syslog.WRITE_RETRY_SECONDS)
+        syslog.WRITE_RETRY_SECONDS = 0
+        tcp_stream = b'<13>Oct 11 22:14:16 gw app: a\n<13>Oct 11 22:14:17 gw app: b\n<13>Oct 11 22:14:18 gw app: c\n'
+
+        FlakyReceiver.failures = syslog.WRITE_ATTEMPTS - 1
+        receiver = self.receive([], tcp_stream, receiver_class=FlakyReceiver)
+        self.assertEqual((receiver.written, receiver.dropped), (3, 0))
+        self.assertEqual(LogEntry.objects.filter(source=self.source).count(), 3)
+
+        FlakyReceiver.failures = 1000
+        receiver = self.receive([], tcp_stream, receiver_class=FlakyReceiver)
+        self.assertEqual((receiver.written, receiver.dropped), (0, 3))
+        self.assertEqual(LogEntry.objects.filter(source=self.source).count(), 3)
+
+    def test_stopping_reads_backpressured_senders_to_their_end(self):
+        padding = 'x' * 1000
+        messages = [f'<13>Oct 11 22:{i // 60 % 60:02d}:{i % 60:02d} gw app: {i} {padding}\n' for i in range(3000)]
+
+        async def scenario():
+            receiver = SyslogReceiver('127.0.0.1', udp_port=None, tcp_port=0, queue_size=10, batch_size=100)
+            await receiver.start()
+            reader, writer = await asyncio.open_connection(*receiver.tcp_address)
+            # Far more than the queue, the stream buffer and the socket buffers
+            # hold, so most of it is still with the sender when stopping begins
+            writer.write(''.join(messages).encode())
+            while not receiver.received:
+                await asyncio.sleep(0.01)
+            stopping = asyncio.create_task(receiver.stop())
+            await writer.drain()
+            writer.close()
+            await stopping
+            return receiver
+
+        receiver = asyncio.run(scenario())
+        self.assertEqual((receiver.received, receiver.written, receiver.dropped), (3000, 3000, 0))
+        self.assertEqual(LogEntry.objects.filter(source=self.source).count(), 3000)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        self.other = LogSource.objects.create(name='web', source_type='application')
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES + [
+            '2023-09-07 10:00:00 - ERROR - Failed login attempt for user <script>alert(1)</script>',
+            '2023-09-07 11:00:00 - INFO - Healthcheck failed login probe',
+        ])
+        LogIngestor(self.other).ingest(['2023-09-07 12:00:00 - ERROR - Failed login attempt for user web'])
+
+    def search(self, query, **filters):
+        results, has_next = search_entries(query, **filters)
+        return [entry.raw_message for entry, snippet in results]
+
+    def test_terms_phrases_prefixes_and_exclusions(self):
+        self.assertEqual(len(self.search('failed login')), 5)
+        self.assertEqual(len(self.search('"failed login attempt"')), 3)
+        self.assertEqual(self.search('"192.168.1.101"'), [AUTH_LOG_LINES[1]])
+        self.assertEqual(len(self.search('attempt*')), 4)
+        self.assertEqual(len(self.search('failed login -healthcheck -"user web"')), 3)
+        self.assertEqual(self.search('" ( NOT'), [])
+
+    def test_filters_order_and_pages(self):
+        self.assertEqual(len(self.search('failed', source_id=self.source.id)), 4)
+        self.assertEqual(self.search('failed', severity='low'), [
+            '2023-09-07 11:00:00 - INFO - Healthcheck failed login probe'
+        ])
+        since = datetime(2023, 9, 7, 10, 30, tzinfo=dt_timezone.utc)
+        until = datetime(2023, 9, 7, 11, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(len(self.search('failed', since=since, until=until)), 1)
+        self.assertEqual(self.search('failed', order='newest', per_page=1),
+                         ['2023-09-07 12:00:00 - ERROR - Failed login attempt for user web'])
+
+        results, has_next = search_entries('failed', page=2, per_page=3)
+        self.assertEqual((len(results), has_next), (2, False))
+
+    def test_index_follows_deletes(self):
+        LogEntry.objects.filter(source=self.other).delete()
+        self.assertEqual(len(self.search('failed login')), 4)
+
+    def test_json_and_html_views(self):
+        response = self.client.get('/search/', {'q': 'script', 'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIn('<mark>script</mark>', data['results'][0]['snippet'])
+        self.assertIn('&lt;', data['results'][0]['snippet'])
+
+        response = self.client.get('/search/', {'q': 'failed', 'source': self.other.id})
+        self.assertContains(response, '<mark>Failed</mark> login attempt for user web')
+        self.assertNotContains(response, '<script>alert')
+
+    def test_missing_triggers_are_restored_and_index_rebuilt(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER logs_logentry_fts_insert')
+        LogIngestor(self.other).ingest(['2023-09-08 12:00:00 - ERROR - Quarantined upload'])
+        self.assertEqual(self.search('quarantined'), [])
+
+        self.assertTrue(install_search_index(repair=True))
+        self.assertFalse(install_search_index(repair=True))
+        self.assertEqual(len(self.search('quarantined')), 1)
+
+    def test_admin_search_uses_index(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/logs/logentry/', {'q': '192.168.1.102'})
+        self.assertContains(response, '1 result')
+        self.assertTrue(any('logs_logentry_fts' in query['sql'] for query in queries.captured_queries))
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = LogSource.objects.create(name='auth-server', source_type='server', retention_days=30)
+        self.kept = LogSource.objects.create(name='audit', source_type='server')
+        recent = (timezone.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        self.old_lines = AUTH_LOG_LINES + ['2023-09-07 10:00:00 - ERROR - Failed login attempt for user mallory']
+        self.recent_lines = [f'{recent} - ERROR - Failed login attempt for user eve']
+        LogIngestor(self.source, chunk_size=2).ingest(self.old_lines + self.recent_lines)
+        LogIngestor(self.kept).ingest(AUTH_LOG_LINES)
+
+    def purge(self, *args):
+        output = StringIO()
+        call_command('purge_logs', '--archive-dir', self.directory, '--batch-size', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def raw_messages(self, source):
+        return list(LogEntry.objects.filter(source=source).order_by('id').values_list('raw_message', flat=True))
+
+    def test_purge_archives_and_deletes_expired_rows(self):
+        self.assertIn('auth-server: 4 lines older than', self.purge('--dry-run'))
+        self.assertEqual(LogEntry.objects.count(), 8)
+
+        # The recent line's time-based alerts depend on when the test runs
+        recent_alerts = set(Alert.objects.filter(log_entry__raw_message=self.recent_lines[0]).values_list('id', flat=True))
+        expired_alerts = Alert.objects.filter(log_entry__source=self.source).count() - len(recent_alerts)
+        output = self.purge()
+        self.assertIn(f'auth-server: purged 4 lines and {expired_alerts} alerts', output)
+        self.assertNotIn('audit', output)
+        self.assertEqual(self.raw_messages(self.source), self.recent_lines)
+        self.assertEqual(self.raw_messages(self.kept), AUTH_LOG_LINES)
+        self.assertEqual(
+            set(Alert.objects.filter(log_entry__source=self.source).values_list('id', flat=True)), recent_alerts
+        )
+        self.assertEqual(search_entries('mallory'), ([], False))
+
+        # The rollup matches a recount and keeps no empty hours
+        rollups = sorted(LogRollup.objects.values_list('source_id', 'severity', 'hour', 'log_count', 'open_alert_count'))
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(LogRollup.objects.values_list('source_id', 'severity', 'hour', 'log_count', 'open_alert_count')),
+            rollups
+        )
+
+        archives = sorted(os.listdir(os.path.join(self.directory, f'source-{self.source.id}')))
+        self.assertEqual(archives, ['2023-09-06.ndjson.gz', '2023-09-07.ndjson.gz'])
+        with open_log(os.path.join(self.directory, f'source-{self.source.id}', archives[0])) as archive:
+            rows = [json.loads(line) for line in iter_lines(read_chunks(archive))]
+        self.assertEqual([row['raw_message'] for row in rows], AUTH_LOG_LINES)
+        self.assertEqual(rows[1]['severity'], 'high')
+
+    def test_purge_keeps_alerts_with_surviving_hits(self):
+        source = LogSource.objects.create(name='vpn', source_type='server')
+        lines = [f'2023-09-07 10:{minute}:00 - ERROR - Failed login attempt for user mallory'
+                 for minute in ('00', '10', '20', '30')]
+        LogIngestor(source, chunk_size=2).ingest(lines)
+        alert = Alert.objects.get(source=source, pattern__name='unauthorized_access')
+        self.assertEqual(alert.hit_count, 4)
+        entries = list(LogEntry.objects.filter(source=source).order_by('id').values_list('id', flat=True))
+
+        cutoff = datetime(2023, 9, 7, 10, 15, tzinfo=dt_timezone.utc)
+        counts = purge_source(source, cutoff, batch_size=1)
+        self.assertEqual((counts['entries'], counts['alerts']), (2, 0))
+        alert.refresh_from_db()
+        self.assertEqual(alert.log_entry_id, entries[2])
+        self.assertEqual(alert.hit_count, 2)
+        self.assertEqual(alert.entry_ranges, [[entries[2], entries[3]]])
+        self.assertEqual(alert.first_seen, datetime(2023, 9, 7, 10, 20, tzinfo=dt_timezone.utc))
+
+        rollups = sorted(LogRollup.objects.values_list('source_id', 'severity', 'hour', 'log_count', 'open_alert_count'))
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(LogRollup.objects.values_list('source_id', 'severity', 'hour', 'log_count', 'open_alert_count')),
+            rollups
+        )
+
+        counts = purge_source(source, cutoff + timedelta(hours=1))
+        self.assertEqual((counts['entries'], counts['alerts']), (2, 1))
+        self.assertFalse(Alert.objects.filter(id=alert.id).exists())
+
+    def test_restore_reingests_archives_once(self):
+        LogSource.objects.filter(id=self.source.id).update(retention_days=None)
+        with override_settings(LOG_RETENTION_DAYS=30):
+            self.purge('--source', 'auth-server')
+        output = StringIO()
+        call_command('restore_logs', self.directory, '--source', 'auth-server', stdout=output)
+        self.assertIn('2023-09-06.ndjson.gz: restored 3 lines', output.getvalue())
+        call_command('restore_logs', self.directory, '--source', 'auth-server', stdout=output)
+        self.assertIn('2023-09-06.ndjson.gz: restored 0 lines', output.getvalue())
+
+        self.assertEqual(sorted(self.raw_messages(self.source)), sorted(self.old_lines + self.recent_lines))
+        entry = LogEntry.objects.get(source=self.source, raw_message=AUTH_LOG_LINES[1])
+        self.assertEqual(entry.timestamp, datetime(2023, 9, 6, 8, 32, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(len(self.search_mallory()), 1)
+
+    def search_mallory(self):
+        results, has_next = search_entries('mallory')
+        return results
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.source = LogSource.objects.create(name='auth-server', source_type='server')
+        self.other = LogSource.objects.create(name='web', source_type='application')
+        LogIngestor(self.source).ingest(AUTH_LOG_LINES)
+        LogIngestor(self.other).ingest(['2023-09-07 12:00:00 - ERROR - Failed login attempt for user web'])
+
+    def download(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_entries_csv_filters_and_gzip(self):
+        response, content = self.download('/export/entries/', source=self.source.id, gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(gzip.decompress(content).decode())))
+        self.assertEqual([row['raw_message'] for row in rows], AUTH_LOG_LINES)
+        self.assertEqual({row['source'] for row in rows}, {'auth-server'})
+        self.assertEqual(json.loads(rows[0]['parsed_data'])['severity'], rows[0]['severity'])
+
+        response, content = self.download('/export/entries/', severity='high',
+                                          since='2023-09-07T11:00', until='2023-09-08')
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual([row['source'] for row in rows], ['web'])
+
+        response, content = self.download('/export/entries/', format='ndjson', source=self.other.id)
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(rows[0]['parsed_data']['severity'], 'high')
+
+    def test_alerts_ndjson_by_state(self):
+        alerts = Alert.objects.filter(source=self.source)
+        resolved = alerts.first()
+        Alert.objects.filter(id=resolved.id).update(is_resolved=True, resolved_at=timezone.now())
+
+        response, content = self.download('/export/alerts/', format='ndjson', state='open')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         list(Alert.objects.filter(is_resolved=False).order_by('id').values_list('id', flat=True)))
+        self.assertEqual(rows[0]['pattern'], Alert.objects.get(id=rows[0]['id']).pattern.name)
+
+        response, content = self.download('/export/alerts/', format='ndjson', state='resolved',
+                                          source=self.source.id)
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual([(row['id'], row['is_resolved']) for row in rows], [(resolved.id, True)])
+        self.assertIsNotNone(rows[0]['resolved_at'])
+
+
+class QueryPlanTests(TestCase):
+    """The dashboard, alert list and stats queries must not scan the log tables."""
+
+    def setUp(self):
+        source = LogSource.objects.create(name='auth-server', source_type='server')
+        LogIngestor(source).ingest(AUTH_LOG_LINES * 5)
+
+    def assert_uses_indexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if 'logs_logentry' not in sql and 'logs_alert' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            for step in plan:
+                for table in ('logs_logentry', 'logs_alert'):
+                    if step.startswith(f'SCAN {table}'):
+                        self.assertIn('INDEX', step, f'{step!r} in plan for {sql}')
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, sql)
+
+    def test_dashboard_uses_indexes(self):
+        self.assert_uses_indexes('/')
+
+    def test_view_alerts_uses_indexes(self):
+        self.assert_uses_indexes('/alerts/')
+        alert = Alert.objects.order_by('-created_at', '-id')[3]
+        cursor = quote(f'{alert.created_at.isoformat()}|{alert.id}')
+        self.assert_uses_indexes(f'/alerts/?after={cursor}')
+        self.assert_uses_indexes(f'/alerts/?before={cursor}')
+
+    def test_log_stats_uses_indexes(self):
+        self.assert_uses_indexes('/stats/')
+
+    def test_latest_entries_of_source_use_source_timestamp_index(self):
+        plan = LogEntry.objects.filter(source=LogSource.objects.get())[:50].explain()
+
+        self.assertIn('logs_entry_source_ts_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class IterLinesTests(SimpleTestCase):
+    def test_reassembles_lines_and_characters_across_chunks(self):
+        data = 'first line\r\nsecond café line\rthird\n\nlast'.encode('utf-8')
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+
+        self.assertEqual(list(iter_lines(chunks)), data.decode('utf-8').splitlines())
+
+    def test_open_log_detects_compression_by_magic_bytes(self):
+        data = b'line one\nline two\n' * 1000
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for expected, compress in (('gzip', gzip.compress), ('bz2', bz2.compress),
+                                   ('xz', lzma.compress), (None, bytes)):
+            # Misleading extension: only the content decides
+            path = os.path.join(directory, f'{expected}.log')
+            with open(path, 'wb') as log_file:
+                log_file.write(compress(data))
+
+            self.assertEqual(detect_compression(path), expected)
+            with open_log(path) as log_file:
+                chunks = list(read_chunks(log_file, size=4096))
+            self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+            self.assertEqual(b''.join(chunks), data)
+
+    def test_invalid_utf8_raises_decode_error(self):
+        with self.assertRaises(UnicodeDecodeError):
+            list(iter_lines([b'ok\n', b'\xff\xfe\n']))
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_generated_lines_have_requested_threat_density(self):
+        parser = LogParser()
+        for log_format in ('standard', 'syslog', 'json_log'):
+            lines = generate_lines(log_format, 400, threat_density=0.25, seed=1)
+            self.assertEqual(lines, generate_lines(log_format, 400, threat_density=0.25, seed=1))
+            parsed = [parser.parse_line(line) for line in lines]
+            self.assertEqual(parser.last_format[0], log_format)
+            with_threats = sum(bool(parser.threat_matcher.match(data['message'])) for data in parsed)
+            self.assertAlmostEqual(with_threats / len(lines), 0.25, delta=0.06)
+
+    def test_json_report(self):
+        output = StringIO()
+        call_command('benchmark_logs', 'parse', 'detect', '--lines', '50', '--repeat', '1',
+                     '--formats', 'standard', 'apache_combined', '--json', stdout=output)
+
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['options']['lines'], 50)
+        self.assertEqual(
+            [row['name'] for row in report['results']],
+            ['parse_line standard', 'parse_line apache_combined',
+             'detect_threats standard', 'detect_threats apache_combined']
+        )
+        for row in report['results']:
+            self.assertGreater(row['lines_per_second'], 0)
+            self.assertIn('p99_us', row)
+            self.assertIn('peak_memory_bytes', row)
+
+
+class LogParserTests(SimpleTestCase):
+    def test_dispatcher_matches_sequential_format_loop(self):
+        parser = LogParser()
+        lines = [line for samples in SAMPLE_LINES.values() for line in samples]
+        lines += ['free text without a known format', '  {"message": "not json"  ', '12 05 10:00:00 host msg']
+        for line in lines:
+            expected = legacy_parse_line(LogParser(), line)
+            parsed = parser.parse_line(line)
+            if expected['level'] == 'unknown' and 'raw_data' not in expected:
+                # Unknown lines are stamped with now(); compare the rest
+                expected.pop('timestamp')
+                parsed.pop('timestamp')
+            self.assertEqual(parsed, expected, line)
+
+    def test_remembers_last_matching_format(self):
+        parser = LogParser()
+        parser.parse_line(SAMPLE_LINES['json_log'][0])
+        self.assertEqual(parser.last_format[0], 'json_log')
+
+        parser.parse_line(SAMPLE_LINES['standard'][0])
+        self.assertEqual(parser.last_format[0], 'standard')
+
+    def test_syslog_line_keeps_timestamp_and_hostname(self):
+        parsed = LogParser(timestamps=TimestampParser(year=2023)).parse_line('Sep 06 08:30:25 webhost sshd started')
+
+        self.assertEqual(parsed['timestamp'], datetime(2023, 9, 6, 8, 30, 25, tzinfo=parsed['timestamp'].tzinfo))
+        self.assertEqual(parsed['hostname'], 'webhost')
+        self.assertEqual(parsed['message'], 'sshd started')
+
+    def test_apache_access_lines(self):
+        parser = LogParser()
+        common = '10.1.2.3 - jsmith [06/Sep/2023:08:30:25 -0700] "GET /etc/passwd HTTP/1.1" 404 -'
+        combined = ('10.1.2.4 - - [06/Sep/2023:08:30:26 -0700] "GET /search?q=1%20union%20select%20x HTTP/1.1" '
+                    '500 2326 "https://ehr.example.org/" "sqlmap/1.7"')
+
+        parsed = parser.parse_line(common)
+        self.assertEqual(parser.last_format[0], 'apache_common')
+        self.assertEqual(parsed['timestamp'], datetime(2023, 9, 6, 15, 30, 25, tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            {key: parsed[key] for key in ('client_ip', 'user', 'method', 'path', 'status', 'bytes', 'severity')},
+            {'client_ip': '10.1.2.3', 'user': 'jsmith', 'method': 'GET', 'path': '/etc/passwd',
+             'status': 404, 'bytes': 0, 'severity': 'medium'}
+        )
+        self.assertNotIn('user_agent', parsed)
+
+        # The common format must not claim a combined line, even right after one
+        parsed = parser.parse_line(combined)
+        self.assertEqual(parser.last_format[0], 'apache_combined')
+        self.assertEqual((parsed['status'], parsed['bytes'], parsed['severity']), (500, 2326, 'high'))
+        self.assertEqual(parsed['user_agent'], 'sqlmap/1.7')
+        self.assertEqual(parsed['message'], 'GET /search?q=1 union select x HTTP/1.1')
+        self.assertEqual(
+            [threat['pattern'] for threat in parser.threat_matcher.match(parsed['message'])], ['sql_injection']
+        )
+
+    def test_generated_apache_corpora_parse(self):
+        for log_format in ('apache_common', 'apache_combined'):
+            parser = LogParser()
+            for line in generate_lines(log_format, 200):
+                parser.parse_line(line)
+                self.assertEqual(parser.last_format[0], log_format, line)
+
+
+class TimestampParserTests(SimpleTestCase):
+    def test_standard_matches_strptime(self):
+        timestamps = TimestampParser()
+        for text in ('2023-09-06 08:30:25', '2024-02-29 23:59:59', '2023-09-06 08:30:25'):
+            self.assertEqual(timestamps.standard(text), legacy_parse_timestamp(text))
+
+    def test_invalid_values_raise_value_error(self):
+        timestamps = TimestampParser(year=2023)
+        for parse, text in (
+            (timestamps.standard, '2023-02-30 08:30:25'),
+            (timestamps.syslog, 'Feb 29 08:30:25'),
+            (timestamps.syslog, 'Foo 06 08:30:25'),
+            (timestamps.iso, 'yesterday'),
+            (timestamps.clf, '31/Sep/2023:08:30:25 +0000'),
+            (timestamps.clf, '06/Sep/2023:08:30:25 0000'),
+            (timestamps.clf, '06/Sep/2023 08:30:25 +0000'),
+        ):
+            with self.assertRaises(ValueError):
+                parse(text)
+
+    def test_iso_keeps_explicit_offsets(self):
+        value = TimestampParser().iso('2023-09-06T08:30:25Z')
+
+        self.assertEqual(value, datetime(2023, 9, 6, 8, 30, 25, tzinfo=dt_timezone.utc))
+        self.assertEqual(value.utcoffset(), timedelta(0))
+
+    def test_syslog_year_follows_the_clock(self):
+        class Clock(TimestampParser):
+            date = datetime(2025, 12, 31).date()
+
+            def today(self):
+                return self.date
+
+        timestamps = Clock(tzinfo=dt_timezone.utc)
+        self.assertEqual(timestamps.syslog('Dec 31 23:59:59').year, 2025)
+        # The same parser, still running after New Year
+        Clock.date = datetime(2026, 1, 1).date()
+        self.assertEqual(timestamps.syslog('Jan 01 00:00:01'), datetime(2026, 1, 1, 0, 0, 1, tzinfo=dt_timezone.utc))
+        # A late line from December belongs to the year before
+        self.assertEqual(timestamps.syslog('Dec 31 23:59:58').year, 2025)
+        self.assertEqual(Clock(year=2023).syslog('Jan 01 00:00:01').year, 2023)
+
+    def test_clf_seconds_of_the_same_minute(self):
+        timestamps = TimestampParser()
+        for text in ('06/Sep/2023:08:30:25 +0200', '06/Sep/2023:08:30:59 +0200', '06/Sep/2023:08:30:07 -0500',
+                     '06/Sep/2023:08:31:00 -0500', '06/Sep/2023:08:31:00 -0500'):
+            self.assertEqual(timestamps.clf(text), datetime.strptime(text, '%d/%b/%Y:%H:%M:%S %z'), text)
+        with self.assertRaises(ValueError):
+            timestamps.clf('06/Sep/2023:08:31:60 -0500')
+
+
+class ThreatMatcherTests(SimpleTestCase):
+    def test_matches_per_pattern_loop_without_placeholders(self):
+        matcher = ThreatMatcher.from_patterns(THREAT_PATTERNS)
+        messages = SAMPLE_MESSAGES + [
+            'Root access granted after sudo command; firewall port open; export of medical record',
+            'UNION ALL SELECT password FROM users -- config.php read from /etc/passwd',
+            'multiple failed logins, then FAILED LOGIN again',
+            '',
+        ]
+        for message in messages:
+            expected = [
+                threat for threat in legacy_detect_threats(message)
+                if threat['pattern'] not in ('after_hours_access', 'weekend_access')
+            ]
+            self.assertEqual(matcher.match(message), expected, message)
+
+    def test_overlapping_rules_at_same_position(self):
+        matcher = ThreatMatcher([
+            ('short', r'(admin)', 'low', 'short'),
+            ('long', r'(admin access)', 'high', 'long'),
+            ('tail', r'access$', 'low', 'tail'),
+        ])
+
+        self.assertEqual([t['pattern'] for t in matcher.match('Admin access')], ['short', 'long', 'tail'])
+
+    def test_rules_referring_to_groups_are_searched_alone(self):
+        matcher = ThreatMatcher([
+            ('repeat', r'(ab)\1', 'high', 'repeat'),
+            ('other', r'(x)y', 'low', 'other'),
+            ('named', r'(?P<word>cd)(?P=word)', 'high', 'named'),
+            ('again', r'(?P<word>ef)', 'low', 'again'),
+        ])
+
+        self.assertEqual([t['pattern'] for t in matcher.match('abab')], ['repeat'])
+        self.assertEqual([t['pattern'] for t in matcher.match('xy cdcd ef')], ['other', 'named', 'again'])
+        self.assertIsNotNone(matcher.combined)
+        self.assertFalse(refers_to_groups(r'a\\1'))
+
+    def test_mixed_case_patterns_use_ignorecase(self):
+        matcher = ThreatMatcher([('word', r'\bDROP\b', 'high', 'drop')])
+
+        self.assertFalse(matcher.fold_case)
+        self.assertEqual(len(matcher.match('please drop it')), 1)
+
+    def test_strip_outer_group(self):
+        self.assertEqual(strip_outer_group('(a|b)'), 'a|b')
+        self.assertEqual(strip_outer_group('(a)|(b)'), '(a)|(b)')
+        self.assertEqual(strip_outer_group('(a)b'), '(a)b')
+        self.assertEqual(strip_outer_group('([)]|\\))'), '[)]|\\)')
+        self.assertEqual(strip_outer_group('(?:a|b)'), '(?:a|b)')
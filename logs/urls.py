@@ -8,5 +8,11 @@ urlpatterns = [
     path('upload/', views.upload_logs, name='upload_logs'),
     path('alerts/', views.view_alerts, name='view_alerts'),
     path('alerts/<int:alert_id>/resolve/', views.resolve_alert, name='resolve_alert'),
+    path('alerts/triage/', views.triage_alerts, name='triage_alerts'),
+    path('search/', views.search_logs, name='search_logs'),
+    path('export/entries/', views.export_entries, name='export_entries'),
+    path('export/alerts/', views.export_alerts, name='export_alerts'),
     path('stats/', views.log_stats, name='log_stats'),
+    path('metrics/', views.log_metrics, name='log_metrics'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
 ]
@@ -1,5 +1,6 @@
 # logs/utils/__init__.py
-from .patterns import THREAT_PATTERNS, LOG_FORMATS, SEVERITY_MAP
+from .patterns import THREAT_PATTERNS, LOG_FORMATS, SEVERITY_MAP, CORRELATION_RULES
 from .log_parser import LogParser
+from .threats import ThreatMatcher
 
-__all__ = ['THREAT_PATTERNS', 'LOG_FORMATS', 'SEVERITY_MAP', 'LogParser']
+__all__ = ['THREAT_PATTERNS', 'LOG_FORMATS', 'SEVERITY_MAP', 'CORRELATION_RULES', 'LogParser', 'ThreatMatcher']
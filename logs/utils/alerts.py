@@ -0,0 +1,160 @@
+# logs/utils/alerts.py
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+
+from ..models import Alert
+
+DEFAULT_BUCKET_SECONDS = 3600
+# Hits are counted past this, but provenance stops being recorded
+MAX_ENTRY_RANGES = 1000
+
+
+def alert_bucket(timestamp, seconds=DEFAULT_BUCKET_SECONDS):
+    """Return the start of the UTC-aligned ``seconds`` bucket holding ``timestamp``."""
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def add_entry_range(ranges, first, last):
+    """Append the ids ``first..last`` to ``ranges``, extending the last run when adjacent."""
+    if ranges and ranges[-1][0] <= first <= ranges[-1][1] + 1:
+        ranges[-1][1] = max(ranges[-1][1], last)
+    elif len(ranges) < MAX_ENTRY_RANGES:
+        ranges.append([first, last])
+
+
+def remove_entry_ids(ranges, removed):
+    """Return ``ranges`` without the ids in the sorted list ``removed``."""
+    kept = []
+    for first, last in ranges:
+        for entry_id in removed[bisect_left(removed, first):bisect_right(removed, last)]:
+            if first < entry_id:
+                kept.append([first, entry_id - 1])
+            first = entry_id + 1
+        if first <= last:
+            kept.append([first, last])
+    return kept
+
+
+def range_size(ranges):
+    return sum(last - first + 1 for first, last in ranges)
+
+
+def entry_ids(alert):
+    """Return the ``LogEntry`` ids recorded for ``alert``."""
+    return [
+        entry_id
+        for first, last in alert.entry_ranges
+        for entry_id in range(first, last + 1)
+    ]
+
+
+class AlertAggregator:
+    """Collect one chunk's threat hits per (pattern, bucket) and write them.
+
+    ``add`` folds a hit into an unsaved ``Alert``; ``save`` adds the
+    collected hits to the source's open alerts for the same keys in one
+    ``SELECT`` plus one ``bulk_update``, and creates the rest with one
+    ``bulk_create``.
+
+    The ``SELECT`` locks the open alerts it finds where the database
+    supports ``select_for_update`` (SQLite does not; it runs one writer at
+    a time). Nothing locks an alert that does not exist yet, so another
+    writer may open the same one first; ``logs_alert_open_bucket_unique``
+    then rejects the ``bulk_create`` and the hits are merged into that
+    alert instead (``create_or_merge``).
+    """
+
+    def __init__(self, source, bucket_seconds=DEFAULT_BUCKET_SECONDS):
+        self.source = source
+        self.bucket_seconds = bucket_seconds
+        self.alerts = {}
+        self.hits = 0
+
+    def add(self, entry, pattern_id, description):
+        key = (pattern_id, alert_bucket(entry.timestamp, self.bucket_seconds))
+        alert = self.alerts.get(key)
+        if alert is None:
+            alert = self.alerts[key] = Alert(
+                source=self.source, log_entry=entry, pattern_id=pattern_id, bucket=key[1],
+                description=description, hit_count=0,
+                first_seen=entry.timestamp, last_seen=entry.timestamp, entry_ranges=[]
+            )
+        alert.hit_count += 1
+        alert.first_seen = min(alert.first_seen, entry.timestamp)
+        alert.last_seen = max(alert.last_seen, entry.timestamp)
+        add_entry_range(alert.entry_ranges, entry.id, entry.id)
+        self.hits += 1
+
+    def save(self):
+        """Write the collected hits and return the alerts that were created."""
+        if not self.alerts:
+            return []
+        existing = self.open_alerts()
+
+        updated = []
+        created = []
+        for key, alert in self.alerts.items():
+            current = existing.get(key)
+            if current is None:
+                created.append(alert)
+                continue
+            current.hit_count += alert.hit_count
+            current.first_seen = min(current.first_seen, alert.first_seen)
+            current.last_seen = max(current.last_seen, alert.last_seen)
+            for first, last in alert.entry_ranges:
+                add_entry_range(current.entry_ranges, first, last)
+            updated.append(current)
+
+        Alert.objects.bulk_update(updated, ['hit_count', 'first_seen', 'last_seen', 'entry_ranges'])
+        try:
+            with transaction.atomic():
+                return Alert.objects.bulk_create(created)
+        except IntegrityError:
+            for alert in created:
+                alert.pk = None
+            return [alert for alert in created if self.create_or_merge(alert)]
+
+    def open_alerts(self):
+        """Return the source's open alerts for the collected keys, locked, by ``(pattern_id, bucket)``."""
+        return {
+            (alert.pattern_id, alert.bucket): alert
+            for alert in Alert.objects.select_for_update().filter(
+                source=self.source, is_resolved=False,
+                pattern_id__in={pattern_id for pattern_id, bucket in self.alerts},
+                bucket__in={bucket for pattern_id, bucket in self.alerts},
+            ).only('id', 'pattern_id', 'bucket', 'hit_count', 'first_seen', 'last_seen', 'entry_ranges')
+        }
+
+    def create_or_merge(self, alert):
+        """Insert ``alert``, or add its hits to the open alert another writer created; return whether inserted.
+
+        Counts and times are merged with ``F()`` expressions, so they add to
+        whatever the other writer has stored.
+        """
+        while True:
+            try:
+                with transaction.atomic():
+                    alert.save(force_insert=True)
+                return True
+            except IntegrityError:
+                alert.pk = None
+            current = Alert.objects.filter(
+                source=self.source, pattern_id=alert.pattern_id, bucket=alert.bucket, is_resolved=False
+            )
+            merged = current.update(
+                hit_count=F('hit_count') + alert.hit_count,
+                first_seen=Least('first_seen', Value(alert.first_seen)),
+                last_seen=Greatest('last_seen', Value(alert.last_seen)),
+            )
+            # Otherwise it was resolved in the meantime; try to open it again
+            if merged:
+                current = current.select_for_update().only('id', 'entry_ranges').get()
+                for first, last in alert.entry_ranges:
+                    add_entry_range(current.entry_ranges, first, last)
+                current.save(update_fields=['entry_ranges'])
+                return False
@@ -0,0 +1,90 @@
+# logs/utils/checkpoints.py
+import os
+import sys
+
+from ..models import IngestCheckpoint
+from .ingest import LogIngestor
+from .readers import detect_compression, iter_lines, open_log
+
+# Bytes of log written per transaction by ingest_file
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+def read_blocks(log_file, block_size=DEFAULT_BLOCK_SIZE, final=True):
+    """Yield ``(data, end)`` blocks of about ``block_size`` bytes from the current position.
+
+    Every block ends just after a ``b'\\n'`` and ``end`` is the stream
+    position just past it, so a block boundary is always a safe place to
+    resume from. An unterminated last line is yielded as a block of its
+    own when ``final`` is true and held back otherwise, for files that are
+    still being written.
+    """
+    position = log_file.tell()
+    pending = b''
+    while True:
+        data = log_file.read(block_size)
+        if not data:
+            break
+        data = pending + data
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            pending = data
+            continue
+        pending = data[cut:]
+        position += cut
+        yield data[:cut], position
+    if pending and final:
+        yield pending, position + len(pending)
+
+
+def resume_offset(checkpoint, stat, compression):
+    """Return the offset to resume ``checkpoint``'s file from, or ``None`` if it is done.
+
+    A different inode means the path now names another file, and a plain
+    file shorter than the offset was truncated; both start over. Archives
+    are only ever read whole, so a changed size means it was rewritten.
+    """
+    if checkpoint.inode != stat.st_ino:
+        return 0
+    if compression is not None:
+        if checkpoint.size != stat.st_size:
+            return 0
+        return None if checkpoint.completed else checkpoint.offset
+    if stat.st_size < checkpoint.offset:
+        return 0
+    return checkpoint.offset
+
+
+def ingest_file(source, path, block_size=DEFAULT_BLOCK_SIZE, restart=False):
+    """Ingest ``path`` for ``source`` from its checkpoint; return ``(lines, alerts, start_offset)``.
+
+    Each block of lines is written in one transaction together with the
+    checkpoint just past it, so after a crash the next run resumes exactly
+    where the last committed block ended. ``start_offset`` is ``None`` when
+    the file was already ingested completely.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    compression = detect_compression(path)
+    checkpoint, created = IngestCheckpoint.objects.get_or_create(source=source, path=path)
+    start = 0 if restart else resume_offset(checkpoint, stat, compression)
+    if start is None:
+        return 0, 0, None
+    base_line_count = checkpoint.line_count if start else 0
+    position = start
+
+    def save_checkpoint(ingestor, completed=False):
+        IngestCheckpoint.objects.filter(id=checkpoint.id).update(
+            inode=stat.st_ino, size=stat.st_size, offset=position,
+            line_count=base_line_count + ingestor.line_count, completed=completed
+        )
+
+    # Blocks are bounded in bytes; one flush, and one checkpoint, per block
+    ingestor = LogIngestor(source, chunk_size=sys.maxsize, on_flush=save_checkpoint, resume=bool(start))
+    with open_log(path, compression) as log_file:
+        # Archives seek forward by decompressing and discarding
+        log_file.seek(start)
+        for data, position in read_blocks(log_file, block_size):
+            ingestor.ingest(iter_lines([data]))
+    save_checkpoint(ingestor, completed=True)
+    return ingestor.line_count, ingestor.alert_count, start
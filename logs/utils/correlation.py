@@ -0,0 +1,91 @@
+# logs/utils/correlation.py
+import re
+from collections import defaultdict, deque
+from datetime import timedelta
+
+
+class CorrelationEngine:
+    """Raise threats when one key triggers a rule often within a time window.
+
+    Records are fed in log order through ``observe``. Every (rule, key) pair
+    keeps a deque of at most ``threshold`` timestamps, so memory grows with
+    the number of keys seen within the longest window and nothing else;
+    windows whose newest event is older than their rule's window are swept
+    once per window length of log time. A rule fires on the event that
+    completes ``threshold`` hits within ``window`` seconds and then starts
+    counting afresh for that key.
+
+    The threat's description names the rule, not the key: ingestion merges
+    the firings of a rule within one time bucket into one alert, whatever
+    key fired. The alert's entries show which keys those were.
+    """
+
+    def __init__(self, rules, enabled=None):
+        self.rules = defaultdict(list)
+        for name, data in rules.items():
+            self.rules[data['trigger']].append({
+                'name': name,
+                'key': re.compile(data['key'], re.IGNORECASE),
+                'threshold': data['threshold'],
+                'window': timedelta(seconds=data['window']),
+                'severity': data['severity'],
+                'description': data['description'],
+            })
+        self.window_lengths = {
+            rule['name']: rule['window'] for rules in self.rules.values() for rule in rules
+        }
+        self.max_window = max(self.window_lengths.values(), default=timedelta(0))
+        # Names of the rules to apply; None applies all of them
+        self.enabled = enabled
+        self.windows = {}
+        self.last_sweep = None
+
+    def observe(self, log_data, threats):
+        """Return the correlated threats raised by one parsed record."""
+        correlated = []
+        timestamp = log_data['timestamp']
+        for threat in threats:
+            for rule in self.rules.get(threat['pattern'], ()):
+                if self.enabled is not None and rule['name'] not in self.enabled:
+                    continue
+                found = rule['key'].search(log_data['message'])
+                if found is None:
+                    continue
+                if self.hit(rule, found.group(1), timestamp):
+                    correlated.append({
+                        'pattern': rule['name'],
+                        'severity': rule['severity'],
+                        'description': (
+                            f"{rule['description']} ({rule['threshold']} "
+                            f"in {int(rule['window'].total_seconds())}s)"
+                        ),
+                    })
+
+        if self.last_sweep is None:
+            self.last_sweep = timestamp
+        elif self.windows and timestamp - self.last_sweep >= self.max_window:
+            self.sweep(timestamp)
+        return correlated
+
+    def hit(self, rule, key, timestamp):
+        window_key = (rule['name'], key)
+        window = self.windows.get(window_key)
+        if window is None:
+            window = self.windows[window_key] = deque(maxlen=rule['threshold'])
+        window.append(timestamp)
+        if len(window) == rule['threshold'] and timestamp - window[0] <= rule['window']:
+            del self.windows[window_key]
+            return True
+        return False
+
+    def sweep(self, now):
+        """Drop the windows with no event inside their rule's window."""
+        self.windows = {
+            key: events for key, events in self.windows.items()
+            if now - events[-1] <= self.window_lengths[key[0]]
+        }
+        self.last_sweep = now
+
+    @property
+    def active_keys(self):
+        return len(self.windows)
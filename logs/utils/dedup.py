@@ -0,0 +1,178 @@
+# logs/utils/dedup.py
+import logging
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from hashlib import blake2b
+
+from django.db.models import Count
+
+from ..models import LogEntry
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Bits per expected line and probes per hash: about a 1% false-positive rate
+BLOOM_BITS_PER_ITEM = 10
+BLOOM_PROBES = 7
+BLOOM_MIN_CAPACITY = 1 << 16
+# Hashes fetched per round trip while a filter is loaded
+LOAD_CHUNK_SIZE = 10000
+# Distinct lines whose repeats ContentHasher counts, about 100 bytes each;
+# past this the lines first seen longest ago are forgotten
+TRACKED_LINES = 1000000
+# Distinct lines numbered before a file's first timestamp; later ones get no hash
+UNTIMED_LINES = 100000
+
+# Per-process filters, keyed by source id
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def content_hash(timestamp, raw_message, occurrence=0):
+    """Return the signed 64-bit hash that identifies a line within its source.
+
+    The timestamp is taken as an instant, so the same line parsed with a
+    different offset or time zone hashes the same; ``None`` stands for a
+    line without one. ``occurrence`` tells identical lines with the same
+    timestamp apart.
+    """
+    micros = (timestamp - EPOCH) // MICROSECOND if timestamp is not None else ''
+    data = f'{micros}\x1f{occurrence}\x1f{raw_message}'.encode('utf-8', 'surrogatepass')
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+class ContentHasher:
+    """Hash lines in log order, numbering repeats of a line within one timestamp.
+
+    A burst of identical lines in the same second (a brute-force attempt,
+    say) is several events, not duplicates; the nth repeat gets the same
+    hash in every file it appears in, so only re-uploads are skipped.
+    Repeats are counted for the whole ingestion, however far apart, up to
+    ``TRACKED_LINES`` distinct lines.
+
+    A line without a time of its own (``received``) is numbered under the
+    timestamp of the last line that had one, which is the same on every
+    upload of the file, or under no time before the first such line.
+    Such a line gets no hash, and is never taken for a duplicate, past
+    ``UNTIMED_LINES`` distinct lines under no time, or when it would be
+    numbered on from stored lines: those are stored with the time they
+    were parsed, so they cannot be looked up.
+
+    With ``resume_source_id`` the lines continue what that source already
+    stores (a file resumed from its checkpoint, a live stream), so repeats
+    are numbered on from the stored lines with the same timestamp. That
+    is looked up for each new timestamp until one has no stored lines:
+    everything after it is newer than the stored lines.
+    """
+
+    def __init__(self, resume_source_id=None):
+        # {hash of a line's first occurrence: occurrences so far}, oldest first
+        self.repeats = {}
+        self.resume_source_id = resume_source_id
+        self.resuming = resume_source_id is not None
+        # Timestamps whose stored lines were counted, and those that had some
+        self.checked = set()
+        self.seeded = set()
+        self.last_timestamp = None
+        self.untimed = 0
+
+    def __call__(self, timestamp, raw_message, received=False):
+        if received:
+            timestamp = self.last_timestamp
+            if timestamp is None:
+                if self.resuming or self.untimed >= UNTIMED_LINES:
+                    return None
+            elif timestamp in self.seeded:
+                return None
+        else:
+            self.last_timestamp = timestamp
+        if self.resume_source_id is not None and timestamp is not None and timestamp not in self.checked:
+            self.count_stored(timestamp)
+
+        first = content_hash(timestamp, raw_message)
+        occurrence = self.repeats.get(first, 0)
+        if not occurrence:
+            if timestamp is None:
+                self.untimed += 1
+            if len(self.repeats) >= TRACKED_LINES:
+                del self.repeats[next(iter(self.repeats))]
+        self.repeats[first] = occurrence + 1
+        return content_hash(timestamp, raw_message, occurrence) if occurrence else first
+
+    def count_stored(self, timestamp):
+        """Count the source's stored lines with ``timestamp`` as earlier occurrences."""
+        self.checked.add(timestamp)
+        counts = (
+            LogEntry.objects.filter(source_id=self.resume_source_id, timestamp=timestamp)
+            .values_list('raw_message').annotate(count=Count('id')).order_by()
+        )
+        for raw_message, count in counts:
+            self.repeats[content_hash(timestamp, raw_message)] = count
+            self.seeded.add(timestamp)
+        if timestamp not in self.seeded:
+            self.resume_source_id = None
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter over 64-bit hashes.
+
+    The probes are derived from the hash itself (double hashing), so no
+    further hashing is done per line.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, BLOOM_MIN_CAPACITY)
+        self.size = self.capacity * BLOOM_BITS_PER_ITEM
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        value &= 0xFFFFFFFFFFFFFFFF
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        size = self.size
+        return [(first + probe * second) % size for probe in range(BLOOM_PROBES)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self.positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+def load_filter(source_id):
+    """Build a filter holding every stored hash of a source.
+
+    Sized from a count first, then filled from one streamed scan of the
+    unique index, so only the filter's bits are held in memory.
+    """
+    hashes = LogEntry.objects.filter(source_id=source_id, content_hash__isnull=False)
+    bloom = BloomFilter(2 * hashes.count())
+    for value in hashes.values_list('content_hash', flat=True).iterator(chunk_size=LOAD_CHUNK_SIZE):
+        bloom.add(value)
+    logger.debug("Loaded %d content hashes for source %s", bloom.count, source_id)
+    return bloom
+
+
+def get_filter(source_id):
+    """Return this process's filter for a source, building or growing it when needed."""
+    with _filters_lock:
+        bloom = _filters.get(source_id)
+        if bloom is None or bloom.full:
+            bloom = _filters[source_id] = load_filter(source_id)
+        return bloom
+
+
+def forget_filter(source_id):
+    """Drop a source's filter, so the next lookup reloads it from the database."""
+    with _filters_lock:
+        _filters.pop(source_id, None)
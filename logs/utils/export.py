@@ -0,0 +1,141 @@
+# logs/utils/export.py
+import csv
+import io
+import json
+
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils.text import compress_sequence
+
+from ..models import Alert, LogEntry, LogSource
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+ALERT_STATES = ('open', 'resolved')
+# Rows fetched per database round trip and sent per streamed chunk
+EXPORT_CHUNK_SIZE = 2000
+
+ENTRY_COLUMNS = ['id', 'timestamp', 'source', 'severity', 'raw_message', 'parsed_data']
+ALERT_COLUMNS = [
+    'id', 'created_at', 'source', 'pattern', 'severity', 'description', 'hit_count',
+    'first_seen', 'last_seen', 'log_entry_id', 'is_resolved', 'resolved_by', 'resolved_at',
+]
+# Columns read as JSON text, which is written out as it is rather than
+# decoded and encoded again for every row
+JSON_COLUMNS = {'parsed_data'}
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def entry_rows(source_id=None, severity=None, since=None, until=None):
+    """Yield the matching ``LogEntry`` rows as tuples of ``ENTRY_COLUMNS`` values.
+
+    Rows are read with ``values_list`` in chunks of ``EXPORT_CHUNK_SIZE``,
+    so no model is built and memory does not grow with the export. They
+    come in the order of the index that serves the filters, so nothing is
+    sorted before the first row: by time for a source or a time range,
+    otherwise by id, which the severity index holds as well.
+    """
+    entries = LogEntry.objects.all()
+    if source_id is not None:
+        entries = entries.filter(source_id=source_id)
+    if severity:
+        entries = entries.filter(severity=severity)
+    if since is not None:
+        entries = entries.filter(timestamp__gte=since)
+    if until is not None:
+        entries = entries.filter(timestamp__lt=until)
+    ordering = 'timestamp' if source_id is not None or since is not None or until is not None else 'id'
+
+    # A handful of sources; looked up here rather than joined for every row
+    source_names = dict(LogSource.objects.values_list('id', 'name'))
+    rows = (
+        entries.order_by(ordering)
+        .values_list('id', 'timestamp', 'source_id', 'severity', 'raw_message',
+                     Cast('parsed_data', TextField()))
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for entry_id, timestamp, entry_source_id, entry_severity, raw_message, parsed_data in rows:
+        yield (entry_id, timestamp.isoformat(), source_names.get(entry_source_id), entry_severity,
+               raw_message, parsed_data)
+
+
+def alert_rows(source_id=None, severity=None, since=None, until=None, state=None):
+    """Yield the matching ``Alert`` rows, oldest first, as tuples of ``ALERT_COLUMNS`` values.
+
+    ``since`` and ``until`` bound ``created_at``; ``state`` is ``open``,
+    ``resolved`` or ``None`` for both.
+    """
+    alerts = Alert.objects.all()
+    if source_id is not None:
+        alerts = alerts.filter(source_id=source_id)
+    if severity:
+        alerts = alerts.filter(log_entry__severity=severity)
+    if since is not None:
+        alerts = alerts.filter(created_at__gte=since)
+    if until is not None:
+        alerts = alerts.filter(created_at__lt=until)
+    if state in ALERT_STATES:
+        alerts = alerts.filter(is_resolved=state == 'resolved')
+
+    rows = (
+        alerts.order_by('id')
+        .values_list('id', 'created_at', 'source__name', 'pattern__name', 'log_entry__severity',
+                     'description', 'hit_count', 'first_seen', 'last_seen', 'log_entry_id',
+                     'is_resolved', 'resolved_by__username', 'resolved_at')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for (alert_id, created_at, source_name, pattern_name, alert_severity, description, hit_count,
+         first_seen, last_seen, log_entry_id, is_resolved, resolved_by, resolved_at) in rows:
+        yield (alert_id, created_at.isoformat(), source_name, pattern_name, alert_severity, description,
+               hit_count, isoformat(first_seen), isoformat(last_seen), log_entry_id, is_resolved,
+               resolved_by, isoformat(resolved_at))
+
+
+def csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # The header goes out before the query runs
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, rows):
+    plain = [index for index, column in enumerate(columns) if column not in JSON_COLUMNS]
+    nested = [(index, json.dumps(column)) for index, column in enumerate(columns) if column in JSON_COLUMNS]
+    lines = []
+    for row in rows:
+        line = json.dumps({columns[index]: row[index] for index in plain}, ensure_ascii=False)
+        if nested:
+            # Splice the JSON text columns into the object
+            line = line[:-1] + ''.join(f', {key}: {row[index] or "null"}' for index, key in nested) + '}'
+        lines.append(line)
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_chunks(columns, rows, export_format='csv', compress=False):
+    """Serialise ``rows`` as CSV (with a header) or NDJSON, in chunks of bytes.
+
+    With ``compress`` the chunks are one gzip stream, sent as the
+    compressor fills its buffer; its header goes out straight away.
+    """
+    chunks = ndjson_chunks(columns, rows) if export_format == 'ndjson' else csv_chunks(columns, rows)
+    chunks = (chunk.encode('utf-8') for chunk in chunks)
+    return compress_sequence(chunks) if compress else chunks
@@ -0,0 +1,167 @@
+# logs/utils/follow.py
+import logging
+import os
+import sys
+import time
+
+from ..models import IngestCheckpoint
+from .ingest import LogIngestor
+from .readers import READ_SIZE, iter_lines
+
+logger = logging.getLogger(__name__)
+
+
+class LogFollower:
+    """Tail a live log file into the database in small batches.
+
+    ``poll`` reads whatever was appended since the last call and queues the
+    complete lines; a batch is written as soon as it holds ``batch_lines``
+    lines, so a long backlog is read and written batch by batch, or once
+    its oldest line has waited ``batch_seconds``. Every batch is written
+    in one transaction with the source's ``IngestCheckpoint``, so a
+    restarted follower continues after the last written line.
+
+    Rotation is noticed when the path names a new inode: the old file is
+    read to its end first, then the new one from its start. A file that
+    shrinks below the current offset was truncated and is read again from
+    the start. The same holds across restarts: a checkpoint that no longer
+    matches the file (rotated or truncated while the follower was down)
+    means the file is read from its start.
+    """
+
+    def __init__(self, source, path, batch_lines=1000, batch_seconds=1.0, from_start=False):
+        self.source = source
+        self.path = os.path.abspath(path)
+        self.batch_lines = batch_lines
+        self.batch_seconds = batch_seconds
+        self.from_start = from_start
+        self.file = None
+        self.inode = None
+        # Offset just past the last complete line read, and the bytes after it
+        self.position = 0
+        self.partial = b''
+        self.pending = []
+        self.pending_lines = 0
+        self.pending_since = None
+        self.checkpoint, created = IngestCheckpoint.objects.get_or_create(source=source, path=self.path)
+        # Everything but a first read from the start follows what is already stored
+        resume = self.checkpoint.inode is not None or not from_start
+        self.ingestor = LogIngestor(source, chunk_size=sys.maxsize, on_flush=self.save_checkpoint, resume=resume)
+        if not self.open():
+            # A file that only appears later is new: read all of it
+            self.from_start = True
+
+    def open(self):
+        """Open the file at its checkpoint (or end); return whether it exists."""
+        try:
+            log_file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(log_file.fileno())
+        if self.inode is None and self.checkpoint.inode == stat.st_ino and self.checkpoint.offset <= stat.st_size:
+            position = self.checkpoint.offset
+        elif self.inode is None and self.checkpoint.inode is None and not self.from_start:
+            # Nothing recorded for this file: only follow what is written from now on
+            position = stat.st_size
+        else:
+            position = 0
+        log_file.seek(position)
+        self.file, self.inode, self.position, self.partial = log_file, stat.st_ino, position, b''
+        return True
+
+    def poll(self):
+        """Read new lines, write a batch if one is due, and return the number of lines read."""
+        if self.file is None and not self.open():
+            return 0
+        lines = self.read_available()
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None and stat.st_ino != self.inode:
+            # Rotated: finish the old file, then start on the new one
+            lines += self.read_available(final=True)
+            self.flush()
+            self.file.close()
+            self.file = None
+            self.open()
+            lines += self.read_available()
+        elif stat is not None and stat.st_size < self.position:
+            logger.warning("%s was truncated; reading it again from the start", self.path)
+            self.flush()
+            self.file.seek(0)
+            self.position, self.partial = 0, b''
+            lines += self.read_available()
+
+        if self.pending and (self.pending_lines >= self.batch_lines
+                             or time.monotonic() - self.pending_since >= self.batch_seconds):
+            self.flush()
+        return lines
+
+    def read_available(self, final=False):
+        if self.file is None:
+            return 0
+        lines = 0
+        while True:
+            data = self.file.read(READ_SIZE)
+            if not data:
+                break
+            data = self.partial + data
+            cut = data.rfind(b'\n') + 1
+            self.partial = data[cut:]
+            if cut:
+                lines += self.queue_lines(data[:cut])
+        if final and self.partial:
+            lines += self.queue(self.partial)
+            self.partial = b''
+        return lines
+
+    def queue_lines(self, data):
+        """Queue complete lines, writing a batch whenever ``batch_lines`` are pending."""
+        lines = 0
+        while data:
+            room = max(self.batch_lines - self.pending_lines, 1)
+            if data.count(b'\n') < room:
+                return lines + self.queue(data)
+            end = -1
+            for _ in range(room):
+                end = data.find(b'\n', end + 1)
+            lines += self.queue(data[:end + 1])
+            data = data[end + 1:]
+            self.flush()
+        return lines
+
+    def queue(self, data):
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append(data)
+        self.position += len(data)
+        count = data.count(b'\n') or 1
+        self.pending_lines += count
+        return count
+
+    def flush(self):
+        """Write the queued lines, if any, and move the checkpoint past them."""
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending, self.pending_lines, self.pending_since = [], 0, None
+        written = self.ingestor.line_count
+        # A stray bad byte in a live log must not stop the follower for good
+        self.ingestor.ingest(iter_lines([data], errors='replace'))
+        if self.ingestor.line_count == written:
+            # Only blank lines: nothing was flushed, so record the offset here
+            self.save_checkpoint(self.ingestor)
+
+    def save_checkpoint(self, ingestor):
+        IngestCheckpoint.objects.filter(id=self.checkpoint.id).update(
+            inode=self.inode, offset=self.position, size=self.position,
+            line_count=self.checkpoint.line_count + ingestor.line_count
+        )
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,255 @@
+# logs/utils/ingest.py
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from ..models import LogEntry, ThreatPattern
+from .alerts import DEFAULT_BUCKET_SECONDS, AlertAggregator
+from .correlation import CorrelationEngine
+from .dedup import ContentHasher, forget_filter, get_filter
+from .log_parser import TIME_RECEIVED, LogParser
+from .metrics import IngestMetrics, metrics_enabled, record_metrics
+from .parallel import DEFAULT_RANGE_SIZE, parse_file_parallel
+from .patterns import CORRELATION_RULES, THREAT_PATTERNS
+from .readers import detect_compression, iter_lines, open_log, read_chunks
+from .rollups import apply_deltas, hour_bucket, new_deltas
+from .rules import get_threat_matcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+# Hashes per duplicate lookup, well below SQLite's bound-parameter limit
+DUPLICATE_QUERY_SIZE = 500
+
+
+class LogIngestor:
+    """Parse log lines and write them to the database in batches.
+
+    Lines are parsed into chunks of ``chunk_size`` records; every chunk is
+    written with one ``bulk_create`` for ``LogEntry`` and a handful of
+    queries for its alerts, which are aggregated per pattern and time
+    bucket by ``AlertAggregator``, inside a single transaction.
+    ``on_flush(ingestor)`` is called inside that transaction, so progress
+    or checkpoints it records commit with the rows.
+
+    Lines the source already has (by ``content_hash``) are skipped with
+    their alerts and counted in ``duplicate_count``. Pass ``resume`` when
+    the lines continue what the source stores rather than possibly
+    repeating it; see ``ContentHasher``. Only hashes the
+    source's Bloom filter may have seen are looked up, in one query per
+    chunk; the unique constraint catches what a stale filter misses.
+
+    Without an explicit ``parser`` threats are detected with the active
+    ``ThreatPattern`` rows; rule changes are picked up between chunks.
+    Records then pass, in log order, through a ``CorrelationEngine`` whose
+    rules are enabled by their (placeholder) ``ThreatPattern`` rows too.
+
+    With ``LOG_METRICS_ENABLED`` every stage is timed into ``metrics``,
+    which is added to the ``IngestMetric`` counters after every chunk.
+    """
+
+    def __init__(self, source, parser=None, chunk_size=None, on_flush=None, correlator=None, resume=False):
+        self.source = source
+        self.metrics = IngestMetrics() if metrics_enabled() else None
+        self.live_rules = parser is None
+        self.parser = parser or LogParser(threat_matcher=get_threat_matcher(), metrics=self.metrics)
+        self.correlator = correlator or CorrelationEngine(
+            CORRELATION_RULES, enabled=self.parser.threat_matcher.special_rules if self.live_rules else None
+        )
+        self.chunk_size = chunk_size or getattr(settings, 'LOG_INGEST_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        self.bucket_seconds = getattr(settings, 'LOG_ALERT_BUCKET_SECONDS', DEFAULT_BUCKET_SECONDS)
+        self.on_flush = on_flush
+        self.hasher = ContentHasher(source.id if resume else None)
+        self.line_count = 0
+        self.alert_count = 0
+        self.duplicate_count = 0
+        self.chunk_stats = []
+        self.pattern_ids = self.load_pattern_ids()
+
+    def load_pattern_ids(self):
+        # Keep the oldest row when several patterns share a name, like get() would
+        pattern_ids = {}
+        for name, pattern_id in ThreatPattern.objects.order_by('id').values_list('name', 'id'):
+            pattern_ids.setdefault(name, pattern_id)
+        return pattern_ids
+
+    def pattern_id(self, threat):
+        name = threat['pattern']
+        if name not in self.pattern_ids:
+            started = time.perf_counter()
+            # Correlated threats have no pattern of their own; store a placeholder
+            pattern_text = THREAT_PATTERNS.get(name, {}).get('pattern', '.*')
+            pattern, created = ThreatPattern.objects.get_or_create(
+                name=name,
+                defaults={
+                    'description': threat['description'],
+                    'pattern': pattern_text,
+                    'severity': threat['severity']
+                }
+            )
+            self.pattern_ids[name] = pattern.id
+            if self.metrics is not None:
+                self.metrics.add('stage_seconds', 'pattern_lookup', time.perf_counter() - started)
+        return self.pattern_ids[name]
+
+    def ingest(self, lines):
+        return self.ingest_records(self.parser.parse_records(lines))
+
+    def ingest_path(self, path, workers=None, range_size=DEFAULT_RANGE_SIZE):
+        """Ingest a file on disk, parsing it in a process pool when it is big enough.
+
+        Workers only parse and detect threats; records come back in file
+        order and are written by this process. gzip, bz2 and xz files are
+        recognised by their magic bytes and decompressed while streaming;
+        they cannot be split into byte ranges, so they are parsed serially.
+        """
+        workers = workers or getattr(settings, 'LOG_INGEST_WORKERS', 1)
+        compression = detect_compression(path)
+        if workers > 1 and compression is None and os.path.getsize(path) > range_size:
+            return self.ingest_records(
+                parse_file_parallel(path, workers, self.parser.threat_matcher, range_size, self.metrics)
+            )
+
+        with open_log(path, compression) as log_file:
+            return self.ingest(iter_lines(read_chunks(log_file)))
+
+    def ingest_records(self, records):
+        chunk = []
+        observe = self.correlator.observe
+        if self.metrics is not None:
+            observe = self.observe_timed
+        for record in records:
+            raw_message, parsed_data, threats = record
+            threats.extend(observe(parsed_data, threats))
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+        if chunk:
+            self.flush(chunk)
+        return self.line_count, self.alert_count
+
+    def observe_timed(self, parsed_data, threats):
+        started = time.perf_counter()
+        correlated = self.correlator.observe(parsed_data, threats)
+        self.metrics.add('stage_seconds', 'correlate', time.perf_counter() - started)
+        for threat in correlated:
+            self.metrics.add('rule_matches', threat['pattern'], 1)
+        return correlated
+
+    def flush(self, records):
+        clock = time.perf_counter
+        started = clock()
+        hasher = self.hasher
+        hashes = [
+            hasher(parsed_data['timestamp'], raw_message, TIME_RECEIVED in parsed_data)
+            for raw_message, parsed_data, threats in records
+        ]
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    entries, written = self.write_entries(records, hashes, get_filter(self.source.id))
+            except IntegrityError:
+                # Another process stored some of these lines since the filter was loaded
+                forget_filter(self.source.id)
+                entries, written = self.write_entries(records, hashes, None)
+            entries_written = clock()
+            aggregator = AlertAggregator(self.source, self.bucket_seconds)
+            for entry, (raw_message, parsed_data, threats) in zip(entries, written):
+                for threat in threats:
+                    aggregator.add(entry, self.pattern_id(threat), threat['description'])
+            # Only new alerts add to the open-alert counts; hits on existing ones don't
+            alerts = aggregator.save()
+            alerts_written = clock()
+            apply_deltas(self.rollup_deltas(entries, alerts))
+
+            duplicates = len(records) - len(entries)
+            self.line_count += len(records)
+            self.alert_count += aggregator.hits
+            self.duplicate_count += duplicates
+            if self.on_flush is not None:
+                self.on_flush(self)
+            if self.metrics is not None:
+                # write_alerts includes the pattern_lookup time of new pattern names
+                self.metrics.add('stage_seconds', 'write_entries', entries_written - started)
+                self.metrics.add('stage_seconds', 'write_alerts', alerts_written - entries_written)
+                self.metrics.add('stage_seconds', 'rollups', clock() - alerts_written)
+                if duplicates:
+                    self.metrics.add('duplicates', '', duplicates)
+                record_metrics(self.metrics.drain())
+        elapsed = clock() - started
+        if self.live_rules:
+            self.parser.threat_matcher = get_threat_matcher()
+            self.correlator.enabled = self.parser.threat_matcher.special_rules
+
+        stats = {
+            'lines': len(records),
+            'duplicates': duplicates,
+            'alerts': aggregator.hits,
+            'alert_rows': len(alerts),
+            'seconds': elapsed,
+            'lines_per_second': len(records) / elapsed if elapsed else 0.0,
+        }
+        self.chunk_stats.append(stats)
+        logger.info(
+            "Ingested %d lines (%d duplicates, %d alert hits, %d new alerts) for %s in %.3fs (%.0f lines/s)",
+            stats['lines'], duplicates, stats['alerts'], stats['alert_rows'], self.source, elapsed,
+            stats['lines_per_second']
+        )
+        return stats
+
+    def write_entries(self, records, hashes, bloom):
+        """Store the records whose hash is new; return the entries and their records.
+
+        Without a ``bloom`` filter every hash is looked up. Records without
+        a hash are always stored.
+        """
+        candidates = [value for value in hashes if value is not None and (bloom is None or value in bloom)]
+        existing = set()
+        for start in range(0, len(candidates), DUPLICATE_QUERY_SIZE):
+            existing.update(LogEntry.objects.filter(
+                source=self.source, content_hash__in=candidates[start:start + DUPLICATE_QUERY_SIZE]
+            ).values_list('content_hash', flat=True))
+
+        written, new_entries = [], []
+        for record, value in zip(records, hashes):
+            if value is not None:
+                if value in existing:
+                    continue
+                # Out-of-order repeats of a line can hash alike within one chunk too
+                existing.add(value)
+            written.append(record)
+            new_entries.append(self.build_entry(record[0], record[1], value))
+        entries = LogEntry.objects.bulk_create(new_entries)
+        if bloom is not None:
+            for entry in entries:
+                if entry.content_hash is not None:
+                    bloom.add(entry.content_hash)
+        return entries, written
+
+    def rollup_deltas(self, entries, alerts):
+        deltas = new_deltas()
+        for entry in entries:
+            deltas[(self.source.id, entry.severity, hour_bucket(entry.timestamp))][0] += 1
+        for alert in alerts:
+            entry = alert.log_entry
+            deltas[(self.source.id, entry.severity, hour_bucket(entry.timestamp))][1] += 1
+        return deltas
+
+    def build_entry(self, raw_message, parsed_data, content_hash=None):
+        # Convert datetime objects to strings for JSON serialization
+        serializable_data = parsed_data.copy()
+        if 'timestamp' in serializable_data:
+            serializable_data['timestamp'] = parsed_data['timestamp'].isoformat()
+
+        return LogEntry(
+            source=self.source,
+            raw_message=raw_message,
+            timestamp=parsed_data['timestamp'],
+            severity=parsed_data.get('severity', 'unknown'),
+            parsed_data=serializable_data,
+            content_hash=content_hash
+        )
@@ -0,0 +1,104 @@
+# logs/utils/jobs.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import IngestJob
+from .ingest import LogIngestor
+from .readers import DECOMPRESSION_ERRORS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_TIMEOUT = 600
+
+
+class JobRequeued(Exception):
+    """The job was queued again while this worker was still running it."""
+
+
+def requeue_stale_jobs(timeout=None):
+    """Queue again the processing jobs without progress for ``timeout`` seconds; return how many.
+
+    Their worker was killed or lost its database connection. The chunks
+    it wrote are committed, so the new run skips their lines as duplicates.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'LOG_INGEST_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+    since = timezone.now() - timedelta(seconds=timeout)
+    # Jobs claimed before heartbeats were recorded have only started_at
+    stale = IngestJob.objects.filter(
+        Q(heartbeat_at__lt=since) | Q(heartbeat_at__isnull=True, started_at__lt=since), status='processing'
+    )
+    requeued = stale.update(status='pending', started_at=None, heartbeat_at=None)
+    if requeued:
+        logger.warning("Queued %d ingest jobs again after %d seconds without progress", requeued, timeout)
+    return requeued
+
+
+def claim_next_job():
+    """Mark the oldest pending job as processing and return it, or ``None``.
+
+    The conditional update makes the claim safe when several workers poll
+    the same table: only one of them changes the row's status. Stale jobs
+    are requeued first (``requeue_stale_jobs``).
+    """
+    requeue_stale_jobs()
+    for job_id in IngestJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)[:5]:
+        now = timezone.now()
+        claimed = IngestJob.objects.filter(id=job_id, status='pending').update(
+            status='processing', started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return IngestJob.objects.select_related('source').get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """Ingest a claimed job's file and record progress on the job row after every chunk.
+
+    Progress also refreshes ``heartbeat_at``. If the job was requeued in
+    the meantime, the chunk is rolled back and the job left to the worker
+    that claimed it again.
+    """
+    def record_progress(ingestor):
+        updated = IngestJob.objects.filter(id=job.id, status='processing', started_at=job.started_at).update(
+            lines_done=ingestor.line_count, alerts_found=ingestor.alert_count,
+            duplicates_skipped=ingestor.duplicate_count, heartbeat_at=timezone.now()
+        )
+        if not updated:
+            raise JobRequeued(job.id)
+
+    ingestor = LogIngestor(job.source, on_flush=record_progress)
+    try:
+        line_count, alert_count = ingestor.ingest_path(job.log_file.path)
+    except JobRequeued:
+        logger.warning("Ingest job %s was queued again; leaving it", job.id)
+        return job
+    except UnicodeDecodeError:
+        job.status = 'failed'
+        job.error = "Error decoding the file. Please ensure it's a UTF-8 text file."
+    except DECOMPRESSION_ERRORS as e:
+        job.status = 'failed'
+        job.error = f"Error decompressing the file; the archive is truncated or corrupt ({e})."
+    except Exception as e:
+        logger.exception("Ingest job %s failed", job.id)
+        job.status = 'failed'
+        job.error = f"Error processing file: {str(e)}"
+    else:
+        job.status = 'completed'
+        # The rows are in the database now; the upload is no longer needed
+        job.log_file.delete(save=False)
+
+    job.lines_done = ingestor.line_count
+    job.alerts_found = ingestor.alert_count
+    job.duplicates_skipped = ingestor.duplicate_count
+    if ingestor.metrics is not None:
+        job.metrics = ingestor.metrics.summary()
+    job.finished_at = timezone.now()
+    job.save()
+    logger.info("Ingest job %s %s: %d lines (%d duplicates), %d alerts",
+                job.id, job.status, job.lines_done, job.duplicates_skipped, job.alerts_found)
+    return job
@@ -1,79 +1,132 @@
 import re
 import json
-from datetime import datetime
+import time
+from urllib.parse import unquote
+
 from django.utils import timezone  # Add this import
 
 # Correct import from patterns
 from .patterns import THREAT_PATTERNS, LOG_FORMATS, SEVERITY_MAP
+from .threats import ThreatMatcher
+from .timestamps import TimestampParser
+
+# Compiled once per process and shared by every parser
+DEFAULT_THREAT_MATCHER = ThreatMatcher.from_patterns(THREAT_PATTERNS)
+COMPILED_FORMATS = {name: re.compile(pattern) for name, pattern in LOG_FORMATS.items()}
+# A combined line starts with a complete common line; anchor the common
+# format so it only matches lines without the referrer and user agent
+COMPILED_FORMATS['apache_common'] = re.compile(LOG_FORMATS['apache_common'] + r'$')
+
+# Set in parsed_data when the timestamp is the time the line was parsed
+TIME_RECEIVED = 'time_received'
+
+# Access-log status classes, mapped like the level names of other formats,
+# as (level, severity)
+HTTP_STATUS_LEVELS = {
+    first: (level, SEVERITY_MAP[level])
+    for first, level in {'5': 'error', '4': 'warning', '': 'info'}.items()
+}
+
+
+def stamp_received(parsed):
+    """Give a line without a readable time the time it was parsed, marked as such.
+
+    ``TIME_RECEIVED`` tells deduplication the timestamp says nothing
+    about the line: it differs on every upload.
+    """
+    if parsed['timestamp'] is None:
+        parsed['timestamp'] = timezone.now()
+        parsed[TIME_RECEIVED] = True
+    return parsed
+
+
+def format_hint(line):
+    """Guess the format of a non-empty line from its first character."""
+    first = line[0]
+    if first == '{':
+        return 'json_log'
+    if first.isdigit():
+        # "2023-09-06 08:30:25 - ..." versus a client address "10.1.2.3 - - [..."
+        return 'standard' if line[4:5] == '-' else 'apache_combined'
+    return 'syslog'
+
 
 class LogParser:
-    def __init__(self):
+    def __init__(self, threat_matcher=None, timestamps=None, metrics=None):
+        self.threat_matcher = threat_matcher or DEFAULT_THREAT_MATCHER
+        # An IngestMetrics to time the read, parse and detect stages with
+        self.metrics = metrics
+        # Caches the time zone, syslog year and last parsed second per file
+        self.timestamps = timestamps or TimestampParser()
         self.common_patterns = [
             # Common log formats in healthcare systems
-            (LOG_FORMATS['standard'], self.parse_standard_format),
-            (LOG_FORMATS['syslog'], self.parse_syslog_format),
-            (LOG_FORMATS['json_log'], self.parse_json_format),
+            ('standard', COMPILED_FORMATS['standard'], self.parse_standard_format),
+            ('syslog', COMPILED_FORMATS['syslog'], self.parse_syslog_format),
+            ('json_log', COMPILED_FORMATS['json_log'], self.parse_json_format),
+            ('apache_combined', COMPILED_FORMATS['apache_combined'], self.parse_apache_format),
+            ('apache_common', COMPILED_FORMATS['apache_common'], self.parse_apache_format),
         ]
+        # No line matches more than one of these formats, so the order they
+        # are tried in only affects speed: the hinted format goes first and
+        # the others follow as a fallback
+        self.routes = {
+            name: sorted(self.common_patterns, key=lambda fmt, name=name: fmt[0] != name)
+            for name, regex, parser in self.common_patterns
+        }
+        # One file almost never mixes formats; use a parser per file or source
+        self.last_format = None
 
     def parse_standard_format(self, match, line):
         timestamp_str, level, message = match.groups()
         try:
-            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-            # Make datetime timezone-aware
-            timestamp = timezone.make_aware(timestamp)
+            timestamp = self.timestamps.standard(timestamp_str)
         except ValueError:
-            timestamp = timezone.now()  # Use timezone-aware now()
+            timestamp = None
 
         # Map severity levels
         severity = SEVERITY_MAP.get(level.lower(), 'low')
 
-        return {
+        return stamp_received({
             'timestamp': timestamp,
             'level': level.lower(),
             'severity': severity,
             'message': message
-        }
+        })
 
     def parse_syslog_format(self, match, line):
         try:
-            month_day, time, hostname, message = match.groups()
-            # Create a proper datetime object (simplified)
-            current_year = datetime.now().year
-            timestamp_str = f"{current_year} {month_day} {time}"
-            timestamp = datetime.strptime(timestamp_str, '%Y %b %d %H:%M:%S')
-            # Make datetime timezone-aware
-            timestamp = timezone.make_aware(timestamp)
+            timestamp_str, hostname, message = match.groups()
+            # Syslog timestamps carry no year; it is worked out from today's date
+            timestamp = self.timestamps.syslog(timestamp_str)
         except (ValueError, AttributeError):
-            timestamp = timezone.now()  # Use timezone-aware now()
+            timestamp = None
             hostname = 'unknown'
             message = line
 
-        return {
+        return stamp_received({
             'timestamp': timestamp,
             'level': 'unknown',
             'severity': 'low',
             'message': message,
             'hostname': hostname
-        }
+        })
 
     def parse_simple_format(self, match, line):
         timestamp_str, level, message = match.groups()
         try:
-            timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-            # Make datetime timezone-aware
-            timestamp = timezone.make_aware(timestamp)
+            timestamp = self.timestamps.standard(timestamp_str)
         except ValueError:
-            timestamp = timezone.now()  # Use timezone-aware now()
+            timestamp = None
 
         # Map severity levels
         severity = SEVERITY_MAP.get(level.lower(), 'low')
 
-        return {
+        return stamp_received({
             'timestamp': timestamp,
             'level': level.lower(),
             'severity': severity,
             'message': message
-        }
+        })
 
     def parse_json_format(self, match, line):
         # Implementation for JSON format
@@ -81,50 +134,137 @@ class LogParser:
             log_data = json.loads(line)
             timestamp_str = log_data.get('timestamp', '')
             if timestamp_str:
-                timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                # Make datetime timezone-aware
-                timestamp = timezone.make_aware(timestamp)
+                # Naive timestamps are made timezone-aware, offsets are kept
+                timestamp = self.timestamps.iso(timestamp_str)
             else:
-                timestamp = timezone.now()  # Use timezone-aware now()
+                timestamp = None
 
-            return {
+            return stamp_received({
                 'timestamp': timestamp,
                 'level': log_data.get('level', 'unknown'),
                 'severity': SEVERITY_MAP.get(log_data.get('level', 'unknown').lower(), 'low'),
                 'message': log_data.get('message', ''),
                 'raw_data': log_data
-            }
+            })
         except (json.JSONDecodeError, ValueError):
             return self.parse_unknown_format(line)
 
+    def parse_apache_format(self, match, line):
+        """Parse an Apache common or combined access-log line.
+
+        The request line is the message threats are detected in, with
+        percent-escapes decoded so encoded attacks match too.
+        """
+        groups = match.groups()
+        client_ip, ident, user, timestamp_str, method, path, protocol, status, size = groups[:9]
+        try:
+            timestamp = self.timestamps.clf(timestamp_str)
+        except ValueError:
+            timestamp = None
+
+        level, severity = HTTP_STATUS_LEVELS.get(status[0]) or HTTP_STATUS_LEVELS['']
+        request = f'{method} {path} {protocol}' if protocol else f'{method} {path}'
+        parsed = {
+            'timestamp': timestamp,
+            'level': level,
+            'severity': severity,
+            'message': unquote(request) if '%' in request else request,
+            'client_ip': client_ip,
+            'user': user if user != '-' else '',
+            'method': method,
+            'path': path,
+            'protocol': protocol,
+            'status': int(status),
+            'bytes': int(size) if size.isdigit() else 0,
+        }
+        if len(groups) > 9:
+            parsed['referrer'] = groups[9]
+            parsed['user_agent'] = groups[10]
+        return stamp_received(parsed)
+
     def parse_unknown_format(self, line):
-        return {
-            'timestamp': timezone.now(),  # Use timezone-aware now()
+        return stamp_received({
+            'timestamp': None,
             'level': 'unknown',
             'severity': 'low',
             'message': line
-        }
+        })
 
     def parse_line(self, line):
         line = line.strip()
         if not line:
             return None
 
-        for pattern, parser in self.common_patterns:
-            match = re.match(pattern, line)
+        # Try the format that matched the previous line first
+        last_format = self.last_format
+        if last_format is not None:
+            match = last_format[1].match(line)
             if match:
-                return parser(match, line)
+                return last_format[2](match, line)
+
+        for fmt in self.routes[format_hint(line)]:
+            if fmt is last_format:
+                continue
+            match = fmt[1].match(line)
+            if match:
+                self.last_format = fmt
+                return fmt[2](match, line)
         return self.parse_unknown_format(line)
 
+    def parse_records(self, lines):
+        """Yield ``(raw_message, parsed_data, threats)`` for every non-blank line."""
+        if self.metrics is not None:
+            yield from self.parse_records_timed(lines)
+            return
+        for line in lines:
+            decoded_line = line.strip()
+            if not decoded_line:
+                continue
+            parsed_data = self.parse_line(decoded_line)
+            if not parsed_data:
+                continue
+            yield decoded_line, parsed_data, self.detect_threats(parsed_data)
+
+    def parse_records_timed(self, lines):
+        """``parse_records`` with every stage timed into ``self.metrics``."""
+        metrics = self.metrics
+        clock = time.perf_counter
+        lines = iter(lines)
+        while True:
+            started = clock()
+            # Reading and decoding happen lazily, while the next line is fetched
+            line = next(lines, None)
+            read = clock()
+            metrics.add('stage_seconds', 'read', read - started)
+            if line is None:
+                return
+            decoded_line = line.strip()
+            if not decoded_line:
+                continue
+            parsed_data = self.parse_line(decoded_line)
+            parsed = clock()
+            metrics.add('stage_seconds', 'parse', parsed - read)
+            metrics.add('lines', '', 1)
+            if not parsed_data:
+                continue
+            threats = self.detect_threats_timed(parsed_data)
+            metrics.add('stage_seconds', 'detect', clock() - parsed)
+            yield decoded_line, parsed_data, threats
+
+    def detect_threats_timed(self, log_data):
+        metrics = self.metrics
+        if metrics.sample_rules():
+            threats = self.threat_matcher.match_timed(log_data['message'], metrics.add)
+            metrics.add('rule_samples', '', 1)
+        else:
+            threats = self.threat_matcher.match(log_data['message'])
+        threats.extend(self.detect_time_based_threats(log_data))
+        for threat in threats:
+            metrics.add('rule_matches', threat['pattern'], 1)
+        return threats
+
     def detect_threats(self, log_data):
-        threats = []
-        for pattern_name, pattern_data in THREAT_PATTERNS.items():
-            if re.search(pattern_data['pattern'], log_data['message'], re.IGNORECASE):
-                threats.append({
-                    'pattern': pattern_name,
-                    'severity': pattern_data['severity'],
-                    'description': pattern_data['description']
-                })
+        threats = self.threat_matcher.match(log_data['message'])
 
         # Add time-based threat detection
         threats.extend(self.detect_time_based_threats(log_data))
@@ -134,9 +274,11 @@ class LogParser:
     def detect_time_based_threats(self, log_data):
         threats = []
         timestamp = log_data['timestamp']
+        # Only raised while their placeholder rules are active
+        enabled = self.threat_matcher.special_rules
 
         # Check for after-hours access (8 PM to 6 AM)
-        if timestamp.hour >= 20 or timestamp.hour < 6:
+        if 'after_hours_access' in enabled and (timestamp.hour >= 20 or timestamp.hour < 6):
             threats.append({
                 'pattern': 'after_hours_access',
                 'severity': 'medium',
@@ -144,7 +286,7 @@ class LogParser:
             })
 
         # Check for weekend access
-        if timestamp.weekday() >= 5:  # 5 = Saturday, 6 = Sunday
+        if 'weekend_access' in enabled and timestamp.weekday() >= 5:  # 5 = Saturday, 6 = Sunday
             threats.append({
                 'pattern': 'weekend_access',
                 'severity': 'medium',
@@ -0,0 +1,113 @@
+# logs/utils/metrics.py
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from ..models import IngestMetric
+
+# Time every rule separately on one line in this many; the combined
+# ThreatMatcher scan cannot say which rule its time went to
+DEFAULT_RULE_SAMPLE = 100
+
+# Prometheus name, type and help text of every metric that is recorded
+METRIC_INFO = {
+    'lines': ('hlog_ingest_lines_total', 'counter', 'Log lines parsed'),
+    'duplicates': ('hlog_ingest_duplicate_lines_total', 'counter', 'Log lines skipped as already ingested'),
+    'stage_seconds': ('hlog_ingest_stage_seconds_total', 'counter', 'Seconds spent per ingestion stage'),
+    'rule_matches': ('hlog_threat_rule_matches_total', 'counter', 'Lines matched per threat rule'),
+    'rule_seconds': ('hlog_threat_rule_seconds_total', 'counter',
+                     'Seconds spent per threat rule regex on sampled lines'),
+    'rule_samples': ('hlog_threat_rule_samples_total', 'counter', 'Lines on which rules were timed separately'),
+}
+
+
+def metrics_enabled():
+    return getattr(settings, 'LOG_METRICS_ENABLED', False)
+
+
+class IngestMetrics:
+    """Counters and stage timings of one ingestion, keyed by ``(name, label)``.
+
+    Parsers and ingestors only hold one of these while metrics are
+    enabled; with metrics disabled they keep ``None`` and skip every
+    timer, so the hot path pays a single ``is None`` check per file or
+    chunk. ``drain`` hands the counts collected since the last call to
+    ``record_metrics``, which adds them to the ``IngestMetric`` table.
+    """
+
+    def __init__(self, rule_sample=None):
+        self.rule_sample = rule_sample or getattr(settings, 'LOG_METRICS_RULE_SAMPLE', DEFAULT_RULE_SAMPLE)
+        self.counters = defaultdict(float)
+        self.totals = defaultdict(float)
+        self.detect_calls = 0
+
+    def add(self, name, label, value):
+        self.counters[(name, label)] += value
+
+    def merge(self, counters):
+        for key, value in counters.items():
+            self.counters[key] += value
+
+    def sample_rules(self):
+        """Return whether the current line's rules should be timed one by one."""
+        self.detect_calls += 1
+        return self.detect_calls % self.rule_sample == 0
+
+    def drain(self):
+        counters = dict(self.counters)
+        self.counters.clear()
+        for key, value in counters.items():
+            self.totals[key] += value
+        return counters
+
+    def summary(self):
+        """Return the totals drained so far as ``{name: {label: value}}``."""
+        summary = defaultdict(dict)
+        for (name, label), value in sorted(self.totals.items()):
+            summary[name][label] = value
+        return dict(summary)
+
+
+def record_metrics(counters):
+    """Add drained counters to ``IngestMetric``: one insert plus one update per key."""
+    if not counters:
+        return
+    with transaction.atomic():
+        IngestMetric.objects.bulk_create(
+            [IngestMetric(name=name, label=label) for name, label in counters],
+            ignore_conflicts=True
+        )
+        for (name, label), value in counters.items():
+            IngestMetric.objects.filter(name=name, label=label).update(value=F('value') + value)
+
+
+def metric_totals():
+    """Return every recorded metric as ``{name: {label: value}}``."""
+    totals = defaultdict(dict)
+    for name, label, value in IngestMetric.objects.order_by('name', 'label').values_list('name', 'label', 'value'):
+        totals[name][label] = value
+    return dict(totals)
+
+
+def prometheus_text(totals):
+    """Render ``metric_totals()`` in the Prometheus text exposition format."""
+    lines = []
+    for name, values in totals.items():
+        metric, metric_type, help_text = METRIC_INFO.get(name, (f'hlog_{name}', 'untyped', name))
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for label, value in values.items():
+            label_name = 'stage' if name == 'stage_seconds' else 'rule'
+            selector = f'{{{label_name}="{escape_label(label)}"}}' if label else ''
+            lines.append(f'{metric}{selector} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
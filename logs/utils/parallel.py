@@ -0,0 +1,85 @@
+# logs/utils/parallel.py
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .log_parser import LogParser
+from .readers import iter_lines
+
+# Bytes handed to a worker at a time; also bounds the memory of one result
+DEFAULT_RANGE_SIZE = 4 * 1024 * 1024
+
+# Per-process parser, created by init_worker
+_worker_parser = None
+
+
+def split_ranges(path, range_size=DEFAULT_RANGE_SIZE):
+    """Yield ``(start, end)`` byte ranges of roughly ``range_size`` that start on a line.
+
+    Every range ends just after a ``b'\\n'`` (or at the end of the file),
+    so no line, ``\\r\\n`` pair or UTF-8 sequence is split between ranges.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as log_file:
+        start = 0
+        while start < size:
+            log_file.seek(min(start + range_size, size))
+            log_file.readline()
+            end = min(log_file.tell(), size)
+            yield start, end
+            start = end
+
+
+def init_worker(threat_matcher, timed=False):
+    global _worker_parser
+    # Spawned (not forked) workers start without Django configured
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    from .metrics import IngestMetrics
+    _worker_parser = LogParser(threat_matcher=threat_matcher, metrics=IngestMetrics() if timed else None)
+
+
+def parse_range(path, start, end, encoding='utf-8'):
+    """Parse one byte range into ``(raw_message, parsed_data, threats)`` records.
+
+    Returns the records and, when the worker times its stages, the
+    counters collected for this range.
+    """
+    with open(path, 'rb') as log_file:
+        log_file.seek(start)
+        data = log_file.read(end - start)
+
+    records = list(_worker_parser.parse_records(iter_lines([data], encoding=encoding)))
+    metrics = _worker_parser.metrics
+    return records, metrics.drain() if metrics is not None else None
+
+
+def parse_file_parallel(path, workers, threat_matcher, range_size=DEFAULT_RANGE_SIZE, metrics=None):
+    """Parse a file in a process pool and yield its records in file order.
+
+    At most ``2 * workers`` ranges are in flight, so a slow consumer (the
+    database writer) holds back parsing instead of piling up results.
+    The workers' stage timings are merged into ``metrics`` when given.
+    """
+    def results(future):
+        records, counters = future.result()
+        if counters:
+            metrics.merge(counters)
+        return records
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threat_matcher, metrics is not None)) as executor:
+        pending = deque()
+        try:
+            for start, end in split_ranges(path, range_size):
+                pending.append(executor.submit(parse_range, path, start, end))
+                if len(pending) >= 2 * workers:
+                    yield from results(pending.popleft())
+            while pending:
+                yield from results(pending.popleft())
+        finally:
+            # Don't parse the rest of the file if the consumer gave up
+            for future in pending:
+                future.cancel()
@@ -88,3 +88,33 @@ SEVERITY_MAP = {
     'debug': 'low',
     'unknown': 'low'
 }
+
+# Threats raised by the correlation stage when one key (an address, a user)
+# triggers another threat ``threshold`` times within ``window`` seconds.
+# ``key`` is matched against the message and its first group is the key.
+CORRELATION_RULES = {
+    'brute_force': {
+        'trigger': 'unauthorized_access',
+        'key': r'from (\d{1,3}(?:\.\d{1,3}){3})',
+        'threshold': 5,
+        'window': 60,
+        'severity': 'critical',
+        'description': 'Repeated failed access attempts from the same address'
+    },
+    'account_attack': {
+        'trigger': 'unauthorized_access',
+        'key': r'user (\S+)',
+        'threshold': 5,
+        'window': 300,
+        'severity': 'high',
+        'description': 'Repeated failed access attempts against the same account'
+    },
+    'export_burst': {
+        'trigger': 'data_export',
+        'key': r'user (\S+)',
+        'threshold': 3,
+        'window': 600,
+        'severity': 'high',
+        'description': 'Burst of data exports by the same user'
+    }
+}
@@ -0,0 +1,81 @@
+# logs/utils/readers.py
+import bz2
+import codecs
+import gzip
+import lzma
+
+# Characters str.splitlines() treats as line boundaries
+LINE_BREAKS = '\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+# Bytes read (and, for archives, decompressed) at a time
+READ_SIZE = 64 * 1024
+
+# Leading bytes of the compressed formats we accept, and how to open them
+COMPRESSION_FORMATS = {
+    'gzip': (b'\x1f\x8b', gzip.open),
+    'bz2': (b'BZh', bz2.open),
+    'xz': (b'\xfd7zXZ\x00', lzma.open),
+}
+
+# Raised while reading a truncated or corrupt archive (bz2 raises a plain OSError)
+DECOMPRESSION_ERRORS = (EOFError, gzip.BadGzipFile, lzma.LZMAError)
+
+
+def detect_compression(path):
+    """Return ``'gzip'``, ``'bz2'`` or ``'xz'`` from the file's magic bytes, or ``None``."""
+    with open(path, 'rb') as log_file:
+        head = log_file.read(6)
+    for name, (magic, opener) in COMPRESSION_FORMATS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_log(path, compression=None):
+    """Open ``path`` for binary reading, decompressing it on the fly if needed.
+
+    Compressed files are decompressed as they are read, at most one read
+    at a time, so memory stays bounded whatever the archive expands to.
+    Concatenated (multi-stream) archives, as written by rotation tools that
+    append, are read through to the end.
+    """
+    compression = compression or detect_compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    return COMPRESSION_FORMATS[compression][1](path, 'rb')
+
+
+def read_chunks(log_file, size=READ_SIZE):
+    """Yield ``size``-byte chunks from a binary file object until it is exhausted."""
+    return iter(lambda: log_file.read(size), b'')
+
+
+def iter_lines(chunks, encoding='utf-8', errors='strict'):
+    """Yield decoded lines from an iterable of byte chunks.
+
+    Bytes are decoded incrementally, so multi-byte characters and lines split
+    across chunk boundaries are reassembled, and only the current chunk plus
+    the unfinished line are held in memory. Line splitting matches
+    ``str.splitlines()`` on the fully decoded text. ``errors`` is the codec
+    error handler, as for ``bytes.decode``.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    pending = ''
+    for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        if not text:
+            continue
+        lines = text.splitlines()
+        if text[-1] == '\r':
+            # The next chunk may start with the '\n' of a '\r\n' pair
+            pending = lines.pop() + '\r'
+        elif text[-1] in LINE_BREAKS:
+            pending = ''
+        else:
+            # Keep an unterminated last line until the next chunk completes it
+            pending = lines.pop()
+        yield from lines
+
+    text = pending + decoder.decode(b'', final=True)
+    yield from text.splitlines()
+
@@ -0,0 +1,232 @@
+# logs/utils/retention.py
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from ..models import Alert, LogEntry, LogRollup
+from .alerts import range_size, remove_entry_ids
+from .ingest import LogIngestor
+from .readers import detect_compression, iter_lines, open_log, read_chunks
+from .rollups import apply_deltas, entry_deltas, hour_bucket
+
+logger = logging.getLogger(__name__)
+
+# Primary-key window deleted per transaction
+DEFAULT_BATCH_SIZE = 5000
+ARCHIVE_SUFFIX = '.ndjson.gz'
+
+
+def retention_days(source):
+    if source.retention_days is not None:
+        return source.retention_days
+    return getattr(settings, 'LOG_RETENTION_DAYS', None)
+
+
+def retention_cutoff(source, now=None):
+    """Return the time before which a source's lines expire, or ``None`` if they never do."""
+    days = retention_days(source)
+    if days is None:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_path(archive_dir, source, day):
+    return os.path.join(archive_dir, f'source-{source.id}', f'{day.isoformat()}{ARCHIVE_SUFFIX}')
+
+
+def write_archive(archive_dir, source, rows):
+    """Append ``rows`` to the gzip NDJSON archive of their UTC day; return the paths written.
+
+    Every call adds a gzip member to each file, which readers decompress
+    as one stream, and syncs it to disk before the rows may be deleted.
+    """
+    days = defaultdict(list)
+    for row in rows:
+        timestamp = row['timestamp'].astimezone(dt_timezone.utc)
+        days[timestamp.date()].append(json.dumps({
+            'id': row['id'],
+            'source': source.name,
+            'timestamp': timestamp.isoformat(),
+            'severity': row['severity'],
+            'raw_message': row['raw_message'],
+            'parsed_data': row['parsed_data'],
+        }, ensure_ascii=False))
+
+    paths = []
+    for day, lines in sorted(days.items()):
+        path = archive_path(archive_dir, source, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as archive_file:
+            with gzip.GzipFile(fileobj=archive_file, mode='wb') as gzip_file:
+                gzip_file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        paths.append(path)
+    return paths
+
+
+def rollup_key(entry):
+    return (entry.source_id, entry.severity, hour_bucket(entry.timestamp))
+
+
+def first_surviving_entry(ranges):
+    """Return the first ``LogEntry`` left in ``ranges`` and the ranges from it on.
+
+    One query per range, stopping at the first range with a row left.
+    """
+    ranges = sorted(ranges)
+    for index, (first, last) in enumerate(ranges):
+        entry = (
+            LogEntry.objects.filter(id__gte=first, id__lte=last).order_by('id')
+            .only('id', 'source_id', 'severity', 'timestamp').first()
+        )
+        if entry is not None:
+            return entry, [[entry.id, last]] + ranges[index + 1:]
+    return None, []
+
+
+def trim_alerts(alerts, removed, deltas):
+    """Take the entries ``removed`` (sorted ids) out of ``alerts``; return how many alerts are deleted.
+
+    An alert whose first hit or recorded hits are removed is pointed at
+    its first surviving hit, and its ``entry_ranges``, ``hit_count`` and
+    ``first_seen`` are trimmed to what is left; keeping the lowest id as
+    ``log_entry`` lets a later window find it again. Alerts without a
+    recorded hit left are deleted. ``deltas`` follows the open alerts
+    that move to another rollup key or go away.
+    """
+    removed_ids = set(removed)
+    updated = []
+    deleted = []
+    for alert in alerts.select_related('log_entry').only(
+            'id', 'is_resolved', 'hit_count', 'first_seen', 'entry_ranges',
+            'log_entry__source_id', 'log_entry__severity', 'log_entry__timestamp'):
+        ranges = remove_entry_ids(alert.entry_ranges, removed)
+        if alert.log_entry_id not in removed_ids and range_size(ranges) == range_size(alert.entry_ranges):
+            continue
+        entry, ranges = first_surviving_entry(ranges)
+        if not alert.is_resolved:
+            deltas[rollup_key(alert.log_entry)][1] -= 1
+            if entry is not None:
+                deltas[rollup_key(entry)][1] += 1
+        if entry is None:
+            deleted.append(alert.id)
+            continue
+        # Hits past MAX_ENTRY_RANGES were counted but not recorded; they stay counted
+        alert.hit_count = max(alert.hit_count - range_size(alert.entry_ranges) + range_size(ranges), 1)
+        alert.log_entry = entry
+        alert.entry_ranges = ranges
+        if alert.first_seen is not None:
+            alert.first_seen = entry.timestamp
+        updated.append(alert)
+
+    Alert.objects.bulk_update(updated, ['log_entry', 'hit_count', 'first_seen', 'entry_ranges'])
+    # Nothing references alerts, so this is a single DELETE
+    Alert.objects.filter(id__in=deleted).delete()
+    return len(deleted)
+
+
+def delete_rows(queryset):
+    """Delete the rows of ``queryset`` with one ``DELETE``; return how many.
+
+    Unlike ``QuerySet.delete()`` the rows are not loaded to be cascaded,
+    so whatever references them must be dealt with first.
+    """
+    model = queryset.model
+    quote = connections[queryset.db].ops.quote_name
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({sql})',
+            params
+        )
+        return cursor.rowcount
+
+
+def purge_source(source, cutoff, batch_size=DEFAULT_BATCH_SIZE, archive_dir=None, pause=0.0):
+    """Archive and delete a source's lines older than ``cutoff``; return the counts.
+
+    Expired rows are taken in windows of ``batch_size`` primary keys, so
+    every statement touches a bounded range of the table. Each window is
+    one short transaction: its rows are appended to the archive, the
+    alerts with hits among them are trimmed by ``trim_alerts``, the rollup
+    counts are decremented, and the entries are deleted with one
+    ``DELETE``, without loading them. ``pause`` seconds between windows
+    leaves room for the ingestion writers.
+
+    Rows archived by a window whose transaction then fails are archived
+    again by the next run; restoring skips them as duplicates.
+    """
+    expired = LogEntry.objects.filter(source=source, timestamp__lt=cutoff)
+    counts = {'entries': 0, 'alerts': 0, 'archives': set()}
+    bounds = expired.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return counts
+
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        window = expired.filter(id__gte=start, id__lt=start + batch_size)
+        with transaction.atomic():
+            if archive_dir is not None:
+                rows = window.order_by('id').values('id', 'timestamp', 'severity', 'raw_message', 'parsed_data')
+                counts['archives'].update(write_archive(archive_dir, source, rows))
+            removed = list(window.order_by('id').values_list('id', flat=True))
+            # Alerts whose first hit is in the window, and aggregated ones
+            # that may have later hits in it
+            alerts = Alert.objects.filter(
+                Q(log_entry_id__in=window.values('id'))
+                | Q(source=source, first_seen__lt=cutoff, log_entry_id__lt=start + batch_size)
+            )
+            deltas = entry_deltas(window, -1)
+            alert_count = trim_alerts(alerts, removed, deltas)
+            # No alert points at the window any more and no signals watch
+            # LogEntry, so nothing is left to cascade
+            entry_count = delete_rows(window)
+            apply_deltas(deltas)
+        counts['alerts'] += alert_count
+        counts['entries'] += entry_count
+        if entry_count and pause:
+            time.sleep(pause)
+
+    # Hours that are empty now would only be summed as zeros
+    LogRollup.objects.filter(source=source, log_count__lte=0, open_alert_count__lte=0).delete()
+    logger.info("Purged %d lines and %d alerts of %s older than %s",
+                counts['entries'], counts['alerts'], source, cutoff)
+    return counts
+
+
+def archived_records(parser, lines):
+    """Turn archive lines back into ``(raw_message, parsed_data, threats)`` records.
+
+    Lines are parsed and checked for threats again; the archived timestamp
+    and severity are kept, since syslog lines carry no year and lines that
+    did not parse were stamped with their ingestion time.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        raw_message = row['raw_message']
+        parsed_data = parser.parse_line(raw_message) or parser.parse_unknown_format(raw_message)
+        parsed_data['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        parsed_data['severity'] = row['severity']
+        yield raw_message, parsed_data, parser.detect_threats(parsed_data)
+
+
+def restore_archive(source, path):
+    """Ingest an archive written by ``purge_source`` into ``source``; return ``(lines, alerts)``.
+
+    Lines the source still (or again) has are skipped as duplicates.
+    """
+    ingestor = LogIngestor(source)
+    with open_log(path, detect_compression(path)) as archive_file:
+        ingestor.ingest_records(archived_records(ingestor.parser, iter_lines(read_chunks(archive_file))))
+    return ingestor.line_count - ingestor.duplicate_count, ingestor.alert_count
@@ -0,0 +1,99 @@
+# logs/utils/rollups.py
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from ..models import LogEntry, Alert, LogRollup
+
+
+def hour_bucket(timestamp):
+    """Truncate an aware datetime to the start of its UTC hour."""
+    return timestamp.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def new_deltas():
+    """Return an empty ``{(source_id, severity, hour): [logs, open_alerts]}`` mapping."""
+    return defaultdict(lambda: [0, 0])
+
+
+def apply_deltas(deltas):
+    """Add ``deltas`` to the rollup rows, creating missing rows first.
+
+    Missing rows are inserted with ``ignore_conflicts`` and then incremented
+    with ``F()`` expressions, so concurrent writers never overwrite each
+    other's counts. Costs one insert plus one update per key.
+    """
+    deltas = {key: counts for key, counts in deltas.items() if any(counts)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        LogRollup.objects.bulk_create(
+            [LogRollup(source_id=source_id, severity=severity, hour=hour)
+             for source_id, severity, hour in deltas],
+            ignore_conflicts=True
+        )
+        for (source_id, severity, hour), (logs, open_alerts) in deltas.items():
+            LogRollup.objects.filter(source_id=source_id, severity=severity, hour=hour).update(
+                log_count=F('log_count') + logs,
+                open_alert_count=F('open_alert_count') + open_alerts
+            )
+
+
+def entry_deltas(entries, sign):
+    """Count ``entries`` per rollup key in one grouped query, multiplied by ``sign``."""
+    deltas = new_deltas()
+    rows = (
+        entries.order_by()
+        .values('source_id', 'severity', hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .annotate(count=Count('id'))
+    )
+    for row in rows:
+        deltas[(row['source_id'], row['severity'], row['hour'])][0] += sign * row['count']
+    return deltas
+
+
+def alert_deltas(alerts, sign):
+    """Count ``alerts`` per rollup key in one grouped query, multiplied by ``sign``."""
+    deltas = new_deltas()
+    rows = (
+        alerts.order_by()
+        .values('log_entry__source_id', 'log_entry__severity',
+                hour=TruncHour('log_entry__timestamp', tzinfo=dt_timezone.utc))
+        .annotate(count=Count('id'))
+    )
+    for row in rows:
+        key = (row['log_entry__source_id'], row['log_entry__severity'], row['hour'])
+        deltas[key][1] += sign * row['count']
+    return deltas
+
+
+def severity_totals():
+    """Return ``{severity: {'logs': n, 'open_alerts': n}}`` from the rollup in one query."""
+    totals = {
+        severity: {'logs': 0, 'open_alerts': 0}
+        for severity, label in LogEntry.SEVERITY_LEVELS
+    }
+    rows = LogRollup.objects.values('severity').annotate(
+        logs=Sum('log_count'), open_alerts=Sum('open_alert_count')
+    ).order_by()
+    for row in rows:
+        totals[row['severity']] = {'logs': row['logs'], 'open_alerts': row['open_alerts']}
+    return totals
+
+
+def rebuild_rollups():
+    """Recount the rollup from ``LogEntry`` and ``Alert``; a full scan of both tables."""
+    deltas = entry_deltas(LogEntry.objects.all(), 1)
+    for key, (logs, open_alerts) in alert_deltas(Alert.objects.filter(is_resolved=False), 1).items():
+        deltas[key][1] += open_alerts
+
+    with transaction.atomic():
+        LogRollup.objects.all().delete()
+        LogRollup.objects.bulk_create([
+            LogRollup(source_id=source_id, severity=severity, hour=hour,
+                      log_count=logs, open_alert_count=open_alerts)
+            for (source_id, severity, hour), (logs, open_alerts) in deltas.items()
+        ])
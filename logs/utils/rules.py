@@ -0,0 +1,60 @@
+# logs/utils/rules.py
+import logging
+import re
+
+from django.db.models import F
+
+from ..models import ThreatPattern, ThreatRuleVersion
+from .threats import ThreatMatcher
+
+logger = logging.getLogger(__name__)
+
+# The matcher compiled from the active ThreatPattern rows and the rule
+# version it was built from; one per process
+_cache = {'version': None, 'matcher': None}
+
+
+def rules_version():
+    """Return the current rule version; one primary-key lookup."""
+    version = ThreatRuleVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_rules_version():
+    """Invalidate every process's compiled rules after a ``ThreatPattern`` change."""
+    if not ThreatRuleVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        ThreatRuleVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    _cache['version'] = None
+
+
+def load_rules():
+    """Return the active rules as ``(name, pattern, severity, description)`` tuples.
+
+    Rows whose pattern does not compile are logged and skipped, so one bad
+    admin edit cannot stop detection for every other rule.
+    """
+    rules = []
+    for rule in ThreatPattern.objects.filter(is_active=True).order_by('id').values_list(
+            'name', 'pattern', 'severity', 'description'):
+        try:
+            re.compile(rule[1])
+        except re.error as e:
+            logger.warning("Skipping threat pattern %r: invalid regex (%s)", rule[0], e)
+            continue
+        rules.append(rule)
+    return rules
+
+
+def get_threat_matcher():
+    """Return the matcher for the active ``ThreatPattern`` rows.
+
+    The rules are compiled once and reused until the rule version changes,
+    so a call costs one indexed lookup. Signals bump the version on
+    ``save()`` and ``delete()``; ``QuerySet.update()`` bypasses them, so
+    call ``bump_rules_version()`` after bulk updates.
+    """
+    version = rules_version()
+    if _cache['matcher'] is None or _cache['version'] != version:
+        _cache['matcher'] = ThreatMatcher(load_rules())
+        _cache['version'] = version
+    return _cache['matcher']
@@ -0,0 +1,189 @@
+# logs/utils/search.py
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from ..models import LogEntry
+
+SEARCH_TABLE = 'logs_logentry_fts'
+SEARCH_ORDERS = ('rank', 'newest')
+SNIPPET_TOKENS = 24
+# Marks matched terms in snippets until they are escaped and highlighted
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+QUERY_TOKEN = re.compile(r'(-?)"([^"]*)"?|(\S+)')
+
+# External-content FTS5 index over raw_message, kept in sync by triggers,
+# so bulk_create, deletes and updates need no extra code
+SEARCH_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"raw_message, content='logs_logentry', content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON logs_logentry BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, raw_message) VALUES (new.id, new.raw_message); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON logs_logentry BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, raw_message) VALUES ('delete', old.id, old.raw_message); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF raw_message ON logs_logentry BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, raw_message) VALUES ('delete', old.id, old.raw_message); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, raw_message) VALUES (new.id, new.raw_message); END",
+]
+SEARCH_TRIGGERS = {f'{SEARCH_TABLE}_insert', f'{SEARCH_TABLE}_delete', f'{SEARCH_TABLE}_update'}
+
+
+def search_supported(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def install_search_index(using=None, repair=False):
+    """Create the index and its triggers where missing; rebuild the index if any were.
+
+    Django rebuilds a SQLite table, dropping its triggers, for some schema
+    changes, so this runs after every migrate as well, with ``repair`` set:
+    then an index that does not exist (yet) is left alone.
+    """
+    using = using or connection
+    if not search_supported(using):
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = 'logs_logentry')",
+            [SEARCH_TABLE]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if SEARCH_TRIGGERS | {SEARCH_TABLE} <= existing or (repair and SEARCH_TABLE not in existing):
+            return False
+        for statement in SEARCH_INDEX_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def drop_search_index(using=None):
+    using = using or connection
+    if not search_supported(using):
+        return
+    with using.cursor() as cursor:
+        for trigger in sorted(SEARCH_TRIGGERS):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def parse_query(query):
+    """Split a search into ``(terms, excluded)``.
+
+    ``"quoted text"`` is a phrase, ``term*`` a prefix and ``-term`` (or
+    ``-"phrase"``) excludes lines containing it; everything else must
+    appear somewhere in the line.
+    """
+    terms, excluded = [], []
+    for negate, phrase, word in QUERY_TOKEN.findall(query):
+        if word:
+            negate = word.startswith('-') and len(word) > 1
+            text = word[1:] if negate else word
+            prefix = text.endswith('*')
+            text = text.rstrip('*')
+        else:
+            text, prefix = phrase, False
+        # Punctuation alone has no tokens to look up
+        if not any(char.isalnum() for char in text):
+            continue
+        (excluded if negate else terms).append((text, prefix))
+    return terms, excluded
+
+
+def match_expression(terms, excluded):
+    """Build an FTS5 MATCH expression in which every user term is a quoted string."""
+    def quoted(text, prefix):
+        return '"' + text.replace('"', '""') + '"' + ('*' if prefix else '')
+
+    expression = ' '.join(quoted(text, prefix) for text, prefix in terms)
+    if excluded:
+        expression = f'({expression})' + ''.join(f' NOT {quoted(text, prefix)}' for text, prefix in excluded)
+    return expression
+
+
+def highlight(snippet):
+    """Escape a snippet and wrap its matched terms in ``<mark>``."""
+    return mark_safe(escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def filter_entries(queryset, query):
+    """Narrow a ``LogEntry`` queryset to the lines matching ``query`` (for the admin)."""
+    terms, excluded = parse_query(query)
+    if not terms:
+        return queryset
+    if search_supported():
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match_expression(terms, excluded)]
+        ))
+    for text, prefix in terms:
+        queryset = queryset.filter(raw_message__icontains=text)
+    for text, prefix in excluded:
+        queryset = queryset.exclude(raw_message__icontains=text)
+    return queryset
+
+
+def search_entries(query, source_id=None, severity=None, since=None, until=None, order='rank',
+                   page=1, per_page=50):
+    """Return ``(results, has_next)`` for one page of lines matching ``query``.
+
+    Each result is ``(entry, snippet)``, ``snippet`` being HTML with the
+    matched terms marked. ``rank`` orders by BM25 relevance, which scores
+    every matching line before sorting, while ``newest`` walks the index
+    in id order and stops after the page; use it for terms that match a
+    large part of the table. No total is counted, for the same reason.
+    """
+    terms, excluded = parse_query(query)
+    if not terms:
+        return [], False
+    offset = (page - 1) * per_page
+    if not search_supported():
+        return fallback_search(terms, excluded, source_id, severity, since, until, offset, per_page)
+
+    conditions, params = [f'{SEARCH_TABLE} MATCH %s'], [match_expression(terms, excluded)]
+    if source_id is not None:
+        conditions.append('e.source_id = %s')
+        params.append(source_id)
+    if severity:
+        conditions.append('e.severity = %s')
+        params.append(severity)
+    if since is not None:
+        conditions.append('e.timestamp >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(since))
+    if until is not None:
+        conditions.append('e.timestamp < %s')
+        params.append(connection.ops.adapt_datetimefield_value(until))
+    order_by = f'{SEARCH_TABLE}.rank, e.id DESC' if order == 'rank' else f'{SEARCH_TABLE}.rowid DESC'
+    sql = (
+        f"SELECT e.id, snippet({SEARCH_TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS}) "
+        f"FROM {SEARCH_TABLE} JOIN logs_logentry e ON e.id = {SEARCH_TABLE}.rowid "
+        f"WHERE {' AND '.join(conditions)} ORDER BY {order_by} LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [MATCH_START, MATCH_END, *params, per_page + 1, offset])
+        rows = cursor.fetchall()
+
+    entries = LogEntry.objects.select_related('source').in_bulk([entry_id for entry_id, snippet in rows])
+    results = [(entries[entry_id], highlight(snippet)) for entry_id, snippet in rows[:per_page]]
+    return results, len(rows) > per_page
+
+
+def fallback_search(terms, excluded, source_id, severity, since, until, offset, per_page):
+    # Databases without the index scan with LIKE, newest first
+    queryset = LogEntry.objects.select_related('source')
+    for text, prefix in terms:
+        queryset = queryset.filter(raw_message__icontains=text)
+    for text, prefix in excluded:
+        queryset = queryset.exclude(raw_message__icontains=text)
+    if source_id is not None:
+        queryset = queryset.filter(source_id=source_id)
+    if severity:
+        queryset = queryset.filter(severity=severity)
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lt=until)
+    page = list(queryset.order_by('-id')[offset:offset + per_page + 1])
+    return [(entry, escape(entry.raw_message)) for entry in page[:per_page]], len(page) > per_page
@@ -0,0 +1,181 @@
+# logs/utils/threats.py
+import re
+import time
+
+
+def strip_outer_group(pattern):
+    """Return ``pattern`` without a capturing group that wraps all of it.
+
+    ``(failed login|access denied)`` becomes ``failed login|access denied``,
+    which matches the same text; any other pattern is returned unchanged.
+    """
+    if not pattern.startswith('(') or pattern.startswith('(?'):
+        return pattern
+
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            # A ']' straight after '[' or '[^' is a literal, not the end
+            if pattern[i + 1:i + 2] == '^':
+                i += 1
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return pattern[1:-1] if i == len(pattern) - 1 else pattern
+        i += 1
+    return pattern
+
+
+# Escapes are consumed in pairs, so a literal backslash is never read as
+# the start of a group reference
+GROUP_SYNTAX = re.compile(r'\\.|\(\?P[<=]|\(\?\(')
+
+
+def refers_to_groups(pattern):
+    """Return whether ``pattern`` names its groups or refers back to one.
+
+    Joined into one alternation its groups are renumbered, so ``\\1``
+    would refer to another rule's group and names could clash.
+    """
+    for token in GROUP_SYNTAX.findall(pattern):
+        if not token.startswith('\\') or token[1] in '123456789g':
+            return True
+    return False
+
+
+class ThreatMatcher:
+    """Match all threat rules against a message in one regex pass.
+
+    The top-level alternatives of every rule are joined into one alternation.
+    Searching it visits, left to right, each position where any rule matches;
+    rules that have not matched yet are then tried with an anchored match at
+    that position only. Messages without threats, the common case, cost a
+    single scan.
+
+    The alternatives are deliberately not wrapped in named groups: when every
+    branch starts with a literal, ``re`` skips ahead to candidate first
+    characters in C, which a branch of groups prevents.
+
+    Rules with named groups or backreferences (``refers_to_groups``) cannot
+    be joined without changing their meaning; they are searched one by one.
+
+    Rules whose pattern matches the empty string (the ``.*`` placeholders in
+    ``THREAT_PATTERNS``) would fire on every line and are skipped; they are
+    raised by dedicated logic such as ``LogParser.detect_time_based_threats``,
+    which checks ``special_rules`` to see whether they are enabled.
+    """
+
+    def __init__(self, rules):
+        rules = list(rules)
+        # re.IGNORECASE is several times slower than a case-sensitive scan and
+        # disables the first-character skip, so when every pattern is already
+        # lower-case the message is lower-cased once instead
+        self.fold_case = all(pattern == pattern.lower() for name, pattern, severity, description in rules)
+        flags = 0 if self.fold_case else re.IGNORECASE
+
+        self.rules = []
+        self.special_rules = set()
+        # Indices of the rules in the combined regex and of those searched alone
+        self.joined = []
+        self.separate = []
+        alternatives = []
+        for name, pattern, severity, description in rules:
+            regex = re.compile(pattern, flags)
+            if regex.match(''):
+                self.special_rules.add(name)
+                continue
+            if refers_to_groups(pattern):
+                self.separate.append(len(self.rules))
+            else:
+                self.joined.append(len(self.rules))
+                alternatives.append(strip_outer_group(pattern))
+            self.rules.append({
+                'pattern': name,
+                'severity': severity,
+                'description': description,
+                'regex': regex,
+            })
+
+        try:
+            self.combined = re.compile('|'.join(alternatives), flags) if alternatives else None
+        except re.error:
+            # Patterns with inline flags cannot be joined; fall back to one
+            # search per rule
+            self.combined = None
+            self.joined, self.separate = [], list(range(len(self.rules)))
+
+    @classmethod
+    def from_patterns(cls, patterns):
+        """Build a matcher from a ``THREAT_PATTERNS``-style dict."""
+        return cls(
+            (name, data['pattern'], data['severity'], data['description'])
+            for name, data in patterns.items()
+        )
+
+    def match(self, message):
+        if self.fold_case:
+            message = message.lower()
+        rules = self.rules
+        matched = [index for index in self.separate if rules[index]['regex'].search(message)]
+        if self.combined is not None:
+            matched = sorted(matched + self.match_combined(message))
+
+        return [self.threat(index) for index in matched]
+
+    def match_timed(self, message, add):
+        """Like ``match``, but search each rule on its own and report its time.
+
+        ``add('rule_seconds', name, seconds)`` is called for every rule. This
+        is the slow per-rule loop, meant for sampled lines only.
+        """
+        if self.fold_case:
+            message = message.lower()
+        clock = time.perf_counter
+        matched = []
+        for index, rule in enumerate(self.rules):
+            started = clock()
+            found = rule['regex'].search(message)
+            add('rule_seconds', rule['pattern'], clock() - started)
+            if found:
+                matched.append(index)
+        return [self.threat(index) for index in matched]
+
+    def threat(self, index):
+        rule = self.rules[index]
+        return {
+            'pattern': rule['pattern'],
+            'severity': rule['severity'],
+            'description': rule['description']
+        }
+
+    def match_combined(self, message):
+        remaining = list(self.joined)
+        matched = []
+        search = self.combined.search
+        pos = 0
+        while remaining:
+            found = search(message, pos)
+            if found is None:
+                break
+            start = found.start()
+            for index in remaining:
+                if self.rules[index]['regex'].match(message, start):
+                    matched.append(index)
+            remaining = [index for index in remaining if index not in matched]
+            pos = start + 1
+        # Report threats in rule order, like a loop over the rules would
+        return sorted(matched)
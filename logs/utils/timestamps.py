@@ -0,0 +1,135 @@
+# logs/utils/timestamps.py
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+SYSLOG_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+# Added to the minute of the previous CLF timestamp rather than building a
+# datetime per line
+CLF_SECONDS = {f'{second:02d}': timedelta(seconds=second) for second in range(60)}
+
+
+class TimestampParser:
+    """Convert the timestamp strings of the supported log formats to aware datetimes.
+
+    Meant to live as long as one file or source: the time zone is resolved
+    once, and the last string parsed by each method is memoized because
+    consecutive lines usually share the same second. Syslog timestamps
+    carry no year; unless ``year`` is given it is worked out per line
+    (``syslog_year``), so parsers of long-running receivers cross New
+    Year. Invalid timestamps raise ``ValueError`` like ``strptime`` does.
+    """
+
+    def __init__(self, tzinfo=None, year=None):
+        self.tzinfo = tzinfo or timezone.get_current_timezone()
+        self.year = year
+        # (year, month) of today, looked up again once month_ends has passed
+        self.this_month = None
+        self.month_ends = 0
+        # pytz zones need localize(); zoneinfo zones can be attached directly
+        self.localize = getattr(self.tzinfo, 'localize', None)
+        self.last_standard = (None, None)
+        self.last_syslog = (None, None)
+        self.last_iso = (None, None)
+        self.last_clf = (None, None)
+        self.last_clf_minute = (None, None)
+        self.clf_dates = {}
+        self.clf_offsets = {}
+
+    def make_aware(self, value):
+        if self.localize is not None:
+            return self.localize(value)
+        return value.replace(tzinfo=self.tzinfo)
+
+    def standard(self, text):
+        """Parse ``YYYY-MM-DD HH:MM:SS``."""
+        if text == self.last_standard[0]:
+            return self.last_standard[1]
+        value = self.make_aware(datetime.fromisoformat(text))
+        self.last_standard = (text, value)
+        return value
+
+    def syslog(self, text):
+        """Parse ``Mon DD HH:MM:SS`` (or RFC 3164's space-padded ``Mon  D``) in the parser's year."""
+        if text == self.last_syslog[0]:
+            return self.last_syslog[1]
+        month_name, day, clock = text.split()
+        month = SYSLOG_MONTHS.get(month_name.lower())
+        if month is None or len(clock) != 8:
+            raise ValueError(f"Invalid syslog timestamp: {text}")
+        value = self.make_aware(datetime(
+            self.year or self.syslog_year(month), month, int(day),
+            int(clock[0:2]), int(clock[3:5]), int(clock[6:8])
+        ))
+        self.last_syslog = (text, value)
+        return value
+
+    def syslog_year(self, month):
+        """Return the year of a syslog line from ``month``.
+
+        That is the current year, or the one before for a month more than
+        one ahead of today's (December lines read in January).
+        """
+        if time.time() >= self.month_ends:
+            today = self.today()
+            self.this_month = (today.year, today.month)
+            following = datetime(today.year + today.month // 12, today.month % 12 + 1, 1)
+            self.month_ends = self.make_aware(following).timestamp()
+        year, current = self.this_month
+        return year - 1 if month > current + 1 else year
+
+    def today(self):
+        return timezone.localtime(timezone=self.tzinfo).date()
+
+    def iso(self, text):
+        """Parse an ISO 8601 timestamp; naive values get the parser's time zone."""
+        if text == self.last_iso[0]:
+            return self.last_iso[1]
+        value = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        if timezone.is_naive(value):
+            value = self.make_aware(value)
+        self.last_iso = (text, value)
+        return value
+
+    def clf(self, text):
+        """Parse the Common Log Format ``DD/Mon/YYYY:HH:MM:SS +HHMM``; the offset is kept."""
+        if text == self.last_clf[0]:
+            return self.last_clf[1]
+        # The offset is fixed, so a second of the same minute is a plain addition
+        minute = text[:18] + text[20:]
+        seconds = CLF_SECONDS.get(text[18:20])
+        if minute == self.last_clf_minute[0] and seconds is not None:
+            value = self.last_clf_minute[1] + seconds
+            self.last_clf = (text, value)
+            return value
+        # The date and the offset change rarely; only the clock is parsed per minute
+        date = self.clf_dates.get(text[:11])
+        if date is None:
+            date = self.clf_dates[text[:11]] = self.clf_date(text)
+        tzinfo = self.clf_offsets.get(text[21:])
+        if tzinfo is None:
+            tzinfo = self.clf_offsets[text[21:]] = self.clf_offset(text)
+        if len(text) != 26 or text[11] != ':' or text[20] != ' ':
+            raise ValueError(f"Invalid CLF timestamp: {text}")
+        value = datetime(date[0], date[1], date[2], int(text[12:14]), int(text[15:17]), int(text[18:20]),
+                         tzinfo=tzinfo)
+        self.last_clf = (text, value)
+        self.last_clf_minute = (minute, value.replace(second=0))
+        return value
+
+    def clf_date(self, text):
+        month = SYSLOG_MONTHS.get(text[3:6].lower())
+        if month is None or text[2] != '/' or text[6] != '/':
+            raise ValueError(f"Invalid CLF timestamp: {text}")
+        return int(text[7:11]), month, int(text[0:2])
+
+    def clf_offset(self, text):
+        offset = text[21:]
+        if len(offset) != 5 or offset[0] not in '+-' or not offset[1:].isdigit():
+            raise ValueError(f"Invalid CLF timestamp: {text}")
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        return dt_timezone(timedelta(minutes=-minutes if offset[0] == '-' else minutes))
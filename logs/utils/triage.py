@@ -0,0 +1,61 @@
+# logs/utils/triage.py
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from ..models import Alert
+from .rollups import alert_deltas, apply_deltas
+
+TRIAGE_ACTIONS = ('resolve', 'unresolve')
+
+
+def select_alerts(ids=None, pattern_id=None, source_id=None, severity=None, since=None, until=None):
+    """Return the alerts matching every given filter, ``ids`` included.
+
+    ``since`` and ``until`` select alerts with hits in that window, so a
+    maintenance window catches every alert raised during it.
+    """
+    alerts = Alert.objects.all()
+    if ids is not None:
+        alerts = alerts.filter(id__in=ids)
+    if pattern_id is not None:
+        alerts = alerts.filter(pattern_id=pattern_id)
+    if source_id is not None:
+        alerts = alerts.filter(source_id=source_id)
+    if severity:
+        alerts = alerts.filter(log_entry__severity=severity)
+    if since is not None:
+        alerts = alerts.filter(last_seen__gte=since)
+    if until is not None:
+        alerts = alerts.filter(first_seen__lt=until)
+    return alerts
+
+
+def set_resolved(alerts, resolved, user=None):
+    """Resolve (or reopen) ``alerts`` with one ``UPDATE``; return how many changed.
+
+    Resolving records ``user`` and the time; reopening clears both. Only
+    alerts not already in that state are touched, and the rollup's open
+    alert counts move by exactly those, in the same transaction.
+
+    An alert is left resolved when reopening it would give its source,
+    pattern and bucket a second open alert (new hits have opened one
+    since, or a later alert of the same bucket is reopened as well).
+    """
+    changing = alerts.filter(is_resolved=not resolved)
+    if not resolved:
+        same_bucket = dict(source=OuterRef('source'), pattern=OuterRef('pattern'), bucket=OuterRef('bucket'))
+        changing = changing.exclude(
+            Exists(Alert.objects.filter(is_resolved=False, **same_bucket))
+        ).exclude(
+            Exists(changing.filter(id__gt=OuterRef('id'), **same_bucket))
+        )
+
+    with transaction.atomic():
+        deltas = alert_deltas(changing, -1 if resolved else 1)
+        if resolved:
+            updated = changing.update(is_resolved=True, resolved_by=user, resolved_at=timezone.now())
+        else:
+            updated = changing.update(is_resolved=False, resolved_by=None, resolved_at=None)
+        apply_deltas(deltas)
+    return updated
@@ -1,30 +1,41 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.contrib import messages
+from django.db.models import Q
 from datetime import datetime
-from .models import LogSource, LogEntry, Alert, ThreatPattern
-from .utils.log_parser import LogParser
+from .models import LogSource, LogEntry, Alert, IngestJob
+from .utils.export import ALERT_COLUMNS, ENTRY_COLUMNS, EXPORT_FORMATS, alert_rows, entry_rows, export_chunks
+from .utils.metrics import metric_totals, metrics_enabled, prometheus_text
+from .utils.rollups import severity_totals
+from .utils.search import SEARCH_ORDERS, search_entries
+from .utils.triage import TRIAGE_ACTIONS, select_alerts, set_resolved
 import json
+import time
 
 
 
 def dashboard(request):
-    # Get statistics for dashboard
-    total_logs = LogEntry.objects.count()
-    high_severity = LogEntry.objects.filter(severity='high').count()
-    critical_alerts = Alert.objects.filter(log_entry__severity='critical', is_resolved=False).count()
+    # Get statistics for dashboard from the hourly rollup in one query
+    totals = severity_totals()
+    total_logs = sum(counts['logs'] for counts in totals.values())
+    high_severity = totals['high']['logs']
+    critical_alerts = totals['critical']['open_alerts']
 
     # Get recent alerts
-    recent_alerts = Alert.objects.filter(is_resolved=False).order_by('-created_at')[:10]
+    recent_alerts = (
+        Alert.objects.filter(is_resolved=False)
+        .select_related('log_entry', 'pattern')
+        .order_by('-created_at')[:10]
+    )
 
     # Get data for the chart
     severity_data = {
-        'low': LogEntry.objects.filter(severity='low').count(),
-        'medium': LogEntry.objects.filter(severity='medium').count(),
-        'high': LogEntry.objects.filter(severity='high').count(),
-        'critical': LogEntry.objects.filter(severity='critical').count(),
+        'low': totals['low']['logs'],
+        'medium': totals['medium']['logs'],
+        'high': totals['high']['logs'],
+        'critical': totals['critical']['logs'],
     }
 
     context = {
@@ -54,110 +65,319 @@ def upload_logs(request):
             sources = LogSource.objects.filter(is_active=True)
             return render(request, 'upload.html', {'sources': sources})
 
-        parser = LogParser()
-        line_count = 0
-        alert_count = 0
+        # Save the upload and leave parsing to the process_ingest_jobs worker
+        job = IngestJob(source=log_source, original_name=log_file.name)
+        job.log_file.save(log_file.name, log_file, save=True)
+        messages.success(request, f"Upload queued as job #{job.id}. Alerts will appear as the file is processed.")
 
-        try:
-            # Read the file content properly
-            file_content = log_file.read().decode('utf-8')
-            lines = file_content.splitlines()
-
-            # Process each line of the log file
-            for line in lines:
-                decoded_line = line.strip()
-                if decoded_line:
-                    parsed_data = parser.parse_line(decoded_line)
-                    
-                    # Skip if parsing failed
-                    if not parsed_data:
-                        continue
-                        
-                    line_count += 1
-
-                    # Convert datetime objects to strings for JSON serialization
-                    serializable_data = parsed_data.copy()
-                    if 'timestamp' in serializable_data:
-                        # Store timestamp as ISO string for JSON
-                        serializable_data['timestamp'] = parsed_data['timestamp'].isoformat()
-
-                    # Detect threats
-                    threats = parser.detect_threats(parsed_data)
-
-                    # Create log entry
-                    log_entry = LogEntry.objects.create(
-                        source=log_source,
-                        raw_message=decoded_line,
-                        timestamp=parsed_data['timestamp'],
-                        severity=parsed_data.get('severity', 'unknown'),
-                        parsed_data=serializable_data
-                    )
-
-                    # Create alerts for detected threats
-                    for threat in threats:
-                        # Get the actual pattern from THREAT_PATTERNS
-                        from .utils.patterns import THREAT_PATTERNS
-                        pattern_text = THREAT_PATTERNS.get(threat['pattern'], {}).get('pattern', '')
-                        
-                        pattern, created = ThreatPattern.objects.get_or_create(
-                            name=threat['pattern'],
-                            defaults={
-                                'description': threat['description'],
-                                'pattern': pattern_text,
-                                'severity': threat['severity']
-                            }
-                        )
-
-                        Alert.objects.create(
-                            log_entry=log_entry,
-                            pattern=pattern,
-                            description=threat['description']
-                        )
-                        alert_count += 1
-
-            if line_count == 0:
-                messages.warning(request, "No valid log entries found in the file.")
-            else:
-                messages.success(request, f"Processed {line_count} log entries. Found {alert_count} threats.")
-
-        except UnicodeDecodeError:
-            messages.error(request, "Error decoding the file. Please ensure it's a UTF-8 text file.")
-        except Exception as e:
-            messages.error(request, f"Error processing file: {str(e)}")
-        
         return redirect('/')
 
     # GET request - show upload form
     sources = LogSource.objects.filter(is_active=True)
-    return render(request, 'upload.html', {'sources': sources})
+    recent_uploads = IngestJob.objects.select_related('source')[:5]
+    return render(request, 'upload.html', {'sources': sources, 'recent_uploads': recent_uploads})
+
+
+ALERTS_PER_PAGE = 50
+
+
+def parse_alert_cursor(value):
+    """Turn a ``<created_at ISO>|<id>`` cursor into a tuple, or ``None`` if invalid."""
+    try:
+        created_at, alert_id = value.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(alert_id)
+    except ValueError:
+        return None
+
+
+def alert_cursor(alert):
+    return f"{alert.created_at.isoformat()}|{alert.id}"
 
 
 def view_alerts(request):
-    alerts = Alert.objects.filter(is_resolved=False).order_by('-created_at')
-    return render(request, 'alerts.html', {'alerts': alerts})
+    severity = request.GET.get('severity')
+    if severity not in dict(LogEntry.SEVERITY_LEVELS):
+        severity = None
+
+    # Only the rendered columns, with the entry, source and pattern joined in
+    alerts = (
+        Alert.objects.filter(is_resolved=False)
+        .select_related('log_entry__source', 'pattern')
+        .only('id', 'description', 'created_at', 'hit_count', 'first_seen', 'last_seen',
+              'log_entry__severity', 'log_entry__source__name', 'pattern__name')
+    )
+    if severity:
+        alerts = alerts.filter(log_entry__severity=severity)
+
+    # Keyset pagination on (created_at, id): every page is an index range
+    # scan, however deep it is
+    after = parse_alert_cursor(request.GET.get('after', ''))
+    before = parse_alert_cursor(request.GET.get('before', ''))
+    if before:
+        created_at, alert_id = before
+        page = list(
+            alerts.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=alert_id))
+            .order_by('created_at', 'id')[:ALERTS_PER_PAGE + 1]
+        )
+        has_previous = len(page) > ALERTS_PER_PAGE
+        page = page[:ALERTS_PER_PAGE][::-1]
+        has_next = True
+    else:
+        if after:
+            created_at, alert_id = after
+            alerts = alerts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=alert_id))
+        page = list(alerts.order_by('-created_at', '-id')[:ALERTS_PER_PAGE + 1])
+        has_next = len(page) > ALERTS_PER_PAGE
+        page = page[:ALERTS_PER_PAGE]
+        has_previous = after is not None
+
+    totals = severity_totals()
+    if severity:
+        open_alert_count = totals[severity]['open_alerts']
+    else:
+        open_alert_count = sum(counts['open_alerts'] for counts in totals.values())
+
+    context = {
+        'alerts': page,
+        'severity': severity,
+        'open_alert_count': open_alert_count,
+        'next_cursor': alert_cursor(page[-1]) if page and has_next else None,
+        'previous_cursor': alert_cursor(page[0]) if page and has_previous else None,
+    }
+    return render(request, 'alerts.html', context)
+
+
+def triage_filters(params):
+    """Return the ``select_alerts`` arguments given in a triage request.
+
+    Unlike the search filters, a key that is present with an invalid value
+    raises ``ValueError``: treating it as no filter would widen a bulk
+    update. ``pattern`` and ``source`` are ids; names are not unique.
+    """
+    def is_id(value):
+        return (isinstance(value, int) and not isinstance(value, bool)) or (
+            isinstance(value, str) and value.isascii() and value.isdigit())
+
+    filters = {}
+    if 'ids' in params:
+        if not isinstance(params['ids'], list) or not all(is_id(alert_id) for alert_id in params['ids']):
+            raise ValueError('ids must be a list of alert ids')
+        filters['ids'] = [int(alert_id) for alert_id in params['ids']]
+    for key in ('pattern', 'source'):
+        if key in params:
+            if not is_id(params[key]):
+                raise ValueError(f'{key} must be a {key} id')
+            filters[f'{key}_id'] = int(params[key])
+    if 'severity' in params:
+        if params['severity'] not in dict(LogEntry.SEVERITY_LEVELS):
+            raise ValueError('severity must be one of ' + ', '.join(dict(LogEntry.SEVERITY_LEVELS)))
+        filters['severity'] = params['severity']
+    for key in ('since', 'until'):
+        if key in params:
+            value = parse_search_time(params[key]) if isinstance(params[key], str) else None
+            if value is None:
+                raise ValueError(f'{key} must be an ISO date or datetime')
+            filters[key] = value
+    return filters
+
+
+def request_user(request):
+    return request.user if request.user.is_authenticated else None
 
 
 def resolve_alert(request, alert_id):
     if request.method == 'POST':
-        try:
-            alert = Alert.objects.get(id=alert_id)
-            alert.is_resolved = True
-            alert.resolved_by = request.user
-            alert.resolved_at = timezone.now()
-            alert.save()
-            return JsonResponse({'status': 'success'})
-        except Alert.DoesNotExist:
+        alerts = Alert.objects.filter(id=alert_id)
+        if not alerts.exists():
             return JsonResponse({'status': 'error', 'message': 'Alert not found'})
+        set_resolved(alerts, True, request_user(request))
+        return JsonResponse({'status': 'success'})
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
 
+def triage_alerts(request):
+    """Resolve or unresolve alerts in bulk, by id or by filter, with one ``UPDATE``.
+
+    Takes a JSON body such as ``{"action": "resolve", "ids": [1, 2]}`` or
+    ``{"action": "resolve", "pattern": 3, "since": "2024-05-01T22:00",
+    "until": "2024-05-02T02:00"}``; ``source`` and ``severity`` filter
+    too. ``matched`` is the number of alerts selected and ``updated`` the
+    number whose state changed.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+    try:
+        params = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    if not isinstance(params, dict) or params.get('action') not in TRIAGE_ACTIONS:
+        return JsonResponse({'status': 'error', 'message': 'action must be resolve or unresolve'}, status=400)
+
+    try:
+        filters = triage_filters(params)
+    except ValueError as error:
+        return JsonResponse({'status': 'error', 'message': str(error)}, status=400)
+    if not filters:
+        # Never every alert by accident
+        return JsonResponse({'status': 'error', 'message': 'Give ids or at least one filter'}, status=400)
+
+    alerts = select_alerts(**filters)
+    matched = alerts.count()
+    updated = set_resolved(alerts, params['action'] == 'resolve', request_user(request))
+    return JsonResponse({'status': 'success', 'action': params['action'], 'matched': matched, 'updated': updated})
+
+
+SEARCH_RESULTS_PER_PAGE = 50
+
+
+def parse_search_time(value):
+    """Parse an ISO date or datetime from the search form, or return ``None``."""
+    try:
+        value = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def log_filters(params):
+    """Return the ``(source_id, severity, since, until)`` filters of a search or export."""
+    severity = params.get('severity')
+    if severity not in dict(LogEntry.SEVERITY_LEVELS):
+        severity = None
+    source = str(params.get('source', ''))
+    source_id = int(source) if source.isdigit() else None
+    since = parse_search_time(str(params.get('since', '')))
+    until = parse_search_time(str(params.get('until', '')))
+    return source_id, severity, since, until
+
+
+def search_logs(request):
+    """Full-text search over log lines, as a page or, with ``format=json``, as JSON."""
+    query = request.GET.get('q', '').strip()
+    source_id, severity, since, until = log_filters(request.GET)
+    order = request.GET.get('order')
+    if order not in SEARCH_ORDERS:
+        order = 'rank'
+    page = request.GET.get('page', '')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+
+    started = time.perf_counter()
+    results, has_next = search_entries(query, source_id, severity, since, until, order, page,
+                                       SEARCH_RESULTS_PER_PAGE)
+    took_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'query': query,
+            'page': page,
+            'has_next': has_next,
+            'took_ms': took_ms,
+            'results': [
+                {
+                    'id': entry.id,
+                    'source': entry.source.name,
+                    'timestamp': entry.timestamp.isoformat(),
+                    'severity': entry.severity,
+                    'raw_message': entry.raw_message,
+                    'snippet': snippet,
+                }
+                for entry, snippet in results
+            ],
+        })
+
+    # The filters again, for the pagination links
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    context = {
+        'query': query,
+        'results': results,
+        'sources': LogSource.objects.order_by('name'),
+        'source_id': source_id,
+        'severity': severity,
+        'severity_levels': LogEntry.SEVERITY_LEVELS,
+        'since': request.GET.get('since', '') if since else '',
+        'until': request.GET.get('until', '') if until else '',
+        'order': order,
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if has_next else None,
+        'filters': filters.urlencode(),
+        'took_ms': took_ms,
+    }
+    return render(request, 'search.html', context)
+
+
+def export_response(request, name, columns, rows):
+    """Stream ``rows`` as a CSV (default) or ``format=ndjson`` download, gzipped with ``gzip=1``."""
+    export_format = request.GET.get('format')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    compress = request.GET.get('gzip') == '1'
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    elif export_format == 'ndjson':
+        content_type = 'application/x-ndjson; charset=utf-8'
+    else:
+        content_type = 'text/csv; charset=utf-8'
+
+    response = StreamingHttpResponse(export_chunks(columns, rows, export_format, compress),
+                                     content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_entries(request):
+    """Stream the log lines matching the search filters."""
+    return export_response(request, 'log-entries', ENTRY_COLUMNS, entry_rows(*log_filters(request.GET)))
+
+
+def export_alerts(request):
+    """Stream the alerts matching the search filters and ``state`` (``open`` or ``resolved``)."""
+    rows = alert_rows(*log_filters(request.GET), state=request.GET.get('state'))
+    return export_response(request, 'alerts', ALERT_COLUMNS, rows)
+
+
 def log_stats(request):
     # Provide data for charts
+    totals = severity_totals()
     severity_data = {
-        'low': LogEntry.objects.filter(severity='low').count(),
-        'medium': LogEntry.objects.filter(severity='medium').count(),
-        'high': LogEntry.objects.filter(severity='high').count(),
-        'critical': LogEntry.objects.filter(severity='critical').count(),
+        'low': totals['low']['logs'],
+        'medium': totals['medium']['logs'],
+        'high': totals['high']['logs'],
+        'critical': totals['critical']['logs'],
     }
 
     return JsonResponse(severity_data)
+
+
+def log_metrics(request):
+    """Ingestion stage timings and per-rule counts, as Prometheus text or JSON."""
+    totals = metric_totals()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'enabled': metrics_enabled(), 'metrics': totals})
+    return HttpResponse(prometheus_text(totals), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def job_status(request, job_id):
+    try:
+        job = IngestJob.objects.select_related('source').get(id=job_id)
+    except IngestJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Job not found'}, status=404)
+
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'source': job.source.name,
+        'file': job.original_name,
+        'lines_done': job.lines_done,
+        'alerts_found': job.alerts_found,
+        'duplicates_skipped': job.duplicates_skipped,
+        'metrics': job.metrics,
+        'lines_per_second': round(job.lines_per_second, 1),
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    })